@@ -14,11 +14,13 @@ import time
 from datetime import datetime
 from experimentor.core.signal import Signal
 from experimentor.models.action import Action
-from experimentor.models.devices.cameras.basler.basler import BaslerCamera as Camera
 from experimentor.models.experiments import Experiment
 
+from common.models.background import make_background_model
+from common.models.cameras import make_camera
+from common.models.cameras.reconfiguration import CameraReconfiguration
+from common.models.recorder import MovieSaver, saver_options
 from dispertech.models.electronics.arduino import ArduinoModel
-from LightSheet.models.movie_saver import MovieSaver
 
 
 class LightSheetExperiment(Experiment):
@@ -29,6 +31,7 @@ class LightSheetExperiment(Experiment):
 
         self.background = None
         self.camera_microscope = None
+        self.microscope_reconfiguration = None
         self.electronics = None
 
         self.finalized = False
@@ -52,8 +55,9 @@ class LightSheetExperiment(Experiment):
     def initialize_camera(self):
         """Assume a specific setup working with baslers and initialize both cameras"""
         self.logger.info('Initializing camera')
-        config_mic = self.config['camera_microscope']
-        self.camera_microscope = Camera(config_mic['init'], initial_config=config_mic['config'])
+        self.camera_microscope = make_camera(self.config['camera_microscope'])
+        self.microscope_reconfiguration = CameraReconfiguration(self.camera_microscope,
+                                                                on_change=self.discard_background)
         self.camera_microscope.initialize()
 
     def initialize_electronics(self):
@@ -79,21 +83,19 @@ class LightSheetExperiment(Experiment):
         .. todo:: This must be changed since it was inherited from the time when both cameras were stored in a dict
         """
         tmp_image = self.camera_microscope.temp_image
-        if self.remove_background:
-            if self.background is None:
-                self.background = np.empty((tmp_image.shape[0], tmp_image.shape[1], 10), dtype=np.uint16)
-            self.background = np.roll(self.background, -1, 2)
-            self.background[:, :, -1] = tmp_image
-            bkg = np.mean(self.background, 2, dtype=np.uint16)
-            # tmp_image = (tmp_image.astype(np.int16) - bkg).clip(0, 2**16-1).astype(np.uint16)
-            ttmp_image = tmp_image - bkg
-            ttmp_image[bkg>tmp_image] = 0
-            tmp_image = ttmp_image
-        else:
+        if not self.remove_background:
             self.background = None
+        elif tmp_image is not None:
+            if self.background is None or self.background.shape != tmp_image.shape:
+                self.background = make_background_model(self.config['background'], tmp_image.shape, tmp_image.dtype)
+            tmp_image = self.background.subtract(tmp_image)
         # return (tmp_image/2**4).astype(np.uint8)
         return tmp_image
 
+    def get_frame_sequence(self) -> int:
+        """ Number of frames the camera has delivered, it changes when there is a new image. """
+        return self.camera_microscope.frame_sequence
+
     def stop_free_run(self):
         """ Stops the free run of the camera.
 
@@ -142,21 +144,11 @@ class LightSheetExperiment(Experiment):
 
     @Action
     def start_binning(self):
-        self.camera_microscope.stop_continuous_reads()
-        self.camera_microscope.stop_free_run()
-        self.background = None  # This is to prevent shape mismatch between before and after
-        self.camera_microscope.binning_y = 4
-        self.camera_microscope.start_free_run()
-        self.camera_microscope.continuous_reads()
+        return self.microscope_reconfiguration.request(binning_y=4)
 
     @Action
     def stop_binning(self):
-        self.camera_microscope.stop_continuous_reads()
-        self.camera_microscope.stop_free_run()
-        self.background = None  # This is to prevent shape mismatch between before and after
-        self.camera_microscope.binning_y = 1
-        self.camera_microscope.start_free_run()
-        self.camera_microscope.continuous_reads()
+        return self.microscope_reconfiguration.request(binning_y=1)
 
     @Action
     def save_particles_image(self):
@@ -178,26 +170,18 @@ class LightSheetExperiment(Experiment):
         height : int
             The total height in pixels
         """
-        self.camera_microscope.stop_free_run()
-        self.camera_microscope.stop_continuous_reads()
-        self.background = None  # This is to prevent shape mismatch between before and after
-        current_roi = self.camera_microscope.ROI
-        new_roi = (current_roi[0], (y_min, height))
-        self.camera_microscope.ROI = new_roi
-        self.camera_microscope.start_free_run()
-        self.camera_microscope.continuous_reads()
+        return self.microscope_reconfiguration.request_roi(y=(y_min, height))
 
     def clear_roi(self):
-        self.camera_microscope.stop_continuous_reads()
-        self.camera_microscope.stop_free_run()
-        self.background = None  # This is to prevent shape mismatch between before and after
         full_roi = (
             (0, self.camera_microscope.ccd_width),
             (0, self.camera_microscope.ccd_height)
         )
-        self.camera_microscope.ROI = full_roi
-        self.camera_microscope.start_free_run()
-        self.camera_microscope.continuous_reads()
+        return self.microscope_reconfiguration.request(ROI=full_roi)
+
+    def discard_background(self):
+        """ The background model of the microscope camera does not apply after changing its ROI or binning. """
+        self.background = None
 
     def start_saving_images(self):
         if self.saving:
@@ -210,6 +194,8 @@ class LightSheetExperiment(Experiment):
         base_filename = self.config['info']['filename_movie']
         file = self.get_filename(base_filename)
         self.saving_event.clear()
+        # Frames are read from the shared memory of the camera if it has it, starting from the next one
+        ring = self.camera_microscope.frame_ring
         self.saving_process = MovieSaver(
             file,
             self.config['saving']['max_memory'],
@@ -218,19 +204,50 @@ class LightSheetExperiment(Experiment):
             self.camera_microscope.new_image.url,
             topic='new_image',
             metadata=self.camera_microscope.config.all(),
+            frame_ring=ring.name if ring is not None else None,
+            first_frame=ring.published if ring is not None else None,
+            **saver_options(self.config['saving']),
         )
 
-    def stop_saving_images(self):
+    def stop_saving_images(self, timeout=10):
+        """ Stops the saver and waits until it closes the file, so that a new movie can be saved right after.
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait for the saver to write the frames still queued and close the file
+
+        Returns
+        -------
+        dict or None :
+            The summary of the movie (see :meth:`MovieSaver.wait`), None if the saver did not finish in time
+        """
+        t0 = time.perf_counter()
         self.camera_microscope.new_image.emit('stop')
         # self.emit('new_image', 'stop')
 
-        # self.saving_event.set()
-        time.sleep(.05)
-
-        if self.saving_process is not None and self.saving_process.is_alive():
-            self.logger.warning('Saving process still alive')
-            time.sleep(.1)
+        if self.camera_microscope.frame_ring is not None:
+            # Reading from shared memory there is no stop keyword, the saver stops after the frames published until now
+            self.saving_event.set()
+
+        summary = None
+        if self.saving_process is not None:
+            summary = self.saving_process.wait(timeout)
+            if summary is None:
+                # The stop keyword can be lost if the socket drops messages, the saving event stops it anyway
+                self.logger.warning(f'Saving process still alive after {timeout}s, setting the saving event')
+                self.saving_event.set()
+                summary = self.saving_process.wait(1)
         self.saving = False
+        if summary is None:
+            self.logger.error('The saving process did not finish')
+        elif summary['error'] is not None:
+            self.logger.error(f'The saving process failed: {summary["error"]}')
+        else:
+            summary['stop_time'] = time.perf_counter() - t0
+            self.logger.info(f'Saved {summary["frames"]} frames to {summary["file"]} in {summary["duration"]:.1f}s, '
+                             f'{summary["dropped_frames"]} dropped, stopping took {summary["stop_time"]:.2f}s')
+        return summary
 
     def finalize(self):
         if self.finalized:
@@ -2,12 +2,12 @@ import numpy as np
 import os
 import pyqtgraph as pg
 import time
+from common.view.camera_viewer import CameraViewer
+from common.view.refresh import ViewerRefresh
 from experimentor import Q_
 from experimentor.lib.log import get_logger
 from experimentor.views.base_view import BaseView
-from experimentor.views.camera.camera_viewer_widget import CameraViewerWidget
 from PyQt5 import QtGui, uic
-from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QFileDialog, QMainWindow
 
 from LightSheet.view import BASE_DIR_VIEW
@@ -24,7 +24,7 @@ class LightsheetWindow(BaseView, QMainWindow):
         filename = os.path.join(BASE_DIR_VIEW, 'GUI', 'Lightsheet_Window.ui')
         uic.loadUi(filename, self)
 
-        self.camera_viewer = CameraViewerWidget(parent=self)
+        self.camera_viewer = CameraViewer(parent=self)
         self.camera_widget.layout().addWidget(self.camera_viewer)
 
         self.cartridge_line.editingFinished.connect(self.update_experiment)
@@ -50,13 +50,12 @@ class LightsheetWindow(BaseView, QMainWindow):
 
         self.background_box.stateChanged.connect(self.background_toggle)
 
-        self.update_image_timer = QTimer()
-        self.update_image_timer.timeout.connect(self.update_image)
+        self.image_refresh = ViewerRefresh(self.experiment.get_frame_sequence, self.update_image)
 
         self.update_ui()
         self.update_experiment()
 
-        self.update_image_timer.start(30)
+        self.image_refresh.start()
         # For debugging purposes
         self.status_bar = self.statusBar()
         self.setStatusBar(self.status_bar)
@@ -127,7 +126,11 @@ class LightsheetWindow(BaseView, QMainWindow):
         t1 = time.perf_counter() - t0
         self.updating_times = np.roll(self.updating_times, 1)
         self.updating_times[0] = t1
-        self.status_bar.showMessage(f'{np.mean(self.updating_times)*1000}ms')
+        message = f'{np.mean(self.updating_times)*1000}ms, {self.image_refresh}'
+        dead_time = self.experiment.microscope_reconfiguration.last_dead_time
+        if dead_time is not None:
+            message += f', last reconfiguration {dead_time * 1000:.0f}ms'
+        self.status_bar.showMessage(message)
         self.last_update = time.time()
 
         # if self.background_box.isChecked() and self.experiment.background is not None:
@@ -146,16 +149,12 @@ class LightsheetWindow(BaseView, QMainWindow):
         self.experiment.remove_background = self.background_box.isChecked()
 
     def update_roi(self):
-        self.update_image_timer.stop()
         roi = self.camera_viewer.get_roi_values()
         y = roi[1]
         self.experiment.set_roi(y[0], y[1])
-        self.update_image_timer.start(30)
 
     def clear_roi(self):
-        self.update_image_timer.stop()
         self.experiment.clear_roi()
-        self.update_image_timer.start(30)
 
     def start_saving(self):
         self.experiment.start_saving_images()
@@ -165,7 +164,7 @@ class LightsheetWindow(BaseView, QMainWindow):
 
     def closeEvent(self, a0: QtGui.QCloseEvent) -> None:
         logger.info('Microscope Window Closed')
-        self.update_image_timer.stop()
+        self.image_refresh.stop()
         super().closeEvent(a0)
 
 if __name__ == '__main__':
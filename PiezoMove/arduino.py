@@ -3,28 +3,70 @@
     =============
     This is an ad-hoc model for controlling an Arduino Due board, which will in turn control a piezo-mirror, a laser,
     and some LED's.
+
+    Use ``port='simulated'`` to work with a :class:`~PiezoMove.simulated_arduino.SimulatedArduino` instead of a board,
+    the options of the simulated device can be given as ``simulation``.
+
+    Moves can be queued with :meth:`ArduinoModel.queue_move`, which returns at once with a future. A worker thread
+    sends them to the board one after the other, merging moves of the same axis and direction that are waiting in the
+    queue, so that holding a key does not pile up round trips to the board.
+
+    Sequences of moves, for example of a scan, can be sent at once with :meth:`ArduinoModel.move_piezo_batch`, which
+    takes one write and one answer per :data:`MAX_BATCH` moves instead of two round trips per move. The frame is the
+    line ``batch{n}`` followed by three bytes per move, the axis, the byte of :func:`move_byte` and the number of
+    steps, and a checksum byte, the sum of the bytes of the moves modulo 256. The board answers ``OK {n}`` once all
+    the moves are done, or a line starting with ``ERR`` if the frame is wrong.
 """
+from collections import deque
+from concurrent.futures import Future
 from multiprocessing import Event
 
-import pyvisa
-from pyvisa import VisaIOError
-from threading import RLock
+from threading import Condition, RLock
 from time import sleep
 
-from dispertech.controller.devices.arduino.arduino import Arduino
+from PiezoMove.simulated_arduino import SimulatedArduino
 from experimentor.lib.log import get_logger
 from experimentor.models import Feature
 from experimentor.models.decorators import make_async_thread
 from experimentor.models.devices.base_device import ModelDevice
+from experimentor.models.devices.exceptions import DeviceException
+
+SIMULATED_PORT = 'simulated'
+MAX_SPEED = 2**6 - 1
+MAX_BATCH = 64  # Moves per frame, the buffer of the firmware
+STEP_TIMEOUT = 100  # Milliseconds added to the timeout for each step of a batch, the firmware takes 50
+
+_resource_manager = None
 
 
-rm = pyvisa.ResourceManager('@py')
+def resource_manager():
+    """ The pyvisa resource manager, created the first time a board is opened and not when importing the module. """
+    global _resource_manager
+    if _resource_manager is None:
+        import pyvisa
+        _resource_manager = pyvisa.ResourceManager('@py')
+    return _resource_manager
+
+
+def move_byte(speed: int, direction: int) -> int:
+    """ Byte understood by the firmware as a move: the direction, a 1 and the speed in the last six bits. """
+    return direction << 7 | 1 << 6 | speed
+
+
+def encode_batch(moves) -> bytes:
+    """ Frame of the batch command for a sequence of (axis, direction, speed, steps) moves, see the module docs. """
+    payload = bytearray()
+    for axis, direction, speed, steps in moves:
+        if axis not in (1, 2, 3) or direction not in (0, 1) or not 0 <= speed <= MAX_SPEED or not 1 <= steps <= 255:
+            raise ValueError(f'Wrong move: axis {axis}, direction {direction}, speed {speed}, steps {steps}')
+        payload += bytes((axis, move_byte(speed, direction), steps))
+    return f'batch{len(moves)}\n'.encode() + payload + bytes((sum(payload) % 256,))
 
 
 class ArduinoModel(ModelDevice):
-    def __init__(self, port=None, device=0):
+    def __init__(self, port=None, device=0, simulation=None):
         """ Use the port if you know where the Arduino is connected, or use the device number in the order shown by
-        pyvisa.
+        pyvisa. ``simulation`` are the keyword arguments of the simulated device, used only if the port is 'simulated'.
         """
         super().__init__()
         self._threads = []
@@ -35,6 +77,10 @@ class ArduinoModel(ModelDevice):
         self.driver = None
         self.port = port
         self.device = device
+        self.simulation = simulation or {}
+        self._moves = deque()  # Moves waiting to be sent, as [speed, direction, axis, futures]
+        self._moves_condition = Condition()
+        self._processing_moves = False
 
         self.logger = get_logger()
 
@@ -53,21 +99,32 @@ class ArduinoModel(ModelDevice):
         servo shutter is closed, and LEDs are switched off.
         """
         with self.query_lock:
-            if not self.port:
-                self.port = Arduino.list_devices()[self.device]
-            self.driver = rm.open_resource(self.port)
-
-            sleep(1)
-            self.driver.baud_rate = 115200
-            self.driver.timeout = 2500
-            # This is very silly, but clears the buffer so that next messages are not broken
-            try:
+            if self.port == SIMULATED_PORT:
+                self.driver = SimulatedArduino(**self.simulation)
                 self.driver.query("IDN")
+            else:
+                self._open_board()
+        self._processing_moves = True
+        self._process_moves()
+
+    def _open_board(self):
+        from pyvisa import VisaIOError
+        if not self.port:
+            from dispertech.controller.devices.arduino.arduino import Arduino
+            self.port = Arduino.list_devices()[self.device]
+        self.driver = resource_manager().open_resource(self.port)
+
+        sleep(1)
+        self.driver.baud_rate = 115200
+        self.driver.timeout = 2500
+        # This is very silly, but clears the buffer so that next messages are not broken
+        try:
+            self.driver.query("IDN")
+        except VisaIOError:
+            try:
+                self.driver.read()
             except VisaIOError:
-                try:
-                    self.driver.read()
-                except VisaIOError:
-                    pass
+                pass
 
     # @make_async_thread
     def move_piezo(self, speed: int, direction: int, axis: int):
@@ -79,24 +136,99 @@ class ArduinoModel(ModelDevice):
         """
 
         with self.query_lock:
-            print('Speed: ', speed)
-            print('Direction: ', direction)
-            print('Axis: ', axis)
-            binary_speed = '{0:06b}'.format(speed)
-            binary_speed = str(direction) + str(1) + binary_speed
-            print('Binary speed: ', binary_speed)
-            number = int(binary_speed, 2)
+            number = move_byte(speed, direction)
             bytestring = number.to_bytes(1, 'big')
-            print('{0:b}'.format(number))
-            print(self.driver.query(f"mot{axis}"))
+            self.logger.debug(f'Moving axis {axis}, speed {speed}, direction {direction}: {number:08b}')
+            self.driver.query(f"mot{axis}")
             self.driver.write_raw(bytestring)
             ans = self.driver.read()
-            print("{0:b}".format(int(ans)))
-        print('Finished moving')
-        self.logger.info('Finished moving')
+        self.logger.info(f'Finished moving: {ans}')
+        return ans
+
+    def move_piezo_batch(self, moves) -> int:
+        """ Does a sequence of moves, in frames of up to :data:`MAX_BATCH` moves.
 
+        :param moves: (axis, direction, speed, steps) of each move, with the same meaning as in :meth:`move_piezo`.
+            Steps are how many times the move is repeated, from 1 to 255
+        :returns: the number of moves done
+        """
+        moves = list(moves)
+        frames = [encode_batch(moves[i:i + MAX_BATCH]) for i in range(0, len(moves), MAX_BATCH)]
+        with self.query_lock:
+            timeout = self.driver.timeout
+            try:
+                for i, frame in enumerate(frames):
+                    steps = sum(move[3] for move in moves[i * MAX_BATCH:(i + 1) * MAX_BATCH])
+                    self.driver.timeout = timeout + steps * STEP_TIMEOUT
+                    self.driver.write_raw(frame)
+                    ans = self.driver.read()
+                    if not ans.startswith('OK'):
+                        raise DeviceException(f'Batch of moves not done by the board: {ans}')
+            finally:
+                self.driver.timeout = timeout
+        self.logger.info(f'Finished {len(moves)} moves')
+        return len(moves)
+
+    def queue_move(self, speed: int, direction: int, axis: int) -> Future:
+        """ Queues a move of the mirror, with the same parameters as :meth:`move_piezo`, and returns at once.
+
+        If the last move waiting in the queue is on the same axis and direction, both are sent as a single move with
+        the sum of the speeds, as long as it is not above the maximum; otherwise the move is queued apart, so that no
+        movement is lost. This assumes that the displacement of the piezo is proportional to the speed. Single steps
+        (speed 1) are never merged, they move the mirror by a fixed amount and not continuously.
+
+        :returns: a future with the answer of the board once the move is done
+        """
+        future = Future()
+        with self._moves_condition:
+            last = self._moves[-1] if self._moves else None
+            if last and last[1:3] == [direction, axis] and last[0] > 1 and speed > 1 and last[0] + speed <= MAX_SPEED:
+                last[0] += speed
+                last[3].append(future)
+            else:
+                self._moves.append([speed, direction, axis, [future]])
+            self._moves_condition.notify()
+        return future
+
+    @make_async_thread
+    def _process_moves(self):
+        """ Sends the queued moves to the board until :meth:`stop_moves` is called. """
+        while self._processing_moves:
+            with self._moves_condition:
+                while self._processing_moves and not self._moves:
+                    self._moves_condition.wait()
+                if not self._processing_moves:
+                    break
+                speed, direction, axis, futures = self._moves.popleft()
+            futures = [future for future in futures if future.set_running_or_notify_cancel()]
+            try:
+                ans = self.move_piezo(speed, direction, axis)
+            except Exception as e:
+                self.logger.error(f'Error moving axis {axis}: {e}')
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future in futures:
+                    future.set_result(ans)
+
+        with self._moves_condition:
+            for move in self._moves:
+                for future in move[3]:
+                    future.cancel()
+            self._moves.clear()
+
+    def stop_moves(self):
+        """ Cancels the moves waiting in the queue and stops the thread that sends them, waiting for the move in
+        progress, if any. """
+        with self._moves_condition:
+            self._processing_moves = False
+            self._moves_condition.notify_all()
+        for name, thread in self._threads:
+            if name == '_process_moves':
+                thread.join()
 
     def finalize(self):
+        self.stop_moves()
         super().finalize()
         self.clean_up_threads()
         if len(self._threads):
@@ -104,6 +236,7 @@ class ArduinoModel(ModelDevice):
 
 
 if __name__ == "__main__":
+    from dispertech.controller.devices.arduino.arduino import Arduino
     dev = Arduino.list_devices()[0]
     ard = ArduinoModel(dev)
     ard.laser_power = 50
@@ -3,7 +3,7 @@ from PyQt5 import uic, QtCore
 
 from PyQt5.QtWidgets import QMainWindow
 
-from dispertech.models.electronics.arduino import ArduinoModel
+from PiezoMove.arduino import ArduinoModel
 from PiezoMove import BASE_DIR_VIEW
 
 
@@ -42,24 +42,24 @@ class PiezoMoveWindow(QMainWindow):
 
     def move_up(self):
         speed = int(self.line_speed.text())
-        self.arduino.move_piezo(speed, 0, 1)
+        self.arduino.queue_move(speed, 0, 1)
 
     def move_down(self):
         speed = int(self.line_speed.text())
-        self.arduino.move_piezo(speed, 1, 1)
+        self.arduino.queue_move(speed, 1, 1)
 
     def move_left(self):
         speed = int(self.line_speed.text())
-        self.arduino.move_piezo(speed, 0, 2)
+        self.arduino.queue_move(speed, 0, 2)
 
     def move_right(self):
         speed = int(self.line_speed.text())
-        self.arduino.move_piezo(speed, 1, 2)
+        self.arduino.queue_move(speed, 1, 2)
 
     def move_plus(self):
         speed = int(self.line_speed.text())
-        self.arduino.move_piezo(speed, 0, 3)
+        self.arduino.queue_move(speed, 0, 3)
 
     def move_minus(self):
         speed = int(self.line_speed.text())
-        self.arduino.move_piezo(speed, 1, 3)
+        self.arduino.queue_move(speed, 1, 3)
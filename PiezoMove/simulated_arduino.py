@@ -0,0 +1,146 @@
+"""
+    Simulated Arduino
+    =================
+    A loopback device that can replace the pyvisa resource of the board in :class:`~PiezoMove.arduino.ArduinoModel`,
+    to measure the latency and throughput of the electronics commands without hardware. It speaks the protocol of the
+    firmware in ``test_nano_serial``:
+
+    * ``IDN`` answers the identification of the device
+    * ``mot{axis}`` answers ``Waiting input``, then takes one raw byte with the speed and direction of the movement
+      and answers ``OK`` once the piezo has moved
+    * ``batch{n}`` followed by a binary frame of ``n`` moves, as built by :func:`~PiezoMove.arduino.encode_batch`,
+      answers ``OK {n}`` once all the moves are done, or ``ERR`` and the reason if the frame is wrong
+
+    Every command takes ``latency`` seconds to get an answer, the time for the message to go through the serial port
+    and the loop of the firmware, plus the time to transfer its bytes at the baud rate. Moves take ``move_time`` more
+    seconds, as the firmware waits before stopping the piezo, except single steps in direction 1, which the firmware
+    does at once. Other commands are answered as given in ``answers``, the first text whose key starts the command, or
+    not answered at all, as the firmware does. Batches take ``latency`` once, and the time of each step of each move.
+
+    ``on_move`` is called with the axis, speed and direction of every step, for example to move the laser of a
+    :class:`~common.models.cameras.simulated.SimulatedCamera` and close the loop without hardware.
+
+    Answers are queued with the time they become available: ``write`` returns at once and ``read`` waits, as with a
+    real serial port.
+"""
+import time
+from collections import deque
+from threading import Condition
+
+
+class SimulatedArduino:
+    IDN = 'Dispertech device 2.0-fluo'
+
+    def __init__(self, latency=0.002, move_time=0.05, answers=None, on_move=None):
+        """
+        :param float latency: seconds from sending a command to its answer
+        :param float move_time: extra seconds that the firmware takes to finish a move
+        :param dict answers: answers to commands not in the protocol, by the start of the command
+        :param callable on_move: called with (axis, speed, direction) on every step
+        """
+        self.latency = latency
+        self.move_time = move_time
+        self.answers = answers or {}
+        self.on_move = on_move
+        self.baud_rate = 115200
+        self.timeout = 2000  # In milliseconds, as in pyvisa
+        self.read_termination = '\r\n'
+
+        self.commands = []  # Every command received, as (time, command)
+        self.moves = []  # Every move done, as (axis, speed, direction)
+        self._pending = deque()  # Answers, as (time available, text)
+        self._axis = None
+        self._busy_until = 0
+        self._condition = Condition()
+        self._received = 0  # Bytes of the command being answered
+
+    def _answer(self, text, delay):
+        # Commands are processed one after the other by the firmware, 10 bits per byte with start and stop bits
+        delay += (self._received + len(text) + 2) * 10 / self.baud_rate
+        ready = max(time.perf_counter(), self._busy_until) + delay
+        self._busy_until = ready
+        self._pending.append((ready, text))
+        self._condition.notify_all()
+
+    def write(self, message: str):
+        message = message.strip()
+        with self._condition:
+            self.commands.append((time.perf_counter(), message))
+            self._received = len(message) + 1
+            if message.startswith('mot'):
+                self._axis = int(message[3:])
+                self._answer('Waiting input', self.latency)
+            elif message.startswith('IDN'):
+                self._answer(self.IDN, self.latency)
+            else:
+                for command, answer in self.answers.items():
+                    if message.startswith(command):
+                        self._answer(answer, self.latency)
+                        break
+
+    def _move(self, axis, value) -> float:
+        """ Records the move given by the byte value, returns the time it takes. """
+        speed = value & 0b111111
+        direction = value >> 7
+        self.moves.append((axis, speed, direction))
+        if self.on_move is not None:
+            self.on_move(axis, speed, direction)
+        return 0 if speed == 1 and direction == 1 else self.move_time
+
+    def _batch(self, message: bytes):
+        header, frame = message.split(b'\n', 1)
+        num_moves = int(header[5:])
+        if num_moves < 1 or len(frame) != 3 * num_moves + 1:
+            self._answer('ERR length', self.latency)
+            return
+        if sum(frame[:-1]) % 256 != frame[-1]:
+            self._answer('ERR checksum', self.latency)
+            return
+        duration = 0
+        for i in range(num_moves):
+            axis, value, steps = frame[3 * i:3 * i + 3]
+            for _ in range(steps):
+                duration += self._move(axis, value)
+        self._answer(f'OK {num_moves}', self.latency + duration)
+
+    def write_raw(self, message: bytes):
+        with self._condition:
+            self.commands.append((time.perf_counter(), message))
+            self._received = len(message)
+            if message.startswith(b'batch'):
+                self._batch(message)
+                return
+            if self._axis is None:
+                return  # The firmware only takes raw bytes after a move command
+            duration = self._move(self._axis, message[0])
+            self._axis = None
+            self._answer('OK', self.latency + duration)
+
+    def read(self) -> str:
+        deadline = time.perf_counter() + self.timeout / 1000
+        with self._condition:
+            while not self._pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise TimeoutError('Timeout reading from the simulated Arduino')
+                self._condition.wait(remaining)
+            ready, text = self._pending[0]
+            if ready > deadline:
+                self._condition.wait(deadline - time.perf_counter())
+                raise TimeoutError('Timeout reading from the simulated Arduino')
+            self._pending.popleft()
+        delay = ready - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return text
+
+    def query(self, message: str) -> str:
+        self.write(message)
+        return self.read()
+
+    def clear(self):
+        with self._condition:
+            self._pending.clear()
+
+    def close(self):
+        self.clear()
@@ -35,6 +35,11 @@ byte rx_byte = 0;        // stores received byte
 String serialString;
 int piezo_delay = 100; // delay before stopping the movement of the piezo in milliseconds
 
+// A batch is the line batch{n} followed by 3 bytes per move (axis, move byte, steps) and a checksum byte, the sum of
+// the bytes of the moves
+const int MAX_BATCH = 64;
+byte batch[3 * MAX_BATCH + 1];
+
 
 void setup()
 {
@@ -58,12 +63,77 @@ void setup()
 }
 
 
+int axis_pin(int axis) {
+  if (axis == 1) {
+    return 4;
+  }
+  else if (axis == 2) {
+    return 6;
+  }
+  return 5;
+}
+
+
+// Sends a move byte to the piezo controller, the pin of the axis must be HIGH
+void move(byte rx_byte) {
+  mySerial.write(rx_byte);
+
+  bool is_step = true;
+  for (int bits = 5; bits > 0; bits--) {
+    if (rx_byte & (1 << bits)) {
+      is_step = false;
+    }
+  }
+  if (!(rx_byte & (1 << 0))) {
+    is_step = false;
+  }
+
+  if (!(rx_byte & (1 << 7)) && is_step) { // In one of the directions it must make 2 steps in order to move one at a time
+    delay(piezo_delay / 2);
+    mySerial.write(rx_byte);
+  }
+
+  if (!is_step) {
+    delay(piezo_delay / 2);
+    mySerial.write((byte) 0);
+  }
+}
+
+
+void run_batch(int moves) {
+  int length = 3 * moves + 1;
+  if (moves < 1 || moves > MAX_BATCH || Serial.readBytes(batch, length) != length) {
+    Serial.println("ERR length");
+    return;
+  }
+  byte checksum = 0;
+  for (int i = 0; i < length - 1; i++) {
+    checksum += batch[i];
+  }
+  if (checksum != batch[length - 1]) {
+    Serial.println("ERR checksum");
+    return;
+  }
+  for (int i = 0; i < moves; i++) {
+    int pin = axis_pin(batch[3 * i]);
+    digitalWrite(pin, HIGH);
+    for (int step = 0; step < batch[3 * i + 2]; step++) {
+      move(batch[3 * i + 1]);
+    }
+    digitalWrite(pin, LOW);
+  }
+  Serial.print("OK ");
+  Serial.println(moves);
+}
+
+
 void loop() {
   while (Serial.available() > 0 ) {
     char value = Serial.read();
     Comm += value;
     if (value == '\n') {
       isData = true;
+      break;  // What follows may be the binary frame of a batch
     }
   }
   if (isData) {
@@ -85,33 +155,15 @@ void loop() {
         delay(1);
       }
       rx_byte = Serial.read();
-      mySerial.write(rx_byte);
-
-      bool is_step = true;
-      for (int bits = 5; bits > 0; bits--) {
-        if (rx_byte & (1 << bits)) {
-          is_step = false;
-        }
-      }
-      if (!(rx_byte & (1 << 0))) {
-        is_step = false;
-      }
-
-      if (!(rx_byte & (1 << 7)) && is_step) { // In one of the directions it must make 2 steps in order to move one at a time
-        delay(piezo_delay / 2);
-        mySerial.write(rx_byte);
-      }
-
-      if (!is_step) {
-        delay(piezo_delay / 2);
-        rx_byte = 0;
-        mySerial.write(rx_byte);
-      }
+      move(rx_byte);
       Serial.println("OK");
       digitalWrite(4, LOW);
       digitalWrite(5, LOW);
       digitalWrite(6, LOW);
     }
+    else if (Comm.startsWith("batch")) {
+      run_batch(Comm.substring(5).toInt());
+    }
     else if (Comm.startsWith("IDN")) {
       Serial.println("Dispertech device 2.0-fluo");
     }
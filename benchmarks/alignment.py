@@ -0,0 +1,117 @@
+"""
+Alignment Benchmark
+===================
+Convergence of the :class:`~calibration.models.alignment.LaserAligner` without hardware: a
+:class:`~common.models.cameras.simulated.SimulatedCamera` shows the fiber end and the laser, which is moved by the
+steps received by a :class:`~PiezoMove.simulated_arduino.SimulatedArduino`. Every step moves the laser by a fixed
+Jacobian, rotated with respect to the axes of the camera, with a random error on each step as the piezo has.
+
+The core is found with :func:`~calibration.models.fiber_core.find_fiber_core` on a frame without the laser, as the
+experiment does. The mirror is calibrated once, and then the laser is aligned on the core starting from random
+offsets. It reports how many alignments converged, the final distance to the core, and the time and number of moves
+they took. Alignments stop without converging if the tolerance is smaller than what one step can correct.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.alignment --runs 10 --offset 100 --step-error 0.1
+
+"""
+import argparse
+import time
+
+import numpy as np
+
+from PiezoMove.arduino import ArduinoModel
+from calibration.models.alignment import LaserAligner, laser_centroid
+from calibration.models.fiber_core import find_fiber_core
+from calibration.models.weighting_mask import create_weighting_mask
+from common.models.cameras.simulated import SimulatedCamera
+
+HORIZONTAL_AXIS = 1
+VERTICAL_AXIS = 2
+JACOBIAN = np.array([[2., .4], [-.3, 1.5]])  # Pixels per step, horizontal axis in the first column
+
+
+def wait_for_frames(camera, frames=2):
+    image = camera.temp_image
+    while frames:
+        if camera.temp_image is not image:
+            image = camera.temp_image
+            frames -= 1
+        time.sleep(.001)
+    return image
+
+
+def find_core(camera):
+    """ Position of the core on a frame with the laser out of the sensor, in the coordinates of the laser. """
+    laser_position = camera.laser_position
+    camera.laser_position = (-1000, -1000)
+    image = wait_for_frames(camera)
+    camera.laser_position = laser_position
+    core = find_fiber_core(image, create_weighting_mask(image.shape))
+    # [column, row] of the image, while the laser is given as (row, column), see CalibrationSetup.align_laser
+    return np.array(core[::-1], dtype=float)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convergence of the laser alignment on simulated hardware')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--offset', type=float, default=100, help='Largest initial distance to the core, in pixels')
+    parser.add_argument('--step-error', type=float, default=.1, help='Relative error of every step of the mirror')
+    parser.add_argument('--fps', type=float, default=100, help='Frame rate of the camera')
+    parser.add_argument('--move-time', type=float, default=50, help='ms per move of the simulated board')
+    parser.add_argument('--tolerance', type=float, default=1, help='Pixels')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    camera = SimulatedCamera('daA1280', initial_config={
+        'exposure': '1ms', 'scene': 'fiber', 'max_fps': args.fps, 'pixel_format': 'Mono12'})
+    camera.initialize().result()
+    camera.start_free_run()
+    camera.continuous_reads()
+    core = find_core(camera)
+    print(f'Core found at {core.tolist()}, center of the fiber {[camera.ccd_width / 2, camera.ccd_height / 2]}')
+
+    def on_move(axis, speed, direction):
+        column = 0 if axis == HORIZONTAL_AXIS else 1
+        sign = 1 if direction else -1
+        error = 1 + rng.normal(0, args.step_error)
+        camera.laser_position = np.array(camera.laser_position) + sign * error * JACOBIAN[:, column]
+
+    arduino = ArduinoModel(port='simulated', simulation={'move_time': args.move_time / 1000, 'on_move': on_move})
+    arduino.initialize()
+    while any(name == 'initialize' and thread.is_alive() for name, thread in arduino._threads):
+        time.sleep(.01)
+
+    def move(steps):
+        moves = [(axis, int(n > 0), 1, abs(int(n))) for axis, n in zip((HORIZONTAL_AXIS, VERTICAL_AXIS), steps) if n]
+        arduino.move_piezo_batch(moves)
+
+    aligner = LaserAligner(lambda: laser_centroid(wait_for_frames(camera)), move, tolerance=args.tolerance)
+    camera.laser_position = core + 20
+    t0 = time.perf_counter()
+    jacobian = aligner.calibrate()
+    print(f'Calibrated in {time.perf_counter() - t0:.2f}s, pixels per step {np.round(jacobian, 2).tolist()}, '
+          f'real {JACOBIAN.tolist()}')
+
+    results = []
+    for _ in range(args.runs):
+        camera.laser_position = core + rng.uniform(-args.offset, args.offset, 2)
+        results.append(aligner.align(core))
+    converged = [result for result in results if result['converged']]
+    errors = [result['error'] for result in results]
+    print(f'{len(converged)} of {args.runs} converged within {args.tolerance:g} pixels, final error: median '
+          f'{np.median(errors):.2f}, max {np.max(errors):.2f} pixels')
+    if converged:
+        times = [result['time'] for result in converged]
+        iterations = [result['iterations'] for result in converged]
+        print(f'time: median {np.median(times):.2f}s, max {np.max(times):.2f}s; '
+              f'moves: median {np.median(iterations):.0f}, max {np.max(iterations)}')
+
+    arduino.finalize()
+    camera.stop_continuous_reads()
+    camera.finalize()
+
+
+if __name__ == '__main__':
+    main()
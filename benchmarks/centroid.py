@@ -0,0 +1,111 @@
+"""
+Centroid Benchmark
+==================
+Time per call and error of the centroid methods of :mod:`~calibration.models.centroid`, on synthetic images of a
+gaussian laser spot at random positions between pixels, with a background and noise. They are compared with the
+previous implementation of ``calculate_gaussian_centroid``: zeroing the crop below its mean and fitting with
+experimentor's ``fitgaussian``.
+
+It also follows a spot drifting over a sequence of frames with a
+:class:`~calibration.models.centroid.SpotTracker`, compared with searching the brightest pixel on the whole frame
+before every centroid.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.centroid --images 50 --sigma 4 --noise 20
+
+"""
+import argparse
+import time
+
+import numpy as np
+
+from calibration.models.centroid import SpotTracker, find_centroid, gaussian_centroid, moment_centroid
+from experimentor.lib.fitgaussian import fitgaussian
+
+CROP_SIZE = 25
+
+
+def previous_centroid(image, x, y, crop_size):
+    x = round(x)
+    y = round(y)
+    cropped_data = np.copy(image[x - crop_size:x + crop_size, y - crop_size:y + crop_size])
+    cropped_data[cropped_data < np.mean(cropped_data)] = 0
+    p = fitgaussian(cropped_data)
+    return p[1] + x - crop_size, p[2] + y - crop_size
+
+
+def spots(shape, num_images, sigma, noise, seed=0):
+    """ Yields the images and the real positions of the spots. """
+    rng = np.random.default_rng(seed)
+    x, y = np.indices(shape)
+    for _ in range(num_images):
+        center = rng.uniform(CROP_SIZE, np.array(shape) - CROP_SIZE)
+        spot = 2000 * np.exp(-((x - center[0])**2 + (y - center[1])**2) / (2 * sigma**2))
+        image = np.clip(spot + 200 + rng.normal(0, noise, shape), 0, 4095).astype(np.uint16)
+        yield image, center
+
+
+def track(images):
+    """ Returns the median time per frame of the full-frame search and of the tracker, in seconds. """
+    tracker = SpotTracker(crop_size=CROP_SIZE)
+    full_times, tracker_times = [], []
+    for image in images:
+        t0 = time.perf_counter()
+        brightest = np.unravel_index(np.argmax(image), image.shape)
+        find_centroid(image, brightest[0], brightest[1], CROP_SIZE)
+        full_times.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        tracker.find(image)
+        tracker_times.append(time.perf_counter() - t0)
+    return np.median(full_times), np.median(tracker_times)
+
+
+def drifting_spot(shape, num_images, sigma, noise, step=2, seed=0):
+    """ Yields images of a spot that moves a few pixels between frames. """
+    rng = np.random.default_rng(seed)
+    center = np.array(shape) / 2
+    x, y = np.indices(shape)
+    for _ in range(num_images):
+        center = np.clip(center + rng.normal(0, step, 2), CROP_SIZE, np.array(shape) - CROP_SIZE)
+        spot = 2000 * np.exp(-((x - center[0])**2 + (y - center[1])**2) / (2 * sigma**2))
+        yield np.clip(spot + 200 + rng.normal(0, noise, shape), 0, 4095).astype(np.uint16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and error of the centroid methods')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=960)
+    parser.add_argument('--images', type=int, default=50)
+    parser.add_argument('--sigma', type=float, default=4, help='Width of the spot, in pixels')
+    parser.add_argument('--noise', type=float, default=20, help='Standard deviation of the noise')
+    args = parser.parse_args()
+
+    methods = {
+        'previous fit': previous_centroid,
+        'moments': lambda *a: moment_centroid(*a)[0],
+        'gaussian': gaussian_centroid,
+        'find_centroid': lambda *a: find_centroid(*a)[0],
+    }
+    times = {name: [] for name in methods}
+    errors = {name: [] for name in methods}
+    for image, center in spots((args.width, args.height), args.images, args.sigma, args.noise):
+        brightest = np.unravel_index(np.argmax(image), image.shape)
+        for name, method in methods.items():
+            t0 = time.perf_counter()
+            position = method(image, brightest[0], brightest[1], CROP_SIZE)
+            times[name].append(time.perf_counter() - t0)
+            errors[name].append(np.linalg.norm(np.array(position) - center))
+
+    for name in methods:
+        print(f'{name:>14}: {np.median(times[name]) * 1e6:8.0f}us per call, error median '
+              f'{np.median(errors[name]):.3f}, max {np.max(errors[name]):.3f} pixels')
+
+    images = list(drifting_spot((args.width, args.height), args.images, args.sigma, args.noise))
+    full_frame, tracker = track(images)
+    print(f'Tracking a drifting spot: {full_frame * 1e6:.0f}us per frame searching the whole frame, '
+          f'{tracker * 1e6:.0f}us with the tracker')
+
+
+if __name__ == '__main__':
+    main()
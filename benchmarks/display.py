@@ -0,0 +1,114 @@
+"""
+Display Benchmark
+=================
+Time to prepare a camera frame for the viewers, compared with giving the full frame to pyqtgraph. The full frame is
+rendered by an ``ImageItem`` with the levels of the camera; the prepared frame is downsampled by the
+:class:`~common.view.display.DisplayPipeline` to the pixels of a viewer of the given size, converted to 8 bits, and
+rendered with levels (0, 255). Both are then drawn scaled to the size of the viewer, as pyqtgraph paints them. The
+histogram of the image, which pyqtgraph computes for every new frame, is timed apart.
+
+It also checks that a click on a :class:`~common.view.camera_viewer.CameraViewer` of the same size, showing the
+downsampled frame, is reported in pixels of the camera.
+
+It runs without a screen with ``QT_QPA_PLATFORM=offscreen``. Run it from the root of the repository::
+
+    python -m benchmarks.display --width 1920 --height 1200 --viewer 800 500
+
+"""
+import argparse
+import time
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5.QtCore import QPointF, QRectF, Qt
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtTest import QTest
+from PyQt5.QtWidgets import QApplication
+
+from common.view.camera_viewer import CameraViewer
+from common.view.display import DisplayPipeline
+
+
+def median_time(function, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - t0)
+    return np.median(times)
+
+
+def check_click(frame, viewer_size):
+    """ Clicks with Ctrl on the pixel of the camera at 3/4 of the frame and returns the factor of the viewer, the
+    pixel clicked and the position reported. """
+    viewer = CameraViewer()
+    viewer.resize(*viewer_size)
+    viewer.show()
+    for _ in range(2):  # The first frame sets the range of the view, the second is downsampled for it
+        viewer.update_image(frame, auto_range=True)
+        QApplication.processEvents()
+    clicks = []
+    viewer.clicked_on_image.connect(lambda x, y: clicks.append((x, y)))
+    pixel = QPointF(frame.shape[0] * 3 // 4, frame.shape[1] * 3 // 4)
+    graphics_view = viewer.view.scene().views()[0]
+    position = graphics_view.mapFromScene(viewer.view.mapViewToScene(pixel))
+    QTest.mouseClick(graphics_view.viewport(), Qt.LeftButton, Qt.ControlModifier, position)
+    QApplication.processEvents()
+    viewer.close()
+    return viewer.display_factor(), (pixel.x(), pixel.y()), clicks[0] if clicks else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time to prepare and render frames for the camera viewers')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--viewer', type=int, nargs=2, default=(800, 500), help='Width and height of the viewer')
+    parser.add_argument('--binning', action='store_true', help='Average blocks of pixels instead of decimating')
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    pg.mkQApp()
+    rng = np.random.default_rng(0)
+    # Fortran order, as the frames of the Basler cameras
+    frame = np.clip(rng.normal(400, 100, (args.height, args.width)), 0, 4095).astype(np.uint16).T
+    factor = max(1, int(min(args.width / args.viewer[0], args.height / args.viewer[1])))
+    pipeline = DisplayPipeline(binning=args.binning)
+    pipeline.auto_levels(frame)
+    item = pg.ImageItem()
+    screen = QImage(*args.viewer, QImage.Format_RGB32)
+
+    def draw():
+        item.render()
+        painter = QPainter(screen)
+        painter.drawImage(QRectF(0, 0, *args.viewer), item.qimage)
+        painter.end()
+
+    def full():
+        item.setImage(frame, levels=pipeline.levels)
+        draw()
+
+    def prepared():
+        item.setImage(pipeline.prepare(frame, factor), levels=(0, 255))
+        draw()
+
+    full_time = median_time(full, args.repeats)
+    full_histogram = median_time(item.getHistogram, args.repeats)
+    prepare_time = median_time(lambda: pipeline.prepare(frame, factor), args.repeats)
+    prepared_time = median_time(prepared, args.repeats)
+    prepared_histogram = median_time(item.getHistogram, args.repeats)
+    print(f'{args.width}x{args.height} frame on a {args.viewer[0]}x{args.viewer[1]} viewer, factor {factor}')
+    print(f'Full frame: {full_time * 1000:.1f}ms to render and draw, histogram {full_histogram * 1000:.1f}ms')
+    print(f'Prepared:   {prepared_time * 1000:.1f}ms to render and draw, '
+          f'of which {prepare_time * 1000:.1f}ms preparing, histogram {prepared_histogram * 1000:.1f}ms')
+
+    click_factor, pixel, clicked = check_click(frame, args.viewer)
+    if clicked is None:
+        print('Click not reported')
+    else:
+        error = np.hypot(clicked[0] - pixel[0], clicked[1] - pixel[1])
+        print(f'Click on pixel {pixel} reported at ({clicked[0]:.1f}, {clicked[1]:.1f}) with factor {click_factor}: '
+              f'{"OK" if error < 1 else "WRONG"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Electronics Benchmark
+=====================
+End-to-end latency and throughput of the commands of the :class:`~PiezoMove.arduino.ArduinoModel`, from calling the
+method until the board answers. Without ``--port`` it runs on a
+:class:`~PiezoMove.simulated_arduino.SimulatedArduino` with the given latency per command and time per move, which
+separates the overhead of the model from the time spent by the board.
+
+It also holds a key of the PiezoMove window for ``--hold`` seconds, with the moves queued at the rate of the key
+repeats, and reports how many moves reached the board and how long the mirror kept moving after releasing the key.
+
+Last, it compares the throughput of a scan of ``--scan`` single steps on both axes sent one by one with
+:meth:`~PiezoMove.arduino.ArduinoModel.move_piezo` and sent with
+:meth:`~PiezoMove.arduino.ArduinoModel.move_piezo_batch`. Steps in direction 1 do not wait for the piezo, which leaves
+only the cost of the protocol.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.electronics --moves 100 --latency 2 --move-time 50 --hold 2 --repeat-rate 30 --scan 500
+    python -m benchmarks.electronics --moves 20 --port ASRL5::INSTR
+
+"""
+import argparse
+import time
+
+import numpy as np
+
+from PiezoMove.arduino import SIMULATED_PORT, ArduinoModel
+
+
+def timings(function, repetitions) -> np.ndarray:
+    """ Seconds taken by each call to function. """
+    times = np.empty(repetitions)
+    for i in range(repetitions):
+        t0 = time.perf_counter()
+        function(i)
+        times[i] = time.perf_counter() - t0
+    return times
+
+
+def report(name, times):
+    print(f'{name:<16} {len(times) / times.sum():7.1f}/s, median {np.median(times) * 1000:6.1f}ms, '
+          f'95% {np.percentile(times, 95) * 1000:6.1f}ms')
+
+
+def hold_key(arduino, seconds, rate, speed=10):
+    """ Queues moves on one axis at the given rate, as a key held in the PiezoMove window. Returns the number of
+    moves queued and the seconds from the last key repeat until the last move is done. """
+    futures = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        futures.append(arduino.queue_move(speed, 0, 1))
+        time.sleep(1 / rate)
+    released = time.perf_counter()
+    futures[-1].result()
+    return len(futures), time.perf_counter() - released
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency and throughput of the commands to the electronics')
+    parser.add_argument('--port', default=SIMULATED_PORT, help='Port of the board, the simulated device by default')
+    parser.add_argument('--moves', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=2, help='ms per command of the simulated device')
+    parser.add_argument('--move-time', type=float, default=50, help='ms per move of the simulated device')
+    parser.add_argument('--hold', type=float, default=2, help='Seconds that the key is held')
+    parser.add_argument('--repeat-rate', type=float, default=30, help='Key repeats per second')
+    parser.add_argument('--scan', type=int, default=500, help='Moves of the scan')
+    args = parser.parse_args()
+
+    simulation = {'latency': args.latency / 1000, 'move_time': args.move_time / 1000}
+    arduino = ArduinoModel(port=args.port, simulation=simulation)
+    arduino.initialize()
+    while any(name == 'initialize' and thread.is_alive() for name, thread in arduino._threads):
+        time.sleep(.01)
+
+    simulated = args.port == SIMULATED_PORT
+    idn = timings(lambda i: arduino.driver.query('IDN'), args.moves)
+    report('IDN', idn)
+
+    # Alternating directions, so the mirror ends where it started
+    moves = timings(lambda i: arduino.move_piezo(10, i % 2, 1), args.moves)
+    report('move_piezo', moves)
+
+    moves_sent = len(arduino.driver.moves) if simulated else None
+    queued, lag = hold_key(arduino, args.hold, args.repeat_rate)
+    sent = f', {len(arduino.driver.moves) - moves_sent} sent to the board' if simulated else ''
+    print(f'Held key {args.hold:g}s: {queued} moves queued{sent}, mirror stopped {lag * 1000:.0f}ms after release')
+
+    scan = [(1 + i % 2, 1, 1, 1) for i in range(args.scan)]
+    t0 = time.perf_counter()
+    for axis, direction, speed, steps in scan:
+        arduino.move_piezo(speed, direction, axis)
+    one_by_one = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    arduino.move_piezo_batch(scan)
+    batched = time.perf_counter() - t0
+    print(f'Scan of {args.scan} steps: {args.scan / one_by_one:7.1f} moves/s one by one, '
+          f'{args.scan / batched:7.1f} moves/s batched')
+    arduino.finalize()
+
+
+if __name__ == '__main__':
+    main()
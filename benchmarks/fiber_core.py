@@ -0,0 +1,144 @@
+"""
+Fiber Core Benchmark
+====================
+Compares the whole-array fiber core detection with the original per-pixel loop on images saved with
+``save_fiber_core`` (``fiber_end_*.npy``). Both must give the same position, only the time should change.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.fiber_core C:\\Users\\Aquiles\\Data\\2021-03-16
+
+"""
+import argparse
+import copy
+import glob
+import os
+import time
+
+import numpy as np
+
+from calibration.models.fiber_core import bright_threshold, find_fiber_core
+
+
+def legacy_multiply_array(shape, power=2.5):
+    """ Multiply array as created by ``CalibrationSetup.initilize_multiply_array``. """
+    height, width = shape
+    multiply_array_one = (np.linspace(2, 0, width * height).reshape(height, width))
+    multiply_array_one = multiply_array_one * np.flip(multiply_array_one, 1) * \
+        np.rot90(np.rot90(multiply_array_one)) * np.flip(np.rot90(np.rot90(multiply_array_one)), 1)
+
+    multiply_array_two = (np.linspace(2, 0, width * height).reshape(width, height))
+    multiply_array_two = multiply_array_two * np.flip(multiply_array_two, 1) * \
+        np.rot90(np.rot90(multiply_array_two)) * np.flip(np.rot90(np.rot90(multiply_array_two)), 1)
+
+    multiply_array = multiply_array_one * np.rot90(multiply_array_two)
+    return multiply_array ** power
+
+
+def legacy_fiber_core(npy_array, multiply_array, n_value=0.001):
+    """ The per-pixel loop of ``Code1dot7for_implementation``, kept as the reference. Only the threshold is calculated
+    with :func:`bright_threshold`, since newer versions of numpy do not accept ``interpolation='nearest'``.
+    """
+    array = (npy_array * multiply_array).astype(int)
+    threshold = bright_threshold(array, n_value)
+    np_array_binary = np.where(array > threshold, 1, 0)
+    np_array_binary[0, :] = 0
+    np_array_binary[-1, :] = 0
+    np_array_binary[:, 0] = 0
+    np_array_binary[:, -1] = 0
+
+    bright_pixel_locations = np.where(np_array_binary == 1)
+    bright_coords = []
+    for i in range(0, len(bright_pixel_locations[0])):
+        bright_coords.append([bright_pixel_locations[0][i], bright_pixel_locations[1][i]])
+
+    previous_length_bright_coords = -1
+    bright_negihbors_required = 4
+    while len(bright_coords) >= 1:
+        binary_copy = copy.copy(np_array_binary)
+        bright_coords_copy = copy.copy(bright_coords)
+        for i in bright_coords:
+            bright_neighbors = 0
+            if np_array_binary[i[0] - 1][i[1]] == 1:
+                bright_neighbors = bright_neighbors + 1
+            if np_array_binary[i[0] + 1][i[1]] == 1:
+                bright_neighbors = bright_neighbors + 1
+            if np_array_binary[i[0]][i[1] - 1] == 1:
+                bright_neighbors = bright_neighbors + 1
+            if np_array_binary[i[0]][i[1] + 1] == 1:
+                bright_neighbors = bright_neighbors + 1
+            if bright_neighbors < bright_negihbors_required:
+                binary_copy[i[0]][i[1]] = 0
+                bright_coords_copy.remove(i)
+
+        if len(bright_coords_copy) == 0:
+            bright_negihbors_required = bright_negihbors_required - 1
+        else:
+            np_array_binary = binary_copy
+            bright_coords = bright_coords_copy
+
+        if bright_negihbors_required == 0:
+            break
+
+        if previous_length_bright_coords == len(bright_coords_copy):
+            break
+
+        previous_length_bright_coords = len(bright_coords)
+
+    x = 0
+    y = 0
+    for i in bright_coords:
+        x = x + i[1]
+        y = y + i[0]
+    x = round(x / len(bright_coords))
+    y = round(y / len(bright_coords))
+    return [x, y]
+
+
+def best_time(func, *args, repeat=3):
+    """ Returns the result of the function and the fastest of ``repeat`` runs, in seconds. """
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - t0)
+    return result, min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the fiber core detection with the original loop')
+    parser.add_argument('folder', help='Folder with the fiber_end_*.npy files')
+    parser.add_argument('--pattern', default='fiber_end_*.npy')
+    parser.add_argument('--n-value', type=float, default=0.001)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.folder, args.pattern)))
+    if not files:
+        parser.error(f'No files matching {args.pattern} in {args.folder}')
+
+    masks = {}
+    mismatches = 0
+    total_legacy = 0
+    total_new = 0
+    for file in files:
+        image = np.load(file)
+        if image.shape not in masks:
+            masks[image.shape] = legacy_multiply_array(image.shape)
+        multiply_array = masks[image.shape]
+
+        legacy, t_legacy = best_time(legacy_fiber_core, image, multiply_array, args.n_value, repeat=args.repeat)
+        new, t_new = best_time(find_fiber_core, image, multiply_array, args.n_value, repeat=args.repeat)
+        total_legacy += t_legacy
+        total_new += t_new
+        same = legacy == new
+        mismatches += not same
+        print(f'{os.path.basename(file)}: loop {legacy} in {t_legacy*1000:.1f}ms, '
+              f'arrays {new} in {t_new*1000:.1f}ms, x{t_legacy/t_new:.0f}{"" if same else "  MISMATCH"}')
+
+    print(f'{len(files)} files, loop {total_legacy:.2f}s, arrays {total_new:.2f}s, {mismatches} mismatches')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Movie Codecs Benchmark
+======================
+Write throughput and compression ratio of every codec and shuffle available in
+:mod:`~common.models.recorder.codecs`, on synthetic Mono12 frames saved as the movie saver does. Blosc codecs are
+skipped if hdf5plugin is not installed.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.movie_codecs --frames 100 --frames-per-chunk 4
+
+"""
+import argparse
+import os
+import tempfile
+
+import h5py
+
+from benchmarks.movie_layout import synthetic_frames, write_movie
+from common.models.recorder.codecs import CODECS, SHUFFLES, compression_options
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write throughput and compression ratio of each codec')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--block', type=int, default=50, help='Frames written at once, as the staging of the saver')
+    parser.add_argument('--frames-per-chunk', type=int, default=1)
+    parser.add_argument('--level', type=int, default=None,
+                        help='Compression level, the default of each codec if unset')
+    parser.add_argument('--folder', default=None, help='Where to write the test files, a temporary folder by default')
+    args = parser.parse_args()
+
+    frames = list(synthetic_frames((args.width, args.height), args.frames))
+    raw_bytes = sum(frame.nbytes for frame in frames)
+    folder = args.folder or tempfile.mkdtemp()
+
+    for codec in CODECS:
+        for shuffle in SHUFFLES:
+            try:
+                compression = compression_options(codec, args.level, shuffle)
+            except ValueError as e:
+                print(f'{codec:>10} {shuffle:>4} shuffle: skipped, {e}')
+                continue
+            filename = os.path.join(folder, f'codec_{codec}_{shuffle}.h5')
+            elapsed = write_movie(filename, frames, 'frame_major', args.frames_per_chunk, args.block, compression)
+            with h5py.File(filename, 'r') as f:
+                stored_bytes = f['data']['timelapse'].id.get_storage_size()
+            print(f'{codec:>10} {shuffle:>4} shuffle: write {raw_bytes/elapsed/1024/1024:7.1f}MB/s, '
+                  f'compression ratio {raw_bytes/stored_bytes:5.2f}')
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Movie Ingest Benchmark
+======================
+Measures how much memory is copied to bring one frame from the ZMQ socket into the staging array of the
+:class:`~common.models.recorder.movie_saver.MovieSaver`, comparing the original path (receive with ``copy=True``,
+``.copy()`` after reshaping, and a copy into the staging array) with the zero-copy one (receive with ``copy=False``
+and a single copy into the staging array).
+
+Bytes allocated are measured with ``tracemalloc``; every allocation on these paths is a full copy of the frame. The
+write into the staging array does not allocate, but it is also a copy, therefore it is added to the copied bytes.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.movie_ingest --width 1920 --height 1200
+
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import zmq
+
+from common.models.recorder.movie_saver import frame_view
+
+
+def ingest_copy(socket, staging, i):
+    """ The path used before frames were received without copying. """
+    metadata = socket.recv_json(flags=0)
+    msg = socket.recv(flags=0, copy=True, track=False)
+    buf = memoryview(msg)
+    img = np.frombuffer(buf, dtype=metadata['dtype'])
+    img = img.reshape(metadata['shape'], order="F").copy()
+    staging[:, :, i] = img
+
+
+def ingest_zero_copy(socket, staging, i):
+    metadata = socket.recv_json(flags=0)
+    msg = socket.recv(flags=0, copy=False, track=False)
+    staging[:, :, i] = frame_view(msg, metadata)
+
+
+def measure(ingest, sender, receiver, frame, staging, num_frames):
+    """ Sends and ingests ``num_frames`` frames, returns bytes allocated per frame and seconds per frame spent
+    ingesting. """
+    meta = dict(numpy=True, dtype=str(frame.dtype), shape=frame.shape)
+    allocated = 0
+    elapsed = 0
+    for i in range(num_frames):
+        sender.send_json(meta, zmq.SNDMORE)
+        sender.send(frame, copy=True)
+        while not receiver.poll(0):
+            time.sleep(0.0001)
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        ingest(receiver, staging, i % staging.shape[2])
+        elapsed += time.perf_counter() - t0
+        allocated += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return allocated / num_frames, elapsed / num_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bytes copied per frame when ingesting frames in the movie saver')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--frames', type=int, default=100)
+    args = parser.parse_args()
+
+    ctx = zmq.Context()
+    receiver = ctx.socket(zmq.PAIR)
+    receiver.bind('inproc://ingest')
+    sender = ctx.socket(zmq.PAIR)
+    sender.connect('inproc://ingest')
+
+    # Basler frames arrive transposed, i.e. in Fortran order
+    frame = np.random.randint(0, 4096, (args.height, args.width), dtype=np.uint16).T
+    staging = np.zeros((args.width, args.height, 10), dtype=frame.dtype)
+    print(f'Frame of {frame.shape} {frame.dtype}: {frame.nbytes/1024/1024:.2f}MB')
+
+    for name, ingest in (('copy', ingest_copy), ('zero-copy', ingest_zero_copy)):
+        allocated, elapsed = measure(ingest, sender, receiver, frame, staging, args.frames)
+        copied = allocated + frame.nbytes
+        print(f'{name:>10}: {copied/frame.nbytes:.1f} copies, {copied/1024/1024:.2f}MB copied per frame '
+              f'({allocated/1024/1024:.2f}MB allocated), {elapsed*1000:.2f}ms per frame')
+
+    sender.close()
+    receiver.close()
+    ctx.term()
+
+
+if __name__ == '__main__':
+    main()
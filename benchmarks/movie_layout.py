@@ -0,0 +1,99 @@
+"""
+Movie Layout Benchmark
+======================
+Compares the ``legacy`` (x, y, frames) layout of the movies with the ``frame_major`` (frames, x, y) one: write
+throughput when frames are saved in blocks, as the movie saver does, and the latency of reading a single random frame
+with the :class:`~common.models.recorder.movie_reader.MovieReader`.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.movie_layout --frames 200 --frames-per-chunk 1 4
+
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from common.models.recorder.movie_reader import MovieReader
+from common.models.recorder.movie_saver import create_timelapse, frame_index, stack_shape
+
+
+def synthetic_frames(shape, num_frames, seed=0):
+    """ Mono12 frames with a noisy background and some bright particles, closer to real data than uniform noise. """
+    rng = np.random.default_rng(seed)
+    background = rng.normal(200, 20, shape)
+    x, y = np.indices(shape)
+    for _ in range(num_frames):
+        frame = background + rng.normal(0, 10, shape)
+        for px, py in rng.uniform(0, 1, (20, 2)) * shape:
+            frame += 2000 * np.exp(-((x - px)**2 + (y - py)**2) / 8)
+        yield frame.clip(0, 4095).astype(np.uint16)
+
+
+def write_movie(filename, frames, layout, frames_per_chunk, block, compression=None):
+    """ Writes the frames in blocks of ``block`` frames. Returns the time spent writing, in seconds. """
+    frame_shape = frames[0].shape
+    elapsed = 0
+    with h5py.File(filename, 'w') as f:
+        g = f.create_group('data')
+        dset = create_timelapse(g, frame_shape, frames[0].dtype, len(frames), layout, frames_per_chunk, compression)
+        g.create_dataset('metadata', data=json.dumps({'frames': len(frames), 'layout': layout}).encode())
+        staging = np.zeros(stack_shape(layout, frame_shape, block), dtype=frames[0].dtype)
+        for start in range(0, len(frames), block):
+            batch = frames[start:start + block]
+            for i, frame in enumerate(batch):
+                staging[frame_index(layout, i)] = frame
+            t0 = time.perf_counter()
+            dset[frame_index(layout, slice(start, start + len(batch)))] = \
+                staging[frame_index(layout, slice(None, len(batch)))]
+            elapsed += time.perf_counter() - t0
+    return elapsed
+
+
+def read_latency(filename, reads, seed=1):
+    """ Mean and max time to read a random frame, in seconds. """
+    rng = np.random.default_rng(seed)
+    times = []
+    with MovieReader(filename) as movie:
+        for index in rng.integers(0, len(movie), reads):
+            t0 = time.perf_counter()
+            movie[int(index)]
+            times.append(time.perf_counter() - t0)
+    return np.mean(times), np.max(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write throughput and random frame reads for each movie layout')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--block', type=int, default=50, help='Frames written at once, as the staging of the saver')
+    parser.add_argument('--frames-per-chunk', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--reads', type=int, default=20)
+    parser.add_argument('--folder', default=None, help='Where to write the test files, a temporary folder by default')
+    args = parser.parse_args()
+
+    frames = list(synthetic_frames((args.width, args.height), args.frames))
+    megabytes = sum(frame.nbytes for frame in frames) / 1024 / 1024
+    folder = args.folder or tempfile.mkdtemp()
+
+    configurations = [('legacy', None)] + [('frame_major', n) for n in args.frames_per_chunk]
+    for layout, frames_per_chunk in configurations:
+        filename = os.path.join(folder, f'layout_{layout}_{frames_per_chunk}.h5')
+        elapsed = write_movie(filename, frames, layout, frames_per_chunk, args.block)
+        mean_read, max_read = read_latency(filename, args.reads)
+        with h5py.File(filename, 'r') as f:
+            chunks = f['data']['timelapse'].chunks
+        print(f'{layout:>11} chunks {str(chunks):>18}: write {megabytes/elapsed:7.1f}MB/s, '
+              f'read frame {mean_read*1000:7.1f}ms (max {max_read*1000:.1f}ms), '
+              f'{os.path.getsize(filename)/1024/1024:.0f}MB on disk')
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    main()
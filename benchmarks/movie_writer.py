@@ -0,0 +1,76 @@
+"""
+Movie Writer Benchmark
+======================
+Throughput of the :class:`~common.models.recorder.movie_saver.MovieWriter` with gzip when chunks are compressed by a
+pool of threads and written directly, for different numbers of threads, compared with letting HDF5 compress them in the
+writer thread. Frames are submitted as fast as possible, as if the camera was faster than the disk.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.movie_writer --frames 200 --threads 1 2 4 8
+
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import h5py
+
+from benchmarks.movie_layout import synthetic_frames
+from common.models.recorder.codecs import chunk_compressor, compression_options
+from common.models.recorder.movie_saver import MovieWriter, create_timelapse, frame_index
+
+
+def write_movie(filename, frames, frames_per_chunk, compression, compressor=None, threads=None):
+    """ Returns the time from the first frame submitted until everything is on disk, in seconds. """
+    with h5py.File(filename, 'w') as f:
+        dset = create_timelapse(f.create_group('data'), frames[0].shape, frames[0].dtype, frames_per_chunk,
+                                'frame_major', frames_per_chunk, compression)
+        t0 = time.perf_counter()
+        writer = MovieWriter(dset, frames_per_chunk, compressor, threads)
+        block = writer.new_block()
+        i = 0
+        for frame in frames:
+            block[frame_index('frame_major', i)] = frame
+            i += 1
+            if i == frames_per_chunk:
+                writer.submit(block, i)
+                block = writer.new_block()
+                i = 0
+        if i:
+            writer.submit(block, i)
+        writer.close()
+        return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the movie writer with compression threads')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--frames-per-chunk', type=int, default=1)
+    parser.add_argument('--level', type=int, default=1)
+    parser.add_argument('--shuffle', default='byte')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument('--folder', default=None, help='Where to write the test files, a temporary folder by default')
+    args = parser.parse_args()
+
+    frames = list(synthetic_frames((args.width, args.height), args.frames))
+    megabytes = sum(frame.nbytes for frame in frames) / 1024 / 1024
+    filename = os.path.join(args.folder or tempfile.mkdtemp(), 'movie_writer.h5')
+    compression = compression_options('gzip', args.level, args.shuffle)
+    compressor = chunk_compressor('gzip', args.level, args.shuffle)
+    print(f'{os.cpu_count()} cores, {args.frames} frames of {frames[0].shape}, gzip {args.level}, '
+          f'{args.shuffle} shuffle')
+
+    elapsed = write_movie(filename, frames, args.frames_per_chunk, compression)
+    print(f'  HDF5 filters: {megabytes/elapsed:7.1f}MB/s')
+    for threads in args.threads:
+        elapsed = write_movie(filename, frames, args.frames_per_chunk, compression, compressor, threads)
+        print(f'{threads:>3} threads  : {megabytes/elapsed:7.1f}MB/s')
+    os.remove(filename)
+
+
+if __name__ == '__main__':
+    main()
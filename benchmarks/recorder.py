@@ -0,0 +1,199 @@
+"""
+Recorder Benchmark
+==================
+Records movies with the :class:`~common.models.recorder.MovieSaver` from a synthetic publisher, for several writer
+configurations, without a camera. The publisher runs in its own process and publishes frames as the cameras do
+(topic, metadata and the raw buffer of a Fortran-ordered array) at a given rate, size and data type, adding a frame ID
+and a timestamp to the metadata.
+
+For every configuration it reports:
+
+* sustained fps: frames saved per second, between the first frame and the end of the saving
+* dropped: frames published but not saved, because the publisher or the socket discarded them
+* CPU: time used by all the threads of the saver, as a percentage of one core
+* peak memory of the saver process
+
+With ``--frame-ring`` the publisher writes the frames in a :class:`~common.models.frame_ring.FrameRing` of that many
+frames instead of a socket, and the saver reads them from the shared memory; frames overwritten before the saver reads
+them are dropped.
+
+Each configuration is a set of ``key=value`` options of the saver, as in the ``saving`` section of the config file::
+
+    python -m benchmarks.recorder --fps 50 --duration 10 --config codec=gzip layout=legacy \\
+        --config codec=gzip layout=frame_major shuffle=byte --config codec=lzf layout=frame_major
+
+"""
+import argparse
+import os
+import tempfile
+import time
+from multiprocessing import Event, Process, Queue
+
+import numpy as np
+import yaml
+import zmq
+
+from benchmarks.movie_layout import synthetic_frames
+from common.models.frame_ring import FrameRing
+from common.models.recorder import MovieReader, MovieSaver
+
+DEFAULT_CONFIGURATIONS = [
+    ['layout=legacy', 'codec=gzip'],
+    ['layout=frame_major', 'codec=gzip'],
+    ['layout=frame_major', 'codec=gzip', 'shuffle=byte'],
+    ['layout=frame_major', 'codec=lzf', 'shuffle=byte'],
+    ['layout=frame_major', 'codec=none'],
+]
+
+
+class SyntheticPublisher(Process):
+    """ Publishes ``duration`` seconds of frames at ``fps`` frames per second (as fast as possible if ``fps`` is 0),
+    once ``start_event`` is set. The url to connect to is put in ``info`` after binding, and the number of frames
+    published when it finishes. With the name of a ``frame_ring``, frames are published there and ``stop_event`` is
+    set when it finishes.
+    """
+    def __init__(self, shape, dtype, fps, duration, start_event, info, topic='new_image', frame_ring=None,
+                 stop_event=None):
+        super().__init__()
+        self.frame_ring = frame_ring
+        self.stop_event = stop_event
+        self.shape = shape
+        self.dtype = dtype
+        self.fps = fps
+        self.duration = duration
+        self.start_event = start_event
+        self.info = info
+        self.topic = topic
+
+    def run(self):
+        # A few different frames published in turns, generating every frame would limit the rate
+        frames = []
+        for frame in synthetic_frames(self.shape[::-1], 8):
+            if np.dtype(self.dtype).itemsize == 1:
+                frame = frame >> 4
+            frames.append(frame.astype(self.dtype).T)  # Fortran order, as frames from Basler cameras
+
+        if self.frame_ring is not None:
+            self.publish_ring(frames)
+            return
+
+        context = zmq.Context()
+        socket = context.socket(zmq.PUB)
+        port = socket.bind_to_random_port('tcp://127.0.0.1')
+        self.info.put(f'tcp://127.0.0.1:{port}')
+        self.start_event.wait()
+
+        sent = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < self.duration:
+            if self.fps:
+                delay = start + sent / self.fps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            frame = frames[sent % len(frames)]
+            meta = dict(numpy=True, dtype=str(frame.dtype), shape=frame.shape, frame_id=sent, timestamp=time.time())
+            socket.send_string(self.topic, zmq.SNDMORE)
+            socket.send_json(meta, zmq.SNDMORE)
+            socket.send(frame, copy=False)
+            sent += 1
+
+        socket.send_string(self.topic, zmq.SNDMORE)
+        socket.send_json(dict(numpy=False), zmq.SNDMORE)
+        socket.send_pyobj('stop')
+        self.info.put(sent)
+        time.sleep(1)  # Lets the last messages leave before closing the socket
+        socket.close()
+        context.term()
+
+    def publish_ring(self, frames):
+        ring = FrameRing.attach(self.frame_ring)
+        self.info.put(None)
+        self.start_event.wait()
+        sent = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < self.duration:
+            if self.fps:
+                delay = start + sent / self.fps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            ring.publish(frames[sent % len(frames)], sent)
+            sent += 1
+        self.stop_event.set()
+        self.info.put(sent)
+        ring.close()
+
+
+def parse_configuration(options) -> dict:
+    """ ``['codec=gzip', 'codec_level=4']`` to ``{'codec': 'gzip', 'codec_level': 4}`` """
+    configuration = {}
+    for option in options:
+        key, value = option.split('=', 1)
+        configuration[key] = yaml.safe_load(value)
+    return configuration
+
+
+def record(filename, configuration, args) -> dict:
+    """ Records a movie from a new synthetic publisher, returns the results of the recording. """
+    start_event = Event()
+    saving_event = Event()
+    info = Queue()
+    ring = FrameRing.create(args.frame_ring, (args.width, args.height), args.dtype) if args.frame_ring else None
+    publisher = SyntheticPublisher((args.width, args.height), args.dtype, args.fps, args.duration, start_event, info,
+                                   frame_ring=ring.name if ring else None, stop_event=saving_event)
+    publisher.start()
+    url = info.get()
+
+    saver = MovieSaver(filename, args.max_memory, args.fps, saving_event, url, topic='new_image',
+                       frame_ring=ring.name if ring else None, first_frame=0, **configuration)
+    time.sleep(1)  # Subscribers miss what is published before they are connected
+    start_event.set()
+    sent = info.get()
+    saver.join()
+    publisher.join()
+    if ring is not None:
+        ring.close()
+
+    with MovieReader(filename) as movie:
+        metadata = movie.metadata
+    elapsed = metadata['end'] - metadata['start']
+    return {
+        'fps': metadata['frames'] / elapsed,
+        'dropped': 1 - metadata['frames'] / sent,
+        'cpu': metadata['cpu_time'] / elapsed * 100,
+        'peak_memory': metadata['peak_memory'],
+        'write_speed': metadata['write_speed'],
+        'compression_ratio': metadata['compression_ratio'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Records synthetic movies with several configurations of the saver')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--dtype', default='uint16')
+    parser.add_argument('--fps', type=float, default=50, help='Publishing rate, 0 publishes as fast as possible')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of frames published')
+    parser.add_argument('--frame-ring', type=int, default=0, help='Frames in shared memory, 0 publishes on a socket')
+    parser.add_argument('--max-memory', type=float, default=100, help='max_memory of the saver, in MB')
+    parser.add_argument('--config', nargs='+', action='append', metavar='KEY=VALUE',
+                        help='Options of the saver for one configuration, can be repeated')
+    parser.add_argument('--folder', default=None, help='Where to write the test files, a temporary folder by default')
+    args = parser.parse_args()
+
+    folder = args.folder or tempfile.mkdtemp()
+    frame_megabytes = args.width * args.height * np.dtype(args.dtype).itemsize / 1024 / 1024
+    print(f'Publishing {args.width}x{args.height} {args.dtype} at {args.fps:g}fps '
+          f'({frame_megabytes * args.fps:.0f}MB/s) for {args.duration:g}s')
+
+    for i, options in enumerate(args.config or DEFAULT_CONFIGURATIONS):
+        filename = os.path.join(folder, f'recorder_{i}.h5')
+        results = record(filename, parse_configuration(options), args)
+        peak_memory = f'{results["peak_memory"]:.0f}MB' if results['peak_memory'] is not None else 'unknown'
+        print(f'{" ".join(options):<45} {results["fps"]:7.1f}fps, dropped {results["dropped"]:6.1%}, '
+              f'CPU {results["cpu"]:5.0f}%, peak memory {peak_memory}, write {results["write_speed"]:.0f}MB/s, '
+              f'ratio {results["compression_ratio"]:.2f}')
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    main()
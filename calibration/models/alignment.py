@@ -0,0 +1,142 @@
+"""
+Laser Alignment
+===============
+Closed-loop alignment of the laser on the fiber core with the piezo mirror. Close to the core the displacement of the
+laser on the camera is linear with the steps of the mirror, given by a 2x2 Jacobian: its columns are the pixels moved
+by one step of the horizontal and of the vertical axis. The Jacobian is calibrated moving each axis back and forth a
+known number of steps, and every iteration of the alignment refines it with the displacement measured (Broyden's
+update), so that a rough calibration still converges.
+
+Every iteration moves both axes the steps that the Jacobian predicts to bring the laser on the core, limited to a
+maximum, and measures the laser again. It stops when the laser is within the tolerance or when the remaining error is
+less than one step.
+
+The laser is measured with :func:`laser_centroid`, the moments of the pixels above half the maximum around the
+brightest pixel, which are fast enough to run after every move.
+"""
+import time
+
+import numpy as np
+
+from calibration.models.centroid import moment_centroid
+from experimentor.lib.log import get_logger
+
+
+class AlignmentError(Exception):
+    pass
+
+
+def laser_centroid(image: np.ndarray, crop_size: int = 25):
+    """ Centroid of the laser spot, from the moments of a square of ``2 * crop_size`` pixels around the brightest
+    pixel, see :func:`~calibration.models.centroid.moment_centroid`.
+
+    Returns
+    -------
+    tuple :
+        The position of the laser, in the same coordinates as the image, or None if the image is flat
+    """
+    x, y = np.unravel_index(np.argmax(image), image.shape)
+    return moment_centroid(image, x, y, crop_size)[0]
+
+
+class LaserAligner:
+    """ Aligns the laser on a target position.
+
+    Parameters
+    ----------
+    measure : callable
+        Returns the position of the laser, (x, y) in pixels, on an image acquired after the last move, or None if
+        it is not found
+    move : callable
+        Moves the mirror, takes the signed number of steps of the horizontal and vertical axes
+    jacobian : array, optional
+        Pixels moved per step, each column for one axis. If not given, :meth:`calibrate` must be called first
+    tolerance : float, optional
+        Distance to the target, in pixels, at which the laser is aligned
+    max_iterations : int, optional
+        Moves done before giving up
+    max_steps : int, optional
+        Largest number of steps of an axis in one move
+    """
+    def __init__(self, measure, move, jacobian=None, tolerance=1., max_iterations=20, max_steps=50):
+        self.measure = measure
+        self.move = move
+        self.jacobian = np.array(jacobian, dtype=float) if jacobian is not None else None
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.max_steps = max_steps
+        self.logger = get_logger(__name__)
+
+    def _position(self) -> np.ndarray:
+        position = self.measure()
+        if position is None:
+            raise AlignmentError('The laser was not found on the image')
+        return np.array(position, dtype=float)
+
+    def calibrate(self, steps=10) -> np.ndarray:
+        """ Moves each axis the given steps and back, measuring the laser, to calculate the Jacobian. """
+        jacobian = np.empty((2, 2))
+        for axis in range(2):
+            start = self._position()
+            move = np.zeros(2, dtype=int)
+            move[axis] = steps
+            self.move(move)
+            end = self._position()
+            self.move(-move)
+            jacobian[:, axis] = (end - start) / steps
+        if abs(np.linalg.det(jacobian)) < 1e-6:
+            raise AlignmentError(f'The laser does not move with both axes of the mirror: {jacobian.tolist()}')
+        self.jacobian = jacobian
+        self.logger.info(f'Calibrated the mirror, pixels per step: {jacobian.tolist()}')
+        return jacobian
+
+    def align(self, target) -> dict:
+        """ Moves the laser to the target, (x, y) in pixels.
+
+        Returns
+        -------
+        dict :
+            ``converged``, whether the laser is within the tolerance, the ``iterations`` and the ``time`` it took
+            (in seconds), the final ``position`` and ``error`` (in pixels) and the ``steps`` moved on each axis
+        """
+        if self.jacobian is None:
+            raise AlignmentError('The mirror must be calibrated before aligning')
+        target = np.array(target, dtype=float)
+        t0 = time.perf_counter()
+        position = self._position()
+        total_steps = np.zeros(2, dtype=int)
+        iterations = 0
+        while iterations < self.max_iterations:
+            error = target - position
+            if np.linalg.norm(error) <= self.tolerance:
+                break
+            steps = np.linalg.solve(self.jacobian, error)
+            largest = np.max(np.abs(steps))
+            if largest > self.max_steps:
+                steps *= self.max_steps / largest
+            steps = np.rint(steps).astype(int)
+            if not steps.any():
+                break  # Closer than one step
+
+            self.move(steps)
+            iterations += 1
+            total_steps += steps
+            new_position = self._position()
+            mismatch = new_position - position - self.jacobian @ steps
+            jacobian = self.jacobian + np.outer(mismatch, steps) / (steps @ steps)
+            if abs(np.linalg.det(jacobian)) > 1e-6:
+                self.jacobian = jacobian
+            position = new_position
+
+        error = np.linalg.norm(target - position)
+        result = {
+            'converged': bool(error <= self.tolerance),
+            'iterations': iterations,
+            'time': time.perf_counter() - t0,
+            'position': position.tolist(),
+            'error': float(error),
+            'steps': total_steps.tolist(),
+        }
+        self.logger.info(f'Alignment {"converged" if result["converged"] else "did not converge"} in '
+                         f'{result["time"]:.2f}s, {iterations} moves, error {error:.2f} pixels')
+        return result
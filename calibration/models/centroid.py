@@ -0,0 +1,190 @@
+"""
+Centroids
+=========
+Center of a bright spot on an image, such as the laser or the core on the fiber end, in two tiers:
+
+* :func:`moment_centroid`: the intensity-weighted centroid of the pixels above half the maximum in a crop around an
+  initial position. It is closed-form and takes tens of microseconds, and it gives a quality of the spot: its signal
+  to noise ratio, or 0 if the spot is cut by the edges of the crop.
+* :func:`gaussian_centroid`: a least-squares fit of a 2-D gaussian on a flat background to the crop, started from the
+  moments. It takes milliseconds, but it is more accurate on noisy or cut spots.
+
+:func:`find_centroid` uses the moments, and fits only when asked to or when the quality is below a minimum.
+
+:class:`SpotTracker` follows a spot that moves little between frames, searching only around its last position.
+"""
+import time
+
+import numpy as np
+
+
+def _crop(image, x, y, crop_size):
+    x, y = int(round(x)), int(round(y))
+    x_min, y_min = max(x - crop_size, 0), max(y - crop_size, 0)
+    return image[x_min:x + crop_size, y_min:y + crop_size].astype(float), x_min, y_min
+
+
+def _moments(cropped):
+    """ Returns the weights of the spot, and its centroid and widths in the cropped coordinates. """
+    minimum = cropped.min()
+    weights = np.clip(cropped - (cropped.max() + minimum) / 2, 0, None)
+    total = weights.sum()
+    if total == 0:
+        return weights, None
+    x_profile = weights.sum(axis=1)
+    y_profile = weights.sum(axis=0)
+    x_coordinates = np.arange(cropped.shape[0])
+    y_coordinates = np.arange(cropped.shape[1])
+    x = x_profile @ x_coordinates / total
+    y = y_profile @ y_coordinates / total
+    width_x = np.sqrt(x_profile @ (x_coordinates - x)**2 / total)
+    width_y = np.sqrt(y_profile @ (y_coordinates - y)**2 / total)
+    return weights, (x, y, width_x, width_y)
+
+
+def _signal_to_noise(cropped) -> float:
+    """ With the background and noise from the pixels on the edges of the crop. """
+    edges = np.concatenate((cropped[0], cropped[-1], cropped[1:-1, 0], cropped[1:-1, -1]))
+    return float((cropped.max() - edges.mean()) / max(edges.std(), 1))
+
+
+def _is_cut(weights) -> bool:
+    return bool(weights[0].any() or weights[-1].any() or weights[:, 0].any() or weights[:, -1].any())
+
+
+def moment_centroid(image: np.ndarray, x: float, y: float, crop_size: int):
+    """ Centroid of the spot in a square of ``2 * crop_size`` pixels around (x, y).
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image with the spot
+    x, y : float
+        Initial position, in pixels
+    crop_size : int
+        Half the side of the square used
+
+    Returns
+    -------
+    tuple :
+        The position, (x, y) in the coordinates of the image, or None if the crop is flat, the quality, and the signal
+        to noise ratio of the crop, which is the quality also when the spot is cut
+    """
+    cropped, x_min, y_min = _crop(image, x, y, crop_size)
+    weights, moments = _moments(cropped)
+    if moments is None:
+        return None, 0., 0.
+    signal_to_noise = _signal_to_noise(cropped)
+    quality = 0. if _is_cut(weights) else signal_to_noise
+    return (moments[0] + x_min, moments[1] + y_min), quality, signal_to_noise
+
+
+def gaussian_centroid(image: np.ndarray, x: float, y: float, crop_size: int):
+    """ Center of a gaussian fitted to the square of ``2 * crop_size`` pixels around (x, y), started from the moments
+    of the spot. Requires scipy.
+
+    Returns
+    -------
+    tuple :
+        The position, (x, y) in the coordinates of the image, or None if the crop is flat or the fit fails
+    """
+    from scipy import optimize
+
+    cropped, x_min, y_min = _crop(image, x, y, crop_size)
+    weights, moments = _moments(cropped)
+    if moments is None:
+        return None
+    background = np.median(cropped)
+    x_moment, y_moment, width_x, width_y = moments
+    initial = (background, cropped.max() - background, x_moment, y_moment, max(width_x, 1), max(width_y, 1))
+    x_coordinates, y_coordinates = np.indices(cropped.shape)
+
+    def residuals(p):
+        offset, height, center_x, center_y, sigma_x, sigma_y = p
+        model = offset + height * np.exp(-((x_coordinates - center_x) / sigma_x)**2 / 2
+                                         - ((y_coordinates - center_y) / sigma_y)**2 / 2)
+        return np.ravel(model - cropped)
+
+    p, success = optimize.leastsq(residuals, initial)
+    if success not in (1, 2, 3, 4):
+        return None
+    return p[2] + x_min, p[3] + y_min
+
+
+def find_centroid(image: np.ndarray, x: float, y: float, crop_size: int, fit=False, min_quality=10.):
+    """ Centroid of the spot around (x, y), from the moments, or from a gaussian fit if ``fit`` is True or the
+    quality of the moments is lower than ``min_quality``.
+
+    Returns
+    -------
+    tuple :
+        The position, (x, y) or None, and a dictionary with the ``method`` used (``moments`` or ``gaussian``), the
+        ``quality`` and ``signal_to_noise`` of the moments and the ``time`` it took, in seconds
+    """
+    t0 = time.perf_counter()
+    position, quality, signal_to_noise = moment_centroid(image, x, y, crop_size)
+    method = 'moments'
+    if position is not None and (fit or quality < min_quality):
+        position = gaussian_centroid(image, position[0], position[1], crop_size)
+        method = 'gaussian'
+    return position, {'method': method, 'quality': quality, 'signal_to_noise': signal_to_noise,
+                      'time': time.perf_counter() - t0}
+
+
+class SpotTracker:
+    """ Follows a spot from frame to frame. The brightest pixel is searched only in a window around the last position,
+    on a view of the frame, and the centroid is calculated with :func:`find_centroid`. Every frame in which the spot
+    is lost (not found, or with a signal to noise ratio below ``lost_quality``) the window doubles, and after
+    ``max_misses`` frames the whole frame is searched.
+
+    Parameters
+    ----------
+    window : int, optional
+        Half the side of the window searched around the last position, in pixels
+    crop_size : int, optional
+        Half the side of the square used for the centroid
+    max_misses : int, optional
+        Frames without the spot before searching the whole frame
+    lost_quality : float, optional
+        Quality below which the spot is considered lost
+    fit, min_quality : optional
+        Passed to :func:`find_centroid`
+    """
+    def __init__(self, window=50, crop_size=25, max_misses=3, lost_quality=5., fit=False, min_quality=10.):
+        self.window = window
+        self.crop_size = crop_size
+        self.max_misses = max_misses
+        self.lost_quality = lost_quality
+        self.fit = fit
+        self.min_quality = min_quality
+        self.position = None
+        self.misses = 0
+
+    def find(self, image: np.ndarray):
+        """ Position of the spot on the image, or None if it is lost, and the information given by
+        :func:`find_centroid` with the ``search`` done, ``window`` or ``frame``. """
+        full_frame = self.position is None or self.misses >= self.max_misses
+        if full_frame:
+            x_min = y_min = 0
+            region = image
+        else:
+            half = self.window * 2**self.misses
+            x, y = int(round(self.position[0])), int(round(self.position[1]))
+            x_min, y_min = max(x - half, 0), max(y - half, 0)
+            region = image[x_min:x + half, y_min:y + half]
+            if not region.size:
+                x_min = y_min = 0
+                region = image
+        x, y = np.unravel_index(np.argmax(region), region.shape)
+        position, info = find_centroid(image, x + x_min, y + y_min, self.crop_size, self.fit, self.min_quality)
+        info['search'] = 'frame' if full_frame else 'window'
+        if position is None or info['signal_to_noise'] < self.lost_quality:
+            if full_frame:
+                self.position = None
+                self.misses = 0
+            else:
+                self.misses += 1
+            return None, info
+        self.position = position
+        self.misses = 0
+        return position, info
@@ -1,17 +1,24 @@
 import os
 from datetime import datetime
 from multiprocessing import Event
+from threading import Lock
 
 import numpy as np
-import copy as copy #m required in Code1dot7for_implementation
 
-from calibration.models.movie_saver import MovieSaver
-from dispertech.models.electronics.arduino import ArduinoModel
+from calibration.models.alignment import LaserAligner, laser_centroid
+from calibration.models.centroid import SpotTracker, find_centroid
+from calibration.models.fiber_core import find_fiber_core
+from calibration.models.simulated_electronics import SimulatedElectronics
+from calibration.models.weighting_mask import WeightingMaskStore
+from common.models.background import make_background_model
+from common.models.cameras import make_camera
+from common.models.cameras.reconfiguration import CameraReconfiguration
+from common.models.cameras.simulated import SimulatedCamera
+from common.models.recorder import MovieSaver, saver_options
+from PiezoMove.arduino import SIMULATED_PORT
 from experimentor import Q_
 from experimentor.core.signal import Signal
-from experimentor.lib.fitgaussian import fitgaussian
 from experimentor.models.action import Action
-from experimentor.models.devices.cameras.basler.basler import BaslerCamera as Camera
 from experimentor.models.devices.cameras.exceptions import CameraTimeout
 from experimentor.models.experiments import Experiment
 import time
@@ -25,19 +32,26 @@ class CalibrationSetup(Experiment):
 
         self.background = None
         self.camera_microscope = None
+        self.microscope_reconfiguration = None
         self.camera_fiber = None
 
         self.electronics = None
 
+        # The positions of the core and the laser, and the tracker of the laser, are updated from the fiber analysis
+        # worker and from the alignment, both in their own threads
+        self.positions_lock = Lock()
         self.fiber_center_position = None
         self.fiber_radius = 0
         self.laser_center = None
+        self.centroid_info = None  # Method, quality and time of the last centroid calculated
+        self.laser_tracker = None
         self.saving = False
         self.saving_event = Event()
         self.finalized = False
         self.saving_process = None
         self.remove_background = False
         self.multiply_array = False #m
+        self.multiply_array_store = None
 
     @Action
     def initialize(self):
@@ -57,102 +71,35 @@ class CalibrationSetup(Experiment):
 
 
     @Action
-    def initilize_multiply_array(self,power = 2.5): #m
-        """Here the multiply array is either imported or created (if not exiting or the wrong size)."""
-
+    def initilize_multiply_array(self, power=None): #m
+        """Here the multiply array for the current frame of the fiber camera is either imported or created (if not
+        existing or the wrong size). See :meth:`get_multiply_array`."""
         self.logger.info('Initializing multiply array')
+        shape = self.get_latest_image('camera_fiber').shape
+        self.multiply_array = self.get_multiply_array(shape, power)
 
-        #height and width might have to be changed position in the future
-        height = len(self.get_latest_image('camera_fiber'))
-        width = len(self.get_latest_image('camera_fiber')[0])
-        self.logger.debug('width',width,'height',height)
-
-        # Path is the file path to this code
-        path = __file__
-
-        # Nelow the seperation sine of the file path is determined (this depends on the operating
-        # system).
-        seperator = os.path.sep
-
-        # A list of the file path is created, the elements are split based on the seperator.
-        list_of_path = path.split(seperator)
-
-        # removing the last 5 elements
-        for i in range(5):
-            list_of_path.remove(list_of_path[-1])
-
-        # Defining element '0' in list of path as the first element in the new path
-        file_path = list_of_path[0]
-        list_of_path.remove(list_of_path[0])
-
-        # Creating the new path
-        for i in list_of_path:
-            file_path = file_path + seperator + i
-        file_path = file_path + seperator + "multiply_array.npy"
-
-        # Trying if file exists
-        try:
-            # For now multiply_array is global (this will be changed later)
-            self.logger.info('Try if the multiply array file exists in: ', file_path)
-            multiply_array = np.load(file_path)
-
-        except IOError:
-            # If the file does not exist in the folder, the multiply array is created and saved in the
-            # folder
-            self.logger.debug("File non existing in folder")
-            self.logger.debug('Creating multiply array with dimensions:', [width, height])
-            # Creating the multiply array (in the same way as the function: creating_multiply_array_2)
-            multiply_array_one = (np.linspace(2, 0, width * height).reshape(height, width))
-            multiply_array_one = multiply_array_one * np.flip(multiply_array_one, 1) * \
-                                 np.rot90(np.rot90(multiply_array_one)) * np.flip(\
-                np.rot90(np.rot90(multiply_array_one)), 1)
-
-            multiply_array_two = (np.linspace(2, 0, width * height).reshape(width, height))
-            multiply_array_two = multiply_array_two * np.flip(multiply_array_two, 1) * \
-                                 np.rot90(np.rot90(multiply_array_two)) * np.flip(\
-                np.rot90(np.rot90(multiply_array_two)), 1)
-
-            multiply_array = multiply_array_one * np.rot90(multiply_array_two)
-
-            multiply_array = multiply_array ** power
-            self.logger.debug('Save multiply array')
-            np.save(file_path, multiply_array)
-        else:
-            self.logger.info('File existing in folder')
-            if len(multiply_array[0]) != width or len(multiply_array) != height:
-                # If the multiply_array does exist but has the wrong dimensions, a multiply_array with
-                # the propper dimesions is created and saved.
-                self.logger.debug('But wrong dimensions')
-                self.logger.debug('Create multply array with (propper) dimensions:', [width, height])
-                multiply_array_one = (np.linspace(2, 0, width * height).reshape(height, width))
-                multiply_array_one = multiply_array_one * np.flip(multiply_array_one, 1) * \
-                                     np.rot90(np.rot90(multiply_array_one)) * np.flip(\
-                    np.rot90(np.rot90(multiply_array_one)), 1)
-
-                multiply_array_two = (np.linspace(2, 0, width * height).reshape(width, height))
-                multiply_array_two = multiply_array_two * np.flip(multiply_array_two, 1) * \
-                                     np.rot90(np.rot90(multiply_array_two)) * np.flip(\
-                    np.rot90(np.rot90(multiply_array_two)), 1)
-
-                multiply_array = multiply_array_one * np.rot90(multiply_array_two)
-
-                multiply_array = multiply_array ** power
-                self.logger.debug('Save new multiply array')
-                np.save(file_path, multiply_array)
-            else:
-                self.logger.debug('With the propper dimensions (', [width, height], ')')
+    def get_multiply_array(self, shape, power=None):
+        """ Returns the multiply array used to find the fiber core for images of the given shape. Arrays are kept in
+        memory and stored in the folder given in the config file, therefore changing the ROI or binning of the fiber
+        camera back and forth does not create them again.
 
-        self.logger.debug(multiply_array)
-        self.multiply_array = multiply_array
+        :param tuple shape: shape of the image of the fiber camera
+        :param float power: if not given, the one in the config file is used
+        """
+        config = self.config['multiply_array']
+        if self.multiply_array_store is None:
+            self.multiply_array_store = WeightingMaskStore(config['folder'])
+        if power is None:
+            power = config['power']
+        return self.multiply_array_store.get(shape, power)
 
     def initialize_cameras(self):
         """Assume a specific setup working with baslers and initialize both cameras"""
         self.logger.info('Initializing cameras')
-        config_mic = self.config['camera_microscope']
-        self.camera_microscope = Camera(config_mic['init'], initial_config=config_mic['config'])
-
-        config_fiber = self.config['camera_fiber']
-        self.camera_fiber = Camera(config_fiber['init'], initial_config=config_fiber['config'])
+        self.camera_microscope = make_camera(self.config['camera_microscope'])
+        self.camera_fiber = make_camera(self.config['camera_fiber'])
+        self.microscope_reconfiguration = CameraReconfiguration(self.camera_microscope,
+                                                                on_change=self.discard_background)
 
         for cam in (self.camera_fiber, self.camera_microscope):
             self.logger.info(f'Initializing {cam}')
@@ -160,13 +107,24 @@ class CalibrationSetup(Experiment):
             self.logger.debug(f'Configuring {cam}')
 
     def initialize_electronics(self):
-        """ Initializes the electronics associated witht he experiment (but not the cameras).
+        """ Initializes the electronics associated witht he experiment (but not the cameras). With ``port: simulated``
+        in the config, the board is replaced by
+        :class:`~calibration.models.simulated_electronics.SimulatedElectronics`, and the experiment does not need
+        the dispertech package.
 
         TODO:: We should be mindful about what happens once the program starts and what happens once the device is
             switched on.
         """
 
-        self.electronics = ArduinoModel(**self.config['electronics']['arduino'])
+        config = self.config['electronics']
+        if config['arduino'].get('port') == SIMULATED_PORT:
+            camera = self.camera_fiber if isinstance(self.camera_fiber, SimulatedCamera) else None
+            self.electronics = SimulatedElectronics(camera, (config['horizontal_axis'], config['vertical_axis']),
+                                                    pixels_per_step=config['arduino'].get('pixels_per_step'),
+                                                    simulation=config['arduino'].get('simulation'))
+        else:
+            from dispertech.models.electronics.arduino import ArduinoModel
+            self.electronics = ArduinoModel(**config['arduino'])
         self.logger.info('Initializing electronics arduino')
         self.electronics.initialize()
 
@@ -210,6 +168,71 @@ class CalibrationSetup(Experiment):
         speed = self.config['mirror']['speed']
         self.electronics.move_piezo(speed, direction, axis)
 
+    def move_mirror_steps(self, steps):
+        """ Moves the mirror the given number of steps on the horizontal and the vertical axes, positive steps in
+        direction 1. Every step is a move at the speed of the config, sent one by one: the board of the setup does
+        not have the batch command of the firmware in ``PiezoMove``. """
+        speed = self.config['mirror']['speed']
+        axes = (self.config['electronics']['horizontal_axis'], self.config['electronics']['vertical_axis'])
+        for axis, n in zip(axes, steps):
+            for _ in range(abs(int(n))):
+                self.electronics.move_piezo(speed, int(n > 0), axis)
+
+    def measure_laser_center(self):
+        """ Waits for new frames of the fiber camera, so that the last move of the mirror is done before the frame
+        is exposed, and calculates the center of the laser on the last one.
+        """
+        frames = self.config['alignment']['settle_frames']
+        image = self.camera_fiber.temp_image
+        t0 = time.time()
+        while frames:
+            if self.camera_fiber.temp_image is not image:
+                image = self.camera_fiber.temp_image
+                frames -= 1
+            elif time.time() - t0 > 10:
+                raise CameraTimeout('It took too long to get a new frame from the fiber camera')
+            else:
+                time.sleep(.001)
+        laser_center = laser_centroid(image)
+        with self.positions_lock:
+            self.laser_center = laser_center
+        return laser_center
+
+    def make_aligner(self) -> LaserAligner:
+        config = self.config['alignment']
+        return LaserAligner(self.measure_laser_center, self.move_mirror_steps, jacobian=config['jacobian'],
+                            tolerance=config['tolerance'], max_iterations=config['max_iterations'],
+                            max_steps=config['max_steps'])
+
+    @Action
+    def calibrate_alignment(self):
+        """ Calibrates the pixels that the laser moves per step of the mirror, and stores them in the config for the
+        next alignments. The laser must be on the fiber end. """
+        aligner = self.make_aligner()
+        jacobian = aligner.calibrate(self.config['alignment']['calibration_steps'])
+        self.config['alignment']['jacobian'] = jacobian.tolist()
+
+    @Action
+    def align_laser(self):
+        """ Moves the laser to the center of the fiber core, which must have been found before. Calibrates the mirror
+        first if it was not done yet.
+
+        :returns: the results of :meth:`~calibration.models.alignment.LaserAligner.align`
+        """
+        with self.positions_lock:
+            fiber_center_position = self.fiber_center_position
+        if fiber_center_position is None:
+            self.logger.error('The fiber core must be found before aligning the laser')
+            return
+        aligner = self.make_aligner()
+        if aligner.jacobian is None:
+            self.config['alignment']['jacobian'] = aligner.calibrate(
+                self.config['alignment']['calibration_steps']).tolist()
+        # The core is given as [column, row] of the image, the laser as (row, column) like the indices of the frames
+        results = aligner.align(fiber_center_position[::-1])
+        self.config['alignment']['jacobian'] = aligner.jacobian.tolist()
+        return results
+
     def get_latest_image(self, camera: str):
         """ Reads the camera.
 
@@ -218,23 +241,27 @@ class CalibrationSetup(Experiment):
 
         if camera == 'camera_microscope':
             tmp_image = self.camera_microscope.temp_image
-            if self.remove_background:
-                if self.background is None:
-                    self.background = np.empty((tmp_image.shape[0], tmp_image.shape[1], 10), dtype=np.uint16)
-                self.background = np.roll(self.background, -1, 2)
-                self.background[:, :, -1] = tmp_image
-                bkg = np.mean(self.background, 2, dtype=np.uint16)
-                # tmp_image = (tmp_image.astype(np.int16) - bkg).clip(0, 2**16-1).astype(np.uint16)
-                ttmp_image = tmp_image - bkg
-                ttmp_image[bkg>tmp_image] = 0
-                tmp_image = ttmp_image
-            else:
+            if not self.remove_background:
                 self.background = None
+            elif tmp_image is not None:
+                if self.background is None or self.background.shape != tmp_image.shape:
+                    self.background = make_background_model(self.config['background'], tmp_image.shape,
+                                                            tmp_image.dtype)
+                tmp_image = self.background.subtract(tmp_image)
             # return (tmp_image/2**4).astype(np.uint8)
             return tmp_image
         else:
             return self.camera_fiber.temp_image
 
+    def get_frame_sequence(self, camera: str) -> int:
+        """ Number of frames the camera has delivered, it changes when there is a new image.
+
+        :param camera: 'camera_microscope' or 'camera_fiber', as in :meth:`get_latest_image`
+        """
+        if camera == 'camera_microscope':
+            return self.camera_microscope.frame_sequence
+        return self.camera_fiber.frame_sequence
+
     def stop_free_run(self, camera: str):
         """ Stops the free run of the camera.
 
@@ -311,21 +338,11 @@ class CalibrationSetup(Experiment):
 
     @Action
     def start_binning(self):
-        self.camera_microscope.stop_continuous_reads()
-        self.camera_microscope.stop_free_run()
-        self.background = None  # This is to prevent shape mismatch between before and after
-        self.camera_microscope.binning_y = 4
-        self.camera_microscope.start_free_run()
-        self.camera_microscope.continuous_reads()
+        return self.microscope_reconfiguration.request(binning_y=4)
 
     @Action
     def stop_binning(self):
-        self.camera_microscope.stop_continuous_reads()
-        self.camera_microscope.stop_free_run()
-        self.background = None  # This is to prevent shape mismatch between before and after
-        self.camera_microscope.binning_y = 1
-        self.camera_microscope.start_free_run()
-        self.camera_microscope.continuous_reads()
+        return self.microscope_reconfiguration.request(binning_y=1)
 
     @Action
     def save_fiber_core(self):
@@ -370,30 +387,46 @@ class CalibrationSetup(Experiment):
         base_filename = self.config['info']['filename_microscope']
         self.save_image_microscope_camera(base_filename)
 
-    def calculate_gaussian_centroid(self, image, x, y, crop_size):
-        x = round(x)
-        y = round(y)
-        cropped_data = np.copy(image[x - crop_size:x + crop_size, y - crop_size:y + crop_size])
-        cropped_data[cropped_data < np.mean(cropped_data)] = 0
+    def calculate_gaussian_centroid(self, image, x, y, crop_size, fit=None):
+        """ Centroid of the spot around x, y, see :func:`~calibration.models.centroid.find_centroid`. The moments are
+        refined with a gaussian fit if ``fit`` is True, or if it is None and the config asks to fit always or the
+        quality of the moments is below its minimum. """
+        config = self.config['centroid']
+        if fit is None:
+            fit = config.get('fit', False)
         try:
-            p = fitgaussian(cropped_data)
-            extracted_position = p[1] + x - crop_size, p[2] + y - crop_size
-            self.logger.info(f'Calculated center: {extracted_position}')
+            extracted_position, centroid_info = find_centroid(image, x, y, crop_size, fit,
+                                                              config.get('min_quality', 10))
+            with self.positions_lock:
+                self.centroid_info = centroid_info
+            self.logger.debug(f'Calculated center: {extracted_position}, {centroid_info}')
         except:
             extracted_position = None
-            self.logger.exception('Exception fitting the gaussian')
+            self.logger.exception('Exception calculating the centroid')
         return extracted_position
 
-    def calculate_laser_center(self):
+    def calculate_laser_center(self, image=None):
         """ This method calculates the laser position based on the reflection from the fiber tip. It is meant to be
-        used as a reference when focusing the laser on the fiber for calibrating.
+        used as a reference when focusing the laser on the fiber for calibrating. Uses the latest frame of the fiber
+        camera if no image is given.
 
         .. TODO:: Judge how precise this is. Perhaps it would be possible to use it instead of the laser reflection on
             the mirror?
         """
-        image = np.copy(self.camera_fiber.temp_image)
-        brightest = np.unravel_index(image.argmax(), image.shape)
-        self.laser_center = self.calculate_gaussian_centroid(image, brightest[0], brightest[1], crop_size=25)
+        if image is None:
+            image = self.camera_fiber.temp_image
+        if image is None:
+            return None, None
+        with self.positions_lock:
+            if self.laser_tracker is None:
+                config = self.config['centroid']
+                self.laser_tracker = SpotTracker(window=config.get('tracking_window', 50), crop_size=25,
+                                                 max_misses=config.get('tracking_misses', 3),
+                                                 lost_quality=config.get('lost_quality', 5.),
+                                                 fit=config.get('fit', False),
+                                                 min_quality=config.get('min_quality', 10))
+            self.laser_center, self.centroid_info = self.laser_tracker.find(image)
+            return self.laser_center, self.centroid_info
 
     def calculate_fiber_center(self, x, y, crop_size=15):
         """ Calculate the core center based on some initial coordinates x and y.
@@ -409,8 +442,10 @@ class CalibrationSetup(Experiment):
             Size of the square crop around x, y in order to minimize errors
         """
         self.logger.info(f'Calculating fiber center using ({x}, {y})')
-        image = np.copy(self.camera_fiber.temp_image)
-        self.fiber_center_position = self.calculate_gaussian_centroid(image, x, y, crop_size)
+        image = self.camera_fiber.temp_image
+        fiber_center_position = self.calculate_gaussian_centroid(image, x, y, crop_size)
+        with self.positions_lock:
+            self.fiber_center_position = fiber_center_position
         return [x,y] #m
 
     def set_roi(self, y_min, height):
@@ -424,26 +459,18 @@ class CalibrationSetup(Experiment):
         height : int
             The total height in pixels
         """
-        self.camera_microscope.stop_free_run()
-        self.camera_microscope.stop_continuous_reads()
-        self.background = None  # This is to prevent shape mismatch between before and after
-        current_roi = self.camera_microscope.ROI
-        new_roi = (current_roi[0], (y_min, height))
-        self.camera_microscope.ROI = new_roi
-        self.camera_microscope.start_free_run()
-        self.camera_microscope.continuous_reads()
+        return self.microscope_reconfiguration.request_roi(y=(y_min, height))
 
     def clear_roi(self):
-        self.camera_microscope.stop_continuous_reads()
-        self.camera_microscope.stop_free_run()
-        self.background = None  # This is to prevent shape mismatch between before and after
         full_roi = (
             (0, self.camera_microscope.ccd_width),
             (0, self.camera_microscope.ccd_height)
         )
-        self.camera_microscope.ROI = full_roi
-        self.camera_microscope.start_free_run()
-        self.camera_microscope.continuous_reads()
+        return self.microscope_reconfiguration.request(ROI=full_roi)
+
+    def discard_background(self):
+        """ The background model of the microscope camera does not apply after changing its ROI or binning. """
+        self.background = None
 
     def start_saving_images(self):
         if self.saving:
@@ -456,6 +483,8 @@ class CalibrationSetup(Experiment):
         base_filename = self.config['info']['filename_movie']
         file = self.get_filename(base_filename)
         self.saving_event.clear()
+        # Frames are read from the shared memory of the camera if it has it, starting from the next one
+        ring = self.camera_microscope.frame_ring
         self.saving_process = MovieSaver(
             file,
             self.config['saving']['max_memory'],
@@ -464,19 +493,50 @@ class CalibrationSetup(Experiment):
             self.camera_microscope.new_image.url,
             topic='new_image',
             metadata=self.camera_microscope.config.all(),
+            frame_ring=ring.name if ring is not None else None,
+            first_frame=ring.published if ring is not None else None,
+            **saver_options(self.config['saving']),
         )
 
-    def stop_saving_images(self):
+    def stop_saving_images(self, timeout=10):
+        """ Stops the saver and waits until it closes the file, so that a new movie can be saved right after.
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait for the saver to write the frames still queued and close the file
+
+        Returns
+        -------
+        dict or None :
+            The summary of the movie (see :meth:`MovieSaver.wait`), None if the saver did not finish in time
+        """
+        t0 = time.perf_counter()
         self.camera_microscope.new_image.emit('stop')
         # self.emit('new_image', 'stop')
 
-        # self.saving_event.set()
-        time.sleep(.05)
-
-        if self.saving_process is not None and self.saving_process.is_alive():
-            self.logger.warning('Saving process still alive')
-            time.sleep(.1)
+        if self.camera_microscope.frame_ring is not None:
+            # Reading from shared memory there is no stop keyword, the saver stops after the frames published until now
+            self.saving_event.set()
+
+        summary = None
+        if self.saving_process is not None:
+            summary = self.saving_process.wait(timeout)
+            if summary is None:
+                # The stop keyword can be lost if the socket drops messages, the saving event stops it anyway
+                self.logger.warning(f'Saving process still alive after {timeout}s, setting the saving event')
+                self.saving_event.set()
+                summary = self.saving_process.wait(1)
         self.saving = False
+        if summary is None:
+            self.logger.error('The saving process did not finish')
+        elif summary['error'] is not None:
+            self.logger.error(f'The saving process failed: {summary["error"]}')
+        else:
+            summary['stop_time'] = time.perf_counter() - t0
+            self.logger.info(f'Saved {summary["frames"]} frames to {summary["file"]} in {summary["duration"]:.1f}s, '
+                             f'{summary["dropped_frames"]} dropped, stopping took {summary["stop_time"]:.2f}s')
+        return summary
 
     def finalize(self):
         if self.finalized:
@@ -677,7 +737,6 @@ class CalibrationSetup(Experiment):
 
     #Function added by Matthijs (to find the core coordinates)
     def Code1dot7for_implementation(self,npy_array, multiply_array, n_value=0.001):
-        print(__file__)
         #The function input npy_file is changed to npy_array, multiply_array is now an input instead
         #of being created in the code.
         '''
@@ -685,99 +744,13 @@ class CalibrationSetup(Experiment):
         multiplied with the array created by the camera. The n_value decides whcih part of the pixels
         will be considerd 'bright' (these are put to 1 in the binary array).
 
-        This code is a modefied version of code 1.7, so it can be implemented to work in the system
+        This code is a modefied version of code 1.7, so it can be implemented to work in the system. The iterative
+        removal of pixels with few bright neighbors is done in :func:`~calibration.models.fiber_core.find_fiber_core`
+        on whole arrays, see ``benchmarks/fiber_core.py`` for a comparison with the original loop.
         '''
-
-        #Below 'array' is created, which is the product of the multiply_array and the original array
-        array = (npy_array * multiply_array).astype(int)
-
-        #Determination of the threshold value
-        threshold = round(np.percentile(array, (100 - (100 * n_value)), interpolation='nearest'))
-
-        #Below a binary array is created, pixels above the threshold get assigned the value 1 and
-        #pixels below the threshold get assigned the value 0
-        np_array_binary = np.where(array > threshold, 1, 0)
-
-        #The lines of code below put the edges of the image to 0
-        #Puts the top column to 0
-        np_array_binary[0, :] = 0
-        #Puts the lowest column to 0
-        np_array_binary[-1, :] = 0
-        #Puts the left column to zero
-        np_array_binary[:, 0] = 0
-        #Puts the right column to zero
-        np_array_binary[:, -1] = 0
-
-        #Determination of the bright pixel locations
-        bright_pixel_locations = np.where(np_array_binary == 1)
-
-        #List containing the bright pixel coordinates
-        bright_coords = []
-
-        #Filling the list of bright pixel coordinates
-        for i in range(0, len(bright_pixel_locations[0])):
-            bright_coords.append([bright_pixel_locations[0][i], bright_pixel_locations[1][i]])
-
-        #Previous_length_bright_coords is a variable required in while loop, so the function does not hang, reason for
-        #assigning the value -1, is so, the if statement: if previous_length_bright_coords == len(bright_coords_copy)
-        #can never be 'True' during the first itteration in the while loop.
-        previous_length_bright_coords = -1
-
-        #Number of bright neighbors required
-        bright_negihbors_required = 4
-
-        #In this while loop, the determination of the pixels at the fiber core is done
-        while len(bright_coords) >= 1:
-
-            #Copy of the binary array
-            binary_copy = copy.copy(np_array_binary)
-            bright_coords_copy = copy.copy(bright_coords)
-
-            #In this for loop, for eacht bright pixel the number of bright (direct) neighbors is determined.
-            for i in bright_coords:
-                bright_neighbors = 0
-                if np_array_binary[i[0] - 1][i[1]] == 1:
-                    bright_neighbors = bright_neighbors + 1
-                if np_array_binary[i[0] + 1][i[1]] == 1:
-                    bright_neighbors = bright_neighbors + 1
-                if np_array_binary[i[0]][i[1] - 1] == 1:
-                    bright_neighbors = bright_neighbors + 1
-                if np_array_binary[i[0]][i[1] + 1] == 1:
-                    bright_neighbors = bright_neighbors + 1
-
-                #If a pixel has less bright neighbors than required, it is put to 0.
-                if bright_neighbors < bright_negihbors_required:
-                    binary_copy[i[0]][i[1]] = 0
-                    bright_coords_copy.remove(i)
-                else:
-                    pass
-
-            #If nothing is added to the list bright_coords_copy, the threshold for required bright neighbors is
-            # lowered, and both the binary array as the bright coords list are kept the same
-
-            if len(bright_coords_copy) == 0:
-                bright_negihbors_required = bright_negihbors_required - 1
-            else:
-                np_array_binary = binary_copy
-                bright_coords = bright_coords_copy
-
-            #When there is no more pixel with any bright neighbors, break
-            if bright_negihbors_required == 0:
-                break
-
-            if previous_length_bright_coords == len(bright_coords_copy):
-                #When pixels are no longer being removed, the itteration is stopped with the break commend
-                break
-
-            #Number of bright coordinates during the previous round through the while loop
-            previous_length_bright_coords = len(bright_coords)
-
-        #Determening x- and y coordinate core
-        x = 0
-        y = 0
-        for i in bright_coords:
-            x = x + i[1]
-            y = y + i[0]
-        x = round(x / len(bright_coords))
-        y = round(y / len(bright_coords))
-        self.fiber_center_position = [x,y]
+        fiber_center_position = find_fiber_core(npy_array, multiply_array, n_value)
+        if fiber_center_position is None:
+            self.logger.warning('No bright pixels found on the fiber image')
+        with self.positions_lock:
+            self.fiber_center_position = fiber_center_position
+        return fiber_center_position
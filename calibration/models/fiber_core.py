@@ -0,0 +1,142 @@
+"""
+Fiber Core Detection
+====================
+Finds the core of the fiber on an image of the fiber end. The image is weighted with a multiply array (which favours
+the center of the image), the brightest pixels are selected, and the selection is eroded iteratively: on every
+round the pixels with fewer bright direct neighbours than required are discarded. When no pixel survives, the number of
+required neighbours is lowered. The core is the centroid of the pixels that remain once the erosion stabilizes.
+
+This is the same procedure as the original per-pixel implementation (code 1.7), but it works on whole arrays: the
+neighbours are counted by adding shifted views of a boolean mask, and the centroid is calculated from the moments of
+the mask.
+"""
+import numpy as np
+
+
+def bright_threshold(array: np.ndarray, n_value: float) -> int:
+    """ Value above which pixels are considered bright. Equivalent to ``np.percentile`` with the ``'nearest'``
+    method at ``100 - 100 * n_value``, but using a partial sort and not relying on keywords that changed between numpy
+    versions.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        Weighted image
+    n_value : float
+        Fraction of pixels that will be considered bright
+
+    Returns
+    -------
+    int :
+        The threshold
+    """
+    flat = array.ravel()
+    q = (100 - (100 * n_value)) / 100
+    k = int(np.around(q * (flat.size - 1)))
+    num_above = flat.size - k  # The k-th value is the num_above-th largest
+
+    # Only the brightest pixels matter: a strided sample gives a lower bound that leaves a few times more pixels than
+    # needed, and the partial sort runs only on those.
+    sample = flat[::max(1, flat.size // 65536)]
+    sample_index = sample.size - 4 * int(np.ceil(num_above / flat.size * sample.size)) - 64
+    if sample_index > 0:
+        candidates = flat[flat >= np.partition(sample, sample_index)[sample_index]]
+        if candidates.size >= num_above:
+            index = candidates.size - num_above
+            return round(np.partition(candidates, index)[index])
+    return round(np.partition(flat, k)[k])
+
+
+def bright_mask(npy_array: np.ndarray, multiply_array: np.ndarray, n_value: float = 0.001) -> np.ndarray:
+    """ Boolean mask of the bright pixels of the weighted image. The border of the image is always excluded, so that
+    every bright pixel has four direct neighbours.
+    """
+    array = (npy_array * multiply_array).astype(int)
+    threshold = bright_threshold(array, n_value)
+    mask = array > threshold
+    mask[0, :] = False
+    mask[-1, :] = False
+    mask[:, 0] = False
+    mask[:, -1] = False
+    return mask
+
+
+def erode_core(mask: np.ndarray) -> np.ndarray:
+    """ Iteratively removes the bright pixels that do not have enough bright direct neighbours. Starts requiring all
+    four neighbours; if no pixel would survive a round, the requirement is lowered by one and the round is repeated.
+    Stops when a round removes no pixels, or when the requirement reaches zero.
+
+    Parameters
+    ----------
+    mask : np.ndarray
+        Boolean array in which the border pixels are ``False``
+
+    Returns
+    -------
+    np.ndarray :
+        Boolean array of the pixels that belong to the core. It is a crop of the input mask, use
+        :func:`find_fiber_core` to get coordinates in the full image.
+    """
+    neighbours = np.zeros(mask.shape, dtype=np.uint8)
+    inner = neighbours[1:-1, 1:-1]
+    required = 4
+    previous_count = -1
+    count = np.count_nonzero(mask)
+    while count >= 1:
+        inner[...] = mask[:-2, 1:-1]
+        inner += mask[2:, 1:-1]
+        inner += mask[1:-1, :-2]
+        inner += mask[1:-1, 2:]
+        keep = mask & (neighbours >= required)
+        kept = np.count_nonzero(keep)
+
+        if kept == 0:
+            required -= 1
+        else:
+            mask = keep
+            count = kept
+
+        if required == 0:
+            break
+
+        if previous_count == kept:
+            break
+
+        previous_count = count
+    return mask
+
+
+def find_fiber_core(npy_array: np.ndarray, multiply_array: np.ndarray, n_value: float = 0.001):
+    """ Calculates the position of the core of the fiber.
+
+    Parameters
+    ----------
+    npy_array : np.ndarray
+        Image of the fiber end, as acquired by the camera
+    multiply_array : np.ndarray
+        Weighting array, with the same shape as the image
+    n_value : float, optional
+        Fraction of the pixels that will be considered bright
+
+    Returns
+    -------
+    list or None :
+        ``[x, y]`` with ``x`` the column and ``y`` the row of the core, rounded to the nearest pixel. ``None`` if no
+        pixel is above the threshold.
+    """
+    mask = bright_mask(npy_array, multiply_array, n_value)
+    rows = np.flatnonzero(np.any(mask, axis=1))
+    if not len(rows):
+        return None
+    cols = np.flatnonzero(np.any(mask, axis=0))
+
+    # Everything outside the bounding box of the bright pixels (plus one pixel of margin) is already False, the erosion
+    # only needs to run on this crop.
+    row_0, col_0 = rows[0] - 1, cols[0] - 1
+    core = erode_core(mask[row_0:rows[-1] + 2, col_0:cols[-1] + 2])
+
+    core_rows, core_cols = np.nonzero(core)
+    num_pixels = len(core_rows)
+    x = round(int(np.sum(core_cols) + num_pixels * col_0) / num_pixels)
+    y = round(int(np.sum(core_rows) + num_pixels * row_0) / num_pixels)
+    return [x, y]
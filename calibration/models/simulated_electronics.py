@@ -0,0 +1,54 @@
+"""
+Simulated Electronics
+=====================
+Replaces the board of the calibration setup, to run the alignment of the laser end to end without hardware. It is
+selected with ``port: simulated`` in the ``electronics`` section of the config file::
+
+    electronics:
+      arduino:
+        port: simulated
+        simulation:  # Options of PiezoMove/simulated_arduino.py
+          move_time: 0.05
+        pixels_per_step: [[2., .4], [-.3, 1.5]]
+
+The mirror is moved by a :class:`~PiezoMove.simulated_arduino.SimulatedArduino`, through the
+:class:`~PiezoMove.arduino.ArduinoModel` that talks to it. If the fiber camera is a
+:class:`~common.models.cameras.simulated.SimulatedCamera` (``model: simulated`` and ``scene: fiber``), every step of
+the mirror moves its laser by a column of ``pixels_per_step``, the horizontal axis in the first column, so that
+:meth:`~calibration.models.experiment.CalibrationSetup.align_laser` closes the loop as on the setup.
+
+The LEDs and the scattering laser only keep the value set, as the setup does not read them back either.
+"""
+import numpy as np
+
+from PiezoMove.arduino import SIMULATED_PORT, ArduinoModel
+
+PIXELS_PER_STEP = ((2., .4), (-.3, 1.5))
+
+
+class SimulatedElectronics(ArduinoModel):
+    def __init__(self, camera=None, axes=(1, 2), pixels_per_step=None, simulation=None):
+        """
+        :param camera: the simulated fiber camera whose laser follows the mirror, or None to only record the moves
+        :param tuple axes: the horizontal and the vertical axes of the mirror
+        :param pixels_per_step: 2x2 pixels that the laser moves per step in direction 1 of each axis
+        :param dict simulation: keyword arguments of the simulated board
+        """
+        simulation = dict(simulation or {})
+        simulation['on_move'] = self._move_laser
+        super().__init__(port=SIMULATED_PORT, simulation=simulation)
+        self.camera = camera
+        self.axes = tuple(axes)
+        self.pixels_per_step = np.array(PIXELS_PER_STEP if pixels_per_step is None else pixels_per_step, dtype=float)
+
+        self.top_led = 0
+        self.fiber_led = 0
+        self.scattering_laser = 0
+
+    def _move_laser(self, axis, speed, direction):
+        """ Called by the simulated board on every step of the mirror. """
+        if self.camera is None or axis not in self.axes:
+            return
+        sign = 1 if direction else -1
+        step = self.pixels_per_step[:, self.axes.index(axis)]
+        self.camera.laser_position = np.array(self.camera.laser_position) + sign * step
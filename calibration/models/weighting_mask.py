@@ -0,0 +1,119 @@
+"""
+Weighting Mask
+==============
+The fiber core detection multiplies the image of the fiber end by a mask that is close to 1 in the middle of the
+image and goes to 0 towards the edges (the *multiply array*). The mask only depends on the shape of the image and on
+the power to which it is raised, therefore it can be stored and re-used when the ROI or binning of the camera change
+back and forth.
+
+The original mask was built as the product of four rotated and flipped copies of a linear ramp, for two ramps. Each
+product depends (up to ~1e-6 for the full Dart frame) only on the row or only on the column, therefore the mask is
+calculated as the outer product of two 1-D profiles, :math:`p(s) = 16 s^2 (1-s)^2`.
+"""
+import os
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+from experimentor.lib.log import get_logger
+
+
+def mask_profile(length: int, other: int) -> np.ndarray:
+    """ 1-D profile of the mask along an axis of the given length. ``other`` is the length of the other axis, it
+    enters because the original ramps were built over the flattened image.
+    """
+    total = length * other
+    s = (np.arange(length) * other + (other - 1) / 2) / (total - 1)
+    return 16 * s**2 * (1 - s)**2
+
+
+def create_weighting_mask(shape, power=2.5, dtype=np.float64) -> np.ndarray:
+    """ Creates the mask for an image of the given shape.
+
+    Parameters
+    ----------
+    shape : tuple
+        (rows, columns) of the image, as returned by ``image.shape``
+    power : float
+        Power to which the mask is raised, higher powers give more weight to the center of the image
+    dtype : np.dtype
+        Type of the returned array
+
+    Returns
+    -------
+    np.ndarray :
+        The mask, with values between 0 and 1
+    """
+    rows, cols = shape
+    row_profile = mask_profile(rows, cols) ** power
+    col_profile = mask_profile(cols, rows) ** power
+    return np.outer(row_profile, col_profile).astype(dtype, copy=False)
+
+
+class WeightingMaskStore:
+    """ Keeps the masks already used in memory (least recently used are discarded first), backed by ``.npy`` files in
+    a folder, which are memory-mapped when loaded. Masks are read-only, do not modify them in place.
+
+    Parameters
+    ----------
+    folder : str, optional
+        Where to store the masks. If ``None``, masks are only kept in memory
+    max_size : int
+        Maximum number of masks kept in memory
+    """
+    def __init__(self, folder=None, max_size=8):
+        self.folder = folder
+        self.max_size = max_size
+        self.logger = get_logger(__name__)
+        self._masks = OrderedDict()
+        self._lock = Lock()
+
+    def filename(self, shape, power, dtype) -> str:
+        rows, cols = shape
+        return os.path.join(self.folder, f'multiply_array_{rows}x{cols}_p{power:g}_{np.dtype(dtype).name}.npy')
+
+    def get(self, shape, power=2.5, dtype=np.float64) -> np.ndarray:
+        """ Returns the mask for the given shape, power and dtype, loading or creating it if necessary. """
+        key = (tuple(shape), float(power), np.dtype(dtype).str)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+
+            mask = self._load_or_create(shape, power, dtype)
+            self._masks[key] = mask
+            if len(self._masks) > self.max_size:
+                self._masks.popitem(last=False)
+        return mask
+
+    def clear(self):
+        """ Forgets the masks kept in memory, files are not removed. """
+        with self._lock:
+            self._masks.clear()
+
+    def _load_or_create(self, shape, power, dtype) -> np.ndarray:
+        if self.folder is None:
+            mask = create_weighting_mask(shape, power, dtype)
+            mask.flags.writeable = False
+            return mask
+
+        filename = self.filename(shape, power, dtype)
+        try:
+            mask = np.load(filename, mmap_mode='r')
+            if mask.shape == tuple(shape) and mask.dtype == np.dtype(dtype):
+                self.logger.debug(f'Loaded multiply array from {filename}')
+                return mask
+            self.logger.warning(f'{filename} does not match {shape}, {np.dtype(dtype)}. Creating it again')
+        except (IOError, ValueError):
+            self.logger.info(f'Creating multiply array for shape {shape} and power {power}')
+
+        mask = create_weighting_mask(shape, power, dtype)
+        os.makedirs(self.folder, exist_ok=True)
+        # Saving to a temporary file first prevents other processes from mapping half-written files
+        temp_filename = f'{filename}.{os.getpid()}.tmp'
+        with open(temp_filename, 'wb') as f:
+            np.save(f, mask)
+        os.replace(temp_filename, filename)
+        return np.load(filename, mmap_mode='r')
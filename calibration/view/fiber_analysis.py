@@ -0,0 +1,99 @@
+"""
+Fiber Analysis
+==============
+Worker that analyses the frames of the fiber camera on its own thread, so that the fiber window keeps refreshing the
+image however long the analysis takes. It takes only the newest frame of the camera, skipping the ones that arrived
+while it was busy, and:
+
+* tracks the laser on every frame while tracking is on, with
+  :meth:`~calibration.models.experiment.CalibrationSetup.calculate_laser_center`
+* finds the fiber core on the next frame after it is requested, for example by clicking on the image
+
+If the camera publishes its frames in a :class:`~common.models.frame_ring.FrameRing`, the newest frame is copied out
+of the shared memory before analysing it, and skipped if it was overwritten while copying. The analysis updates the
+state of the experiment (the core, the laser and its tracker), which could not be undone if the frame turned out to be
+torn afterwards. The experiment guards that state with its ``positions_lock``, since the alignment updates it from
+another thread; the results posted are the ones of this analysis, not read back from the experiment.
+
+Results are posted to the GUI thread with the ``new_results`` signal, at most once per ``interval`` for the laser,
+and always when the core was found.
+"""
+import time
+from threading import Thread
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from experimentor.lib.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class FiberAnalysis(QObject):
+    new_results = pyqtSignal(dict)
+
+    def __init__(self, experiment, interval=0.05):
+        super().__init__()
+        self.experiment = experiment
+        self.interval = interval
+        self.tracking_laser = False
+        self._core_requested = False
+        self._running = False
+        self._thread = None
+        self._last_image = None
+        self._last_sequence = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def find_core(self):
+        """ Finds the fiber core on the next frame. """
+        self._core_requested = True
+
+    def _next_frame(self):
+        """ The newest frame, or None if it was already analysed or it was overwritten while copying it. """
+        ring = self.experiment.camera_fiber.frame_ring
+        if ring is not None:
+            frame = ring.latest()
+            if frame is None or frame.sequence == self._last_sequence:
+                return None
+            self._last_sequence = frame.sequence
+            return ring.copy(frame)
+        image = self.experiment.camera_fiber.temp_image
+        if image is None or image is self._last_image:
+            return None
+        self._last_image = image
+        return image
+
+    def _run(self):
+        last_emit = 0
+        while self._running:
+            image = self._next_frame() if self.tracking_laser or self._core_requested else None
+            if image is None:
+                time.sleep(.001)
+                continue
+            results = {}
+            t0 = time.perf_counter()
+            try:
+                if self._core_requested:
+                    self._core_requested = False
+                    multiply_array = self.experiment.get_multiply_array(image.shape)
+                    results['fiber_center'] = self.experiment.Code1dot7for_implementation(image, multiply_array)
+                if self.tracking_laser:
+                    results['laser_center'], results['centroid'] = self.experiment.calculate_laser_center(image)
+            except Exception:
+                logger.exception('Exception analysing the fiber image')
+                continue
+            results['time'] = time.perf_counter() - t0
+            if 'fiber_center' in results or time.perf_counter() - last_emit >= self.interval:
+                last_emit = time.perf_counter()
+                self.new_results.emit(results)
@@ -4,14 +4,15 @@ import numpy as np
 import pyqtgraph as pg
 
 from PyQt5 import uic, QtGui
-from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QMainWindow, QStatusBar
 
 from calibration.view import BASE_DIR_VIEW
+from calibration.view.fiber_analysis import FiberAnalysis
+from common.view.camera_viewer import CameraViewer
+from common.view.refresh import ViewerRefresh
 from experimentor import Q_
 from experimentor.lib.log import get_logger
 from experimentor.views.base_view import BaseView
-from experimentor.views.camera.camera_viewer_widget import CameraViewerWidget
 
 logger = get_logger(__name__)
 
@@ -25,7 +26,7 @@ class FiberWindow(QMainWindow, BaseView):
 
         self.draw_center = False  # Used to decide whether to calculate and draw the center of the fiber (in real-time)
 
-        self.camera_viewer = CameraViewerWidget(parent=self)
+        self.camera_viewer = CameraViewer(parent=self)
         self.camera_widget.layout().addWidget(self.camera_viewer)
         self.camera_viewer.clicked_on_image.connect(self.mouse_clicked)
 
@@ -37,15 +38,19 @@ class FiberWindow(QMainWindow, BaseView):
         self.connect_to_action(self.button_fiber_led.clicked, self.experiment.toggle_fiber_led)
         self.connect_to_action(self.save_core_button.clicked, self.experiment.save_fiber_core)
         self.connect_to_action(self.save_laser_button.clicked, self.experiment.save_laser_position)
+        self.connect_to_action(self.align_laser_button.clicked, self.experiment.align_laser)
 
         self.button_fiber_led.clicked.connect(self.update_ui)
+        self.laser_track.stateChanged.connect(self.track_laser)
 
         self.apply_button.clicked.connect(self.update_camera)
 
-        self.update_image_timer = QTimer()
-        self.update_image_timer.timeout.connect(self.update_image)
-        self.update_centers_timer = QTimer()
-        self.update_centers_timer.timeout.connect(self.update_centers)
+        self.image_refresh = ViewerRefresh(lambda: self.experiment.get_frame_sequence('camera_fiber'),
+                                           self.update_image, min_interval=50)
+
+        # The laser and the core are found on a separate thread, which posts the results to update_centers
+        self.analysis = FiberAnalysis(self.experiment)
+        self.analysis.new_results.connect(self.update_centers)
 
         # For debugging purposes
         self.status_bar = self.statusBar()
@@ -53,8 +58,8 @@ class FiberWindow(QMainWindow, BaseView):
         self.last_update = time.time()
 
         self.update_ui()
-        self.update_image_timer.start(50)
-        self.update_centers_timer.start(150)
+        self.image_refresh.start()
+        self.analysis.start()
 
         self.updating_times = np.zeros(10)
 
@@ -65,19 +70,22 @@ class FiberWindow(QMainWindow, BaseView):
         self.button_focus_minus.clicked.connect(self.move_focus_minus)
         self.button_focus_plus.clicked.connect(self.move_focus_plus)
 
-    def update_centers(self):
-        if self.laser_track.isChecked():
-            self.experiment.calculate_laser_center()
-
-        if self.experiment.laser_center:
+    def update_centers(self, results):
+        """ Slot for the results of the analysis of the fiber image. """
+        if results.get('laser_center'):
             self.laser_center_position.setText(
-                f"{self.experiment.laser_center[0]:4.2f}, "
-                f"{self.experiment.laser_center[1]:4.2f}")
+                f"{results['laser_center'][0]:4.2f}, "
+                f"{results['laser_center'][1]:4.2f}")
 
-        if self.experiment.fiber_center_position:
+        if 'fiber_center' in results and results['fiber_center'] is not None:
             self.fiber_core_position.setText(
-                f"{self.experiment.fiber_center_position[0]:4.2f}, "
-                f"{self.experiment.fiber_center_position[1]:4.2f}")
+                f"{results['fiber_center'][0]:4.2f}, "
+                f"{results['fiber_center'][1]:4.2f}")
+            # The red X is shown in the figure at the fiber core location
+            self.add_fiber_center_mark()
+
+    def track_laser(self):
+        self.analysis.tracking_laser = self.laser_track.isChecked()
 
     def add_fiber_center_mark(self):
         brush = pg.mkBrush(color=(255, 0, 0))
@@ -110,7 +118,13 @@ class FiberWindow(QMainWindow, BaseView):
         t1 = time.perf_counter() - t0
         self.updating_times = np.roll(self.updating_times, 1)
         self.updating_times[0] = t1
-        self.status_bar.showMessage(f'{np.mean(self.updating_times)*1000}ms')
+        message = f'{np.mean(self.updating_times)*1000}ms, {self.image_refresh}'
+        centroid = self.experiment.centroid_info
+        if centroid is not None:
+            search = f' ({centroid["search"]} search)' if 'search' in centroid else ''
+            message += (f', centroid: {centroid["method"]}{search} in {centroid["time"]*1000:.2f}ms, '
+                        f'quality {centroid["quality"]:.1f}')
+        self.status_bar.showMessage(message)
         self.last_update = time.time()
 
     def mouse_clicked(self, x, y):
@@ -118,13 +132,7 @@ class FiberWindow(QMainWindow, BaseView):
         default signal to get directly the coordinates of the mouse clicked in pixels of the image.
         """
         logger.info('Calculating center of the fiber')
-
-        #m
-        self.experiment.Code1dot7for_implementation(self.experiment.get_latest_image('camera_fiber'), \
-                                                    self.experiment.multiply_array)
-
-        #The red X is shown in the figure at the fiber core location
-        self.add_fiber_center_mark()
+        self.analysis.find_core()
 
     def move_right(self):
         self.experiment.move_piezo(direction=1, axis=self.experiment.config['electronics']['horizontal_axis'])
@@ -146,6 +154,6 @@ class FiberWindow(QMainWindow, BaseView):
 
     def closeEvent(self, a0: QtGui.QCloseEvent) -> None:
         logger.info('Fiber Window Closed')
-        self.update_image_timer.stop()
-        self.update_centers_timer.stop()
+        self.image_refresh.stop()
+        self.analysis.stop()
         super().closeEvent(a0)
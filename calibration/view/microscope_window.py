@@ -3,16 +3,17 @@ import time
 
 import numpy as np
 from PyQt5 import uic, QtGui
-from PyQt5.QtCore import QTimer
-from PyQt5.QtWidgets import QMainWindow, QFileDialog
+from PyQt5.QtWidgets import QMainWindow, QFileDialog, QLabel
 import pyqtgraph as pg
 from dispertech.view.GUI import resources
 
 from calibration.view import BASE_DIR_VIEW
+from common.view.camera_viewer import CameraViewer
+from common.view.refresh import ViewerRefresh
+from common.view.statistics_worker import StatisticsWorker
 from experimentor import Q_
 from experimentor.lib.log import get_logger
 from experimentor.views.base_view import BaseView
-from experimentor.views.camera.camera_viewer_widget import CameraViewerWidget
 
 logger = get_logger(__name__)
 
@@ -25,12 +26,15 @@ class MicroscopeWindow(QMainWindow, BaseView):
         filename = os.path.join(BASE_DIR_VIEW, 'GUI', 'Microscope_Focusing.ui')
         uic.loadUi(filename, self)
 
-        self.camera_viewer = CameraViewerWidget(parent=self)
+        self.camera_viewer = CameraViewer(parent=self)
         self.camera_widget.layout().addWidget(self.camera_viewer)
 
         self.cross_cut_plot_widget = pg.PlotWidget()
         self.cross_cut_widget.layout().addWidget(self.cross_cut_plot_widget)
         self.cross_cut_plot = self.cross_cut_plot_widget.getPlotItem().plot([0, ], [0,])
+        self.cross_cut_axis = None
+        self.statistics_label = QLabel()
+        self.cross_cut_widget.layout().addWidget(self.statistics_label)
 
         self.cartridge_line.editingFinished.connect(self.update_experiment)
         self.motor_speed_line.editingFinished.connect(self.update_experiment)
@@ -61,13 +65,20 @@ class MicroscopeWindow(QMainWindow, BaseView):
 
         self.background_box.stateChanged.connect(self.background_toggle)
 
-        self.update_image_timer = QTimer()
-        self.update_image_timer.timeout.connect(self.update_image)
+        self.image_refresh = ViewerRefresh(lambda: self.experiment.get_frame_sequence('camera_microscope'),
+                                           self.update_image)
 
         self.update_ui()
         self.update_experiment()
 
-        self.update_image_timer.start(30)
+        self.image_refresh.start()
+
+        # The cross cut and the intensity readouts of the image shown are calculated on a separate thread, see
+        # update_statistics
+        self.statistics = StatisticsWorker()
+        self.statistics.new_results.connect(self.update_statistics)
+        self.statistics.start()
+
         # For debugging purposes
         self.status_bar = self.statusBar()
         self.setStatusBar(self.status_bar)
@@ -148,15 +159,16 @@ class MicroscopeWindow(QMainWindow, BaseView):
         t0 = time.perf_counter()
         img = self.experiment.get_latest_image('camera_microscope')
         self.camera_viewer.update_image(img)
+        self.statistics.submit(img)
         t1 = time.perf_counter() - t0
         self.updating_times = np.roll(self.updating_times, 1)
         self.updating_times[0] = t1
-        self.status_bar.showMessage(f'{np.mean(self.updating_times)*1000}ms')
+        message = f'{np.mean(self.updating_times)*1000}ms, {self.image_refresh}'
+        dead_time = self.experiment.microscope_reconfiguration.last_dead_time
+        if dead_time is not None:
+            message += f', last reconfiguration {dead_time * 1000:.0f}ms'
+        self.status_bar.showMessage(message)
         self.last_update = time.time()
-        cross_cut = np.sum(img, 0)
-        y = np.arange(0, len(cross_cut))
-        self.cross_cut_plot.setData(cross_cut, y[::-1])
-
 
         # if self.background_box.isChecked() and self.experiment.background is not None:
         #     t_image = self.experiment.get_latest_image('camera_microscope')
@@ -170,20 +182,26 @@ class MicroscopeWindow(QMainWindow, BaseView):
         #     img = self.experiment.get_latest_image('camera_microscope')
         # self.camera_viewer.update_image(img)
 
+    def update_statistics(self, results):
+        """ Slot for the statistics of the frames of the camera, calculated by the statistics worker. """
+        cross_cut = results['projection']
+        if self.cross_cut_axis is None or len(self.cross_cut_axis) != len(cross_cut):
+            self.cross_cut_axis = np.arange(len(cross_cut))[::-1]
+        self.cross_cut_plot.setData(cross_cut, self.cross_cut_axis)
+        self.statistics_label.setText(
+            f"Min: {results['min']}, max: {results['max']}, mean: {results['mean']:.1f}, "
+            f"saturated: {results['saturated']:.2%} ({results['time']*1000:.1f}ms)")
+
     def background_toggle(self, state):
         self.experiment.remove_background = self.background_box.isChecked()
 
     def update_roi(self):
-        self.update_image_timer.stop()
         roi = self.camera_viewer.get_roi_values()
         y = roi[1]
         self.experiment.set_roi(y[0], y[1])
-        self.update_image_timer.start(30)
 
     def clear_roi(self):
-        self.update_image_timer.stop()
         self.experiment.clear_roi()
-        self.update_image_timer.start(30)
 
     def start_saving(self):
         self.experiment.start_saving_images()
@@ -193,7 +211,8 @@ class MicroscopeWindow(QMainWindow, BaseView):
 
     def closeEvent(self, a0: QtGui.QCloseEvent) -> None:
         logger.info('Microscope Window Closed')
-        self.update_image_timer.stop()
+        self.image_refresh.stop()
+        self.statistics.stop()
         super().closeEvent(a0)
 
 if __name__ == '__main__':
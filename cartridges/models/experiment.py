@@ -1,13 +1,14 @@
+from common.models.cameras import make_camera
 from dispertech.models.electronics.arduino import ArduinoModel
-from experimentor.models.devices.cameras.basler.basler import BaslerCamera
 from experimentor.models.experiments import Experiment
 
 
 class Cartridges(Experiment):
     def __init__(self, filename=None):
         super().__init__(filename)
-        self.dart = BaslerCamera('da')
-        self.ace = BaslerCamera('ac')
+        camera_model = self.config.get('camera_model', 'basler')
+        self.dart = make_camera({'model': camera_model, 'init': 'da'})
+        self.ace = make_camera({'model': camera_model, 'init': 'ac'})
 
         self.servo = ArduinoModel(**self.config['electronics']['servo'])
         self.arduino = ArduinoModel(**self.config['electronics']['arduino'])
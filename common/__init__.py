@@ -0,0 +1,6 @@
+# ##############################################################################
+#  Copyright (c) 2021 Aquiles Carattino, Dispertech B.V.                       #
+#  __init__.py is part of disperscripts                                        #
+#  This file is released under an MIT license.                                 #
+#  See LICENSE.md.MD for more information.                                        #
+# ##############################################################################
@@ -0,0 +1,137 @@
+"""
+Background Models
+=================
+Running estimates of the background of a camera, used to remove it from the frames shown on screen. Every model keeps
+its buffers allocated from the first frame onwards, and updates them in place when a new frame arrives:
+
+* ``mean``: average of the last ``length`` frames, kept as a running sum over a ring buffer of frames.
+* ``ema``: exponential moving average, with smoothing factor ``2 / (length + 1)``.
+* ``median``: median of the last ``length`` frames, calculated with a partial sort. Its cost grows with ``length``,
+  it is noticeably slower than the other two on full frames.
+
+Models are created from the ``background`` section of the config file with :func:`make_background_model`.
+"""
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class BackgroundModel(ABC):
+    """ Base class for the background models. Child classes must implement :meth:`update`, which stores the new
+    frame and leaves the current estimate in :attr:`background`.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the frames
+    dtype : np.dtype
+        Data type of the frames
+    length : int
+        Number of frames taken into account for the background
+    """
+    def __init__(self, shape, dtype=np.uint16, length=10):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.length = int(length)
+        self.background = np.zeros(self.shape, dtype=self.dtype)
+        self._clipped = np.empty(self.shape, dtype=self.dtype)
+
+    @abstractmethod
+    def update(self, frame: np.ndarray) -> None:
+        """ Adds the frame to the background. """
+
+    def subtract(self, frame: np.ndarray) -> np.ndarray:
+        """ Updates the background with the frame and returns the frame minus the background. Pixels darker than the
+        background are set to 0.
+        """
+        self.update(frame)
+        np.minimum(self.background, frame, out=self._clipped)
+        return np.subtract(frame, self._clipped)
+
+
+class RollingMean(BackgroundModel):
+    """ Average of the last frames. Only the frame leaving the ring buffer and the one entering it are touched on
+    every update.
+    """
+    def __init__(self, shape, dtype=np.uint16, length=10):
+        super().__init__(shape, dtype, length)
+        self._frames = np.zeros((self.length, *self.shape), dtype=self.dtype)
+        sum_dtype = np.uint32 if self.dtype.kind == 'u' and self.dtype.itemsize <= 2 else np.float64
+        self._sum = np.zeros(self.shape, dtype=sum_dtype)
+        self._index = 0
+        self._count = 0
+
+    def update(self, frame):
+        slot = self._frames[self._index]
+        if self._count == self.length:
+            np.subtract(self._sum, slot, out=self._sum, casting='unsafe')
+        else:
+            self._count += 1
+        np.add(self._sum, frame, out=self._sum, casting='unsafe')
+        slot[...] = frame
+        self._index = (self._index + 1) % self.length
+        np.floor_divide(self._sum, self._count, out=self.background, casting='unsafe')
+
+
+class ExponentialMovingAverage(BackgroundModel):
+    """ Exponentially weighted average of all the frames, recent frames weigh more. It does not keep past frames in
+    memory.
+    """
+    def __init__(self, shape, dtype=np.uint16, length=10):
+        super().__init__(shape, dtype, length)
+        self.alpha = 2 / (self.length + 1)
+        self._average = np.zeros(self.shape, dtype=np.float32)
+        self._weighted = np.empty(self.shape, dtype=np.float32)
+        self._first = True
+
+    def update(self, frame):
+        if self._first:
+            self._average[...] = frame
+            self._first = False
+        else:
+            self._average *= 1 - self.alpha
+            np.multiply(frame, self.alpha, out=self._weighted, casting='unsafe')
+            self._average += self._weighted
+        np.copyto(self.background, self._average, casting='unsafe')
+
+
+class RollingMedian(BackgroundModel):
+    """ Median of the last frames. The frames are copied into a pre-allocated work buffer and partially sorted in
+    place; for an even number of frames the upper of the two middle values is used.
+    """
+    def __init__(self, shape, dtype=np.uint16, length=10):
+        super().__init__(shape, dtype, length)
+        self._frames = np.zeros((self.length, *self.shape), dtype=self.dtype)
+        self._work = np.empty_like(self._frames)
+        self._index = 0
+        self._count = 0
+
+    def update(self, frame):
+        self._frames[self._index] = frame
+        self._index = (self._index + 1) % self.length
+        self._count = min(self._count + 1, self.length)
+        work = self._work[:self._count]
+        work[...] = self._frames[:self._count]
+        middle = self._count // 2
+        work.partition(middle, axis=0)
+        self.background[...] = work[middle]
+
+
+BACKGROUND_MODELS = {
+    'mean': RollingMean,
+    'ema': ExponentialMovingAverage,
+    'median': RollingMedian,
+}
+
+
+def make_background_model(config: dict, shape, dtype) -> BackgroundModel:
+    """ Creates the background model specified in the config.
+
+    :param dict config: must have the keys ``model`` (one of the keys of ``BACKGROUND_MODELS``) and ``length``
+    :param tuple shape: shape of the frames
+    :param dtype: data type of the frames
+    """
+    model = config.get('model', 'mean')
+    if model not in BACKGROUND_MODELS:
+        raise ValueError(f'Background model {model} unknown, use one of {", ".join(BACKGROUND_MODELS)}')
+    return BACKGROUND_MODELS[model](shape, dtype, length=config.get('length', 10))
@@ -0,0 +1,43 @@
+# ##############################################################################
+#  Copyright (c) 2021 Aquiles Carattino, Dispertech B.V.                       #
+#  __init__.py is part of disperscripts                                        #
+#  This file is released under an MIT license.                                 #
+#  See LICENSE.md.MD for more information.                                        #
+# ##############################################################################
+"""
+Cameras
+=======
+Creates the camera specified in a section of the config file, using the ``model`` key:
+
+* ``basler``: the Basler cameras of the setups, through pypylon
+* ``simulated``: :class:`~common.models.cameras.simulated.SimulatedCamera`, which generates the frames itself
+
+Models are imported only when used, pypylon is not needed to run with simulated cameras.
+
+With ``frame_ring`` set to a number of frames, the camera also publishes its frames in a
+:class:`~common.models.frame_ring.FrameRing` in shared memory, ``camera.frame_ring``. The saver of the microscope
+camera and the analysis of the fiber camera then read the frames from the ring instead of the ZMQ stream; the viewers
+keep showing ``temp_image``. Publishing costs one more copy of every frame in the camera thread, and the saver has only
+``frame_ring - 1`` frames of time to copy each one: the frames overwritten before, for example while the disk is slow,
+are dropped, and reported as such in the log of the movie. The ring is off by default.
+"""
+CAMERA_MODELS = ('basler', 'simulated')
+
+
+def make_camera(config: dict):
+    """ Creates, but does not initialize, the camera specified in the config.
+
+    :param dict config: must have the keys ``model`` (one of ``CAMERA_MODELS``, ``basler`` if missing) and ``init``,
+        the argument to identify the camera. The optional ``config`` is passed as the initial config of the camera,
+        and ``frame_ring`` is the number of frames kept in shared memory, 0 or missing to not use it
+    """
+    model = config.get('model', 'basler')
+    if model == 'basler':
+        from common.models.cameras.basler import BaslerCamera as Camera
+    elif model == 'simulated':
+        from common.models.cameras.simulated import SimulatedCamera as Camera
+    else:
+        raise ValueError(f'Camera model {model} unknown, use one of {", ".join(CAMERA_MODELS)}')
+    camera = Camera(config['init'], initial_config=config.get('config'))
+    camera.frame_ring_slots = config.get('frame_ring', 0)
+    return camera
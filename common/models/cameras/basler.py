@@ -0,0 +1,103 @@
+"""
+Basler Camera
+=============
+The Basler camera of experimentor, publishing its frames also in a
+:class:`~common.models.frame_ring.FrameRing` when ``frame_ring`` is set in the camera section of the config.
+
+Frames published by :meth:`BaslerCamera.continuous_reads` carry the ``frame_id`` given by the camera (the block ID of
+the grab, which skips the frames the camera could not deliver), the ``timestamp`` of the computer when they were
+retrieved and the ``camera_timestamp`` of the camera, in ticks of its clock. The saver uses the IDs to log dropped and
+duplicated frames.
+
+It can also move the ROI while acquiring, see :meth:`BaslerCamera.set_roi_offset`, and stops the continuous reads as
+soon as the reading thread finishes, to keep the reconfigurations of the camera short.
+"""
+import time
+
+from pypylon import genicam, pylon
+
+from common.models.frame_ring import FrameRingCamera
+from experimentor.models.decorators import make_async_thread
+from experimentor.models.devices.cameras.exceptions import WrongCameraState
+from experimentor.models.devices.cameras.basler.basler import BaslerCamera as ExperimentorBaslerCamera
+
+
+class BaslerCamera(FrameRingCamera, ExperimentorBaslerCamera):
+    def _read_frames(self) -> list:
+        """ Frames acquired since the last read, as a list of (frame_id, timestamp, camera timestamp, frame). In the
+        single shot and last frame modes it reads as the experimentor model does. """
+        mode = self.acquisition_mode
+        if mode == self.MODE_SINGLE_SHOT or mode == self.MODE_LAST:
+            return [(-1, time.time(), None, img) for img in super().read_camera()]
+        with self._basler_lock:
+            if not self._driver.IsGrabbing():
+                raise WrongCameraState('You need to trigger the camera before reading')
+            num_buffers = self._driver.NumReadyBuffers.Value
+            if num_buffers > 0.9 * self._driver.OutputQueueSize.Value:
+                self.logger.warning(f'{self} Buffer filled to 90% num buffers: {num_buffers}')
+            frames = []
+            timeout = int(self.exposure.m_as('ms')) + 100
+            for _ in range(num_buffers):
+                grab = self._driver.RetrieveResult(timeout, pylon.TimeoutHandling_ThrowException)
+                if not grab:
+                    continue
+                try:
+                    if grab.GrabSucceeded():
+                        frames.append((grab.BlockID, time.time(), grab.TimeStamp, grab.GetArray().T))
+                    else:
+                        self.logger.warning(f'{self}: Grabbing failed {grab.ErrorDescription}')
+                finally:
+                    grab.Release()
+            if frames:
+                self.temp_image = frames[-1][3]
+            return frames
+
+    def read_camera(self) -> list:
+        return [frame for _, _, _, frame in self._read_frames()]
+
+    @make_async_thread
+    def continuous_reads(self):
+        self.continuous_reads_running = True
+        self.keep_reading = True
+        try:
+            while self.keep_reading:
+                for frame_id, timestamp, camera_timestamp, img in self._read_frames():
+                    self.new_image.emit(img, meta={'frame_id': frame_id, 'timestamp': timestamp,
+                                                   'camera_timestamp': camera_timestamp})
+                time.sleep(.001)
+        finally:
+            self.continuous_reads_running = False
+
+    def set_roi_offset(self, x_pos, y_pos) -> bool:
+        """ Moves the ROI without changing its size, while the camera acquires if its offsets are writable then.
+
+        Returns
+        -------
+        bool :
+            Whether the ROI was moved, if not the acquisition has to be stopped to change it
+        """
+        x_pos = int(x_pos - x_pos % 4)
+        y_pos = int(y_pos - y_pos % 2)
+        if not (genicam.IsWritable(self._driver.OffsetX) and genicam.IsWritable(self._driver.OffsetY)):
+            return False
+        try:
+            self._driver.OffsetX.SetValue(x_pos)
+            self._driver.OffsetY.SetValue(y_pos)
+        except genicam.GenericException as e:
+            self.logger.warning(f'{self} - Could not move the ROI to ({x_pos}, {y_pos}): {e}')
+            return False
+        width, height = self._driver.Width.Value, self._driver.Height.Value
+        self.X = (x_pos, x_pos + width)
+        self.Y = (y_pos, y_pos + height)
+        self.logger.info(f'Moved ROI to (x, y) = ({x_pos}, {y_pos})')
+        return True
+
+    def stop_continuous_reads(self):
+        self.keep_reading = False
+        while self.continuous_reads_running:
+            time.sleep(.001)
+        self.logger.info(f'{self} - Stopped continuous reads')
+
+    def finalize(self):
+        super().finalize()
+        self.close_frame_ring()
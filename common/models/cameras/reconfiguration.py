@@ -0,0 +1,152 @@
+"""
+Camera Reconfiguration
+======================
+Changing the ROI or the binning of a camera requires stopping the acquisition, applying the settings and starting it
+again, and the viewers show nothing meanwhile. :class:`CameraReconfiguration` keeps that dead time short:
+
+* Changes requested within ``delay`` seconds of each other are applied together, with a single restart.
+* A ROI of the same size as the current one, only moved, is applied while the camera acquires if the camera supports
+  it (``set_roi_offset`` returns True).
+* The dead time of every reconfiguration, from stopping the camera until the first new frame arrives, is logged and
+  returned.
+"""
+import time
+from concurrent.futures import Future
+from threading import Lock, RLock, Timer
+
+from experimentor.lib.log import get_logger
+
+
+def _wait(result):
+    """ Some methods of the cameras are Actions, which run in a thread and return a Future. """
+    if isinstance(result, Future):
+        return result.result()
+    return result
+
+
+class CameraReconfiguration:
+    """
+    Parameters
+    ----------
+    camera
+        Camera acquiring with a free run and continuous reads
+    delay : float, optional
+        Seconds to wait for more changes before applying them
+    on_change : callable, optional
+        Called before applying the changes, with the camera stopped unless they are applied live, for example to
+        discard what depends on the frames before them
+    timeout : float, optional
+        Seconds to wait for the first frame after the changes
+    """
+    def __init__(self, camera, delay=0.05, on_change=None, timeout=5):
+        self.camera = camera
+        self.delay = delay
+        self.on_change = on_change
+        self.timeout = timeout
+        self.last_dead_time = None
+        self.logger = get_logger(__name__)
+        self._lock = RLock()
+        self._apply_lock = Lock()
+        self._pending = {}
+        self._applying = {}
+        self._futures = []
+        self._timer = None
+
+    def request(self, **settings) -> Future:
+        """ Changes the settings of the camera, given as keyword arguments with the names of its features, for example
+        ``request(ROI=((0, 1920), (100, 200)), binning_y=1)``. It returns immediately, the changes are applied in a
+        thread.
+
+        Returns
+        -------
+        Future :
+            With the ``settings`` applied, whether they were applied ``live`` and the ``dead_time`` in seconds
+        """
+        future = Future()
+        with self._lock:
+            self._pending.update(settings)
+            self._futures.append(future)
+            if self._timer is None:
+                self._timer = Timer(self.delay, self._apply)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+    def request_roi(self, x=None, y=None) -> Future:
+        """ Changes the ROI in one direction, keeping the other as requested before (if it is not applied yet, or
+        being applied) or as the camera has it.
+
+        Parameters
+        ----------
+        x, y : tuple, optional
+            (offset, size) in pixels, None to keep it
+        """
+        with self._lock:
+            if 'ROI' in self._pending:
+                current_x, current_y = self._pending['ROI']
+            elif 'ROI' in self._applying:
+                current_x, current_y = self._applying['ROI']
+            else:
+                (x_start, x_end), (y_start, y_end) = self.camera.ROI
+                current_x, current_y = (x_start, x_end - x_start + 1), (y_start, y_end - y_start + 1)
+            roi = (current_x if x is None else x, current_y if y is None else y)
+            return self.request(ROI=roi)
+
+    def _apply(self):
+        with self._lock:
+            settings, futures = self._pending, self._futures
+            self._pending, self._futures, self._timer = {}, [], None
+        with self._apply_lock:
+            with self._lock:
+                self._applying = settings
+            try:
+                self._apply_settings(settings, futures)
+            finally:
+                with self._lock:
+                    self._applying = {}
+
+    def _apply_settings(self, settings, futures):
+        t0 = time.perf_counter()
+        sequence = self.camera.frame_sequence
+        try:
+            live = self._is_offset_only(settings) and self._move_roi(settings['ROI'])
+            if not live:
+                self._restart(settings)
+        except Exception as e:
+            self.logger.exception(f'Reconfiguring {self.camera} with {settings}')
+            for future in futures:
+                future.set_exception(e)
+            return
+        while self.camera.frame_sequence == sequence and time.perf_counter() - t0 < self.timeout:
+            time.sleep(.001)
+        dead_time = time.perf_counter() - t0
+        self.last_dead_time = dead_time
+        self.logger.info(f'{self.camera} reconfigured{" live" if live else ""} with {", ".join(settings)}, '
+                         f'dead time {dead_time * 1000:.0f}ms')
+        result = {'settings': settings, 'live': live, 'dead_time': dead_time}
+        for future in futures:
+            future.set_result(result)
+
+    def _is_offset_only(self, settings) -> bool:
+        """ Whether the only change is a ROI of the same size as the current one, that the camera may move live. Sizes
+        are rounded as the cameras do, to multiples of 4 pixels wide and 2 high. """
+        if set(settings) != {'ROI'} or not hasattr(self.camera, 'set_roi_offset'):
+            return False
+        (x_start, x_end), (y_start, y_end) = self.camera.ROI
+        (_, width), (_, height) = settings['ROI']
+        return (width - width % 4, height - height % 2) == (x_end - x_start + 1, y_end - y_start + 1)
+
+    def _move_roi(self, roi) -> bool:
+        if self.on_change is not None:
+            self.on_change()
+        return self.camera.set_roi_offset(roi[0][0], roi[1][0])
+
+    def _restart(self, settings):
+        self.camera.stop_continuous_reads()
+        _wait(self.camera.stop_free_run())
+        if self.on_change is not None:
+            self.on_change()
+        for name, value in settings.items():
+            setattr(self.camera, name, value)
+        _wait(self.camera.start_free_run())
+        self.camera.continuous_reads()
@@ -0,0 +1,485 @@
+"""
+Simulated Camera
+================
+A camera that behaves as the Basler cameras used in the setups, but generates the frames itself. It allows running the
+whole acquire/view/save chain without hardware, for example to measure its throughput. It is selected with
+``model: simulated`` in the camera section of the config file; ``init`` selects the size of the sensor::
+
+    camera_microscope:
+      model: simulated
+      init: a2A1920
+      config:
+        exposure: 5ms
+        ROI: [[1, 1920], [1, 1200]]
+        pixel_format: Mono12
+        scene: particles  # particles or fiber
+        max_fps: 100
+
+Frames are generated at ``frame_rate`` (the inverse of the exposure, but not faster than ``max_fps``) and kept in a
+buffer of ``buffer_size``, as the camera does; frames that do not fit are lost and logged. Frames published by
+:meth:`SimulatedCamera.continuous_reads` carry a ``frame_id`` and a ``timestamp`` in their metadata.
+
+Two scenes are available:
+
+* ``particles``: particles diffusing over a noisy background, as seen by the microscope camera.
+* ``fiber``: the end of a fiber, with a bright core and the laser spot at ``laser_position`` (in sensor pixels).
+
+Noise is drawn once for a few frames and re-used, so that generating a frame is not slower than the rest of the chain.
+"""
+import time
+from threading import Lock
+
+import numpy as np
+
+from common.models.frame_ring import FrameRingCamera
+from experimentor import Q_
+from experimentor.core.signal import Signal
+from experimentor.lib.log import get_logger
+from experimentor.models import Feature
+from experimentor.models.action import Action
+from experimentor.models.decorators import make_async_thread
+from experimentor.models.devices.cameras.base_camera import BaseCamera
+from experimentor.models.devices.cameras.exceptions import CameraException, WrongCameraState
+
+SENSORS = {  # width, height
+    'a2A1920': (1920, 1200),
+    'acA1920': (1920, 1200),
+    'daA1280': (1280, 960),
+    'da': (1280, 960),
+    'ac': (1920, 1200),
+}
+
+PIXEL_FORMATS = {
+    'Mono8': (np.uint8, 255),
+    'Mono12': (np.uint16, 4095),
+    'Mono12p': (np.uint16, 4095),
+}
+
+
+def gaussian_patch(sigma: float, size: int = None, offset=(0, 0)) -> np.ndarray:
+    """ Normalized 2-D gaussian, peak 1, of ``size`` x ``size`` pixels (about 3 sigma on each side by default). The
+    center is moved from the central pixel by ``offset`` (rows, columns), for positions between pixels. """
+    if size is None:
+        size = 2 * int(np.ceil(3 * sigma)) + 1
+    x = np.arange(size) - size // 2
+    rows = np.exp(-(x - offset[0])**2 / (2 * sigma**2))
+    columns = np.exp(-(x - offset[1])**2 / (2 * sigma**2))
+    return np.outer(rows, columns)
+
+
+def add_patch(frame: np.ndarray, patch: np.ndarray, row: float, col: float, max_value: int) -> None:
+    """ Adds the patch centered at (row, col) to the frame, in place, saturating at ``max_value`` and cropping the
+    patch at the edges of the frame. """
+    half_rows, half_cols = patch.shape[0] // 2, patch.shape[1] // 2
+    r0, c0 = int(round(row)) - half_rows, int(round(col)) - half_cols
+    r1, c1 = r0 + patch.shape[0], c0 + patch.shape[1]
+    fr0, fc0 = max(r0, 0), max(c0, 0)
+    fr1, fc1 = min(r1, frame.shape[0]), min(c1, frame.shape[1])
+    if fr0 >= fr1 or fc0 >= fc1:
+        return
+    region = frame[fr0:fr1, fc0:fc1]
+    values = region + patch[fr0 - r0:fr1 - r0, fc0 - c0:fc1 - c0]
+    np.minimum(values, max_value, out=values)
+    region[...] = values
+
+
+def add_patches(frame: np.ndarray, patch: np.ndarray, rows: np.ndarray, columns: np.ndarray, max_value: int) -> None:
+    """ Adds the patch centered at each (row, column), as :func:`add_patch` but all at once. Where patches overlap
+    only one of them is added, which is fine for sparse particles. """
+    offsets = np.arange(patch.shape[0]) - patch.shape[0] // 2
+    r = np.rint(rows).astype(int)[:, None, None] + offsets[None, :, None]
+    c = np.rint(columns).astype(int)[:, None, None] + offsets[None, None, :]
+    r, c = np.broadcast_arrays(r, c)
+    values = np.broadcast_to(patch, r.shape)
+    valid = (r >= 0) & (r < frame.shape[0]) & (c >= 0) & (c < frame.shape[1])
+    r, c, values = r[valid], c[valid], values[valid]
+    frame[r, c] = np.minimum(frame[r, c] + values, max_value)
+
+
+class SimulatedCamera(FrameRingCamera, BaseCamera):
+    _acquisition_mode = BaseCamera.MODE_SINGLE_SHOT
+    new_image = Signal()
+    NOISE_FRAMES = 8
+
+    def __init__(self, camera, initial_config=None):
+        super().__init__(camera, initial_config=initial_config)
+        self.logger = get_logger(__name__)
+        self.friendly_name = f'Simulated {camera}'
+        self.free_run_running = False
+        self.keep_reading = False
+        self.continuous_reads_running = False
+        self.finalized = False
+        self.grabbing = False
+
+        self._ccd_width, self._ccd_height = SENSORS.get(camera, (1920, 1200))
+        self._roi = ((0, self._ccd_width), (0, self._ccd_height))
+        self._binning = [1, 1]
+        self._exposure = Q_('10ms')
+        self._gain = 0.
+        self._pixel_format = 'Mono12'
+        self.current_dtype = np.uint16
+        self._buffer_size = Q_('200MB')
+        self._auto_exposure = 'Off'
+        self._auto_gain = 'Off'
+        self._scene = 'particles'
+        self._max_fps = 100.
+        self._particles = 200
+        self._diffusion = 0.5  # pixels^2 per frame
+        self._laser_position = (self._ccd_width / 2, self._ccd_height / 2)
+
+        self._lock = Lock()
+        self._rng = np.random.default_rng()
+        self._background = None  # Noise frames, depend on the settings
+        self._positions = None  # Of the particles, in sensor pixels
+        self.frame_id = 0
+        self.lost_frames = 0
+        self._start_time = 0
+        self._frames_due = 0
+
+    @Action
+    def initialize(self):
+        self.logger.info(f'Initializing {self}')
+        self._positions = self._rng.uniform((0, 0), (self._ccd_width, self._ccd_height), (self._particles, 2))
+        self.config.fetch_all()
+        if self.initial_config is not None:
+            self.config.update(self.initial_config)
+            self.config.apply_all()
+
+    def _settings_changed(self):
+        """ The noise frames have to be generated again for the new shape or intensity """
+        self._background = None
+
+    @Feature()
+    def exposure(self) -> Q_:
+        return self._exposure
+
+    @exposure.setter
+    def exposure(self, exposure):
+        self._exposure = Q_(exposure)
+        self._settings_changed()
+
+    @Feature()
+    def gain(self):
+        return self._gain
+
+    @gain.setter
+    def gain(self, gain):
+        self._gain = float(gain)
+        self._settings_changed()
+
+    @Feature()
+    def acquisition_mode(self):
+        return self._acquisition_mode
+
+    @acquisition_mode.setter
+    def acquisition_mode(self, mode):
+        self._acquisition_mode = mode
+
+    @Feature()
+    def auto_exposure(self):
+        return self._auto_exposure
+
+    @auto_exposure.setter
+    def auto_exposure(self, mode):
+        self._auto_exposure = {False: 'Off', True: 'Once'}.get(mode, mode)
+
+    @Feature()
+    def auto_gain(self):
+        return self._auto_gain
+
+    @auto_gain.setter
+    def auto_gain(self, mode):
+        self._auto_gain = {False: 'Off', True: 'Once'}.get(mode, mode)
+
+    @Feature()
+    def pixel_format(self):
+        return self._pixel_format
+
+    @pixel_format.setter
+    def pixel_format(self, mode):
+        if mode not in PIXEL_FORMATS:
+            raise CameraException(f'Pixel format must be one of {", ".join(PIXEL_FORMATS)}')
+        self._pixel_format = mode
+        self.current_dtype = PIXEL_FORMATS[mode][0]
+        self._settings_changed()
+
+    @Feature()
+    def buffer_size(self):
+        return self._buffer_size
+
+    @buffer_size.setter
+    def buffer_size(self, value):
+        self._buffer_size = Q_(value)
+
+    @Feature()
+    def binning_x(self):
+        return self._binning[0]
+
+    @binning_x.setter
+    def binning_x(self, value):
+        if value not in range(1, 5):
+            raise CameraException('BinningX must be one of (1, 2, 3, 4) pixels')
+        self._binning[0] = value
+        self._settings_changed()
+
+    @Feature()
+    def binning_y(self):
+        return self._binning[1]
+
+    @binning_y.setter
+    def binning_y(self, value):
+        if value not in range(1, 5):
+            raise CameraException('BinningY must be one of (1, 2, 3, 4) pixels')
+        self.logger.info(f'Setting BinningY to {value}')
+        self._binning[1] = value
+        self._settings_changed()
+
+    @Feature()
+    def binning(self):
+        return tuple(self._binning)
+
+    @binning.setter
+    def binning(self, value):
+        self.binning_x, self.binning_y = value
+
+    @Feature()
+    def width(self):
+        return self._roi[0][1] // self._binning[0]
+
+    @Feature()
+    def height(self):
+        return self._roi[1][1] // self._binning[1]
+
+    @Feature()
+    def ROI(self):
+        (x_pos, width), (y_pos, height) = self._roi
+        return (x_pos, x_pos + width - 1), (y_pos, y_pos + height - 1)
+
+    @ROI.setter
+    def ROI(self, vals):
+        """ Same convention as the Basler model: ((x offset, width), (y offset, height)), widths multiples of 4 and
+        heights multiples of 2. """
+        X, Y = vals
+        width = int(X[1] - X[1] % 4)
+        x_pos = int(X[0] - X[0] % 4)
+        height = int(Y[1] - Y[1] % 2)
+        y_pos = int(Y[0] - Y[0] % 2)
+        width = min(width, self._ccd_width - x_pos)
+        height = min(height, self._ccd_height - y_pos)
+        self.logger.info(f'Updating ROI: (x, y, width, height) = ({x_pos}, {y_pos}, {width}, {height})')
+        self._roi = ((x_pos, width), (y_pos, height))
+        self.X = (x_pos, x_pos + width)
+        self.Y = (y_pos, y_pos + height)
+        self._settings_changed()
+
+    def set_roi_offset(self, x_pos, y_pos) -> bool:
+        """ Moves the ROI without changing its size, as the Basler cameras do while acquiring. """
+        (_, width), (_, height) = self._roi
+        x_pos = min(int(x_pos - x_pos % 4), self._ccd_width - width)
+        y_pos = min(int(y_pos - y_pos % 2), self._ccd_height - height)
+        self._roi = ((x_pos, width), (y_pos, height))
+        self.X = (x_pos, x_pos + width)
+        self.Y = (y_pos, y_pos + height)
+        self._settings_changed()
+        return True
+
+    @Feature()
+    def ccd_width(self):
+        return self._ccd_width
+
+    @Feature()
+    def ccd_height(self):
+        return self._ccd_height
+
+    @Feature()
+    def max_fps(self):
+        return self._max_fps
+
+    @max_fps.setter
+    def max_fps(self, value):
+        self._max_fps = float(value)
+
+    @Feature()
+    def frame_rate(self):
+        return min(self._max_fps, 1 / self._exposure.m_as('s'))
+
+    @Feature()
+    def scene(self):
+        return self._scene
+
+    @scene.setter
+    def scene(self, scene):
+        if scene not in ('particles', 'fiber'):
+            raise CameraException('Scene must be particles or fiber')
+        self._scene = scene
+        self._settings_changed()
+
+    @Feature()
+    def particles(self):
+        return self._particles
+
+    @particles.setter
+    def particles(self, value):
+        self._particles = int(value)
+        self._positions = self._rng.uniform((0, 0), (self._ccd_width, self._ccd_height), (self._particles, 2))
+
+    @Feature()
+    def diffusion(self):
+        return self._diffusion
+
+    @diffusion.setter
+    def diffusion(self, value):
+        self._diffusion = float(value)
+
+    @Feature()
+    def laser_position(self):
+        return self._laser_position
+
+    @laser_position.setter
+    def laser_position(self, value):
+        self._laser_position = tuple(value)
+
+    def __str__(self):
+        return f'Camera {self.friendly_name}'
+
+    @property
+    def _signal(self) -> float:
+        """ Counts per unit of brightness, scaled with exposure (in ms) and gain (in dB) """
+        return self._exposure.m_as('ms') * 10**(self._gain / 20)
+
+    def _shape(self):
+        """ (rows, columns) of the frames, before transposing them as the Basler model does """
+        return self.height, self.width
+
+    def _generate_background(self):
+        rows, cols = self._shape()
+        max_value = PIXEL_FORMATS[self._pixel_format][1]
+        scale = max_value / 4095
+        binning = self._binning[0] * self._binning[1]
+        static = np.full((rows, cols), 100. * scale * binning)
+        if self._scene == 'fiber':
+            (x_pos, _), (y_pos, _) = self._roi
+            y, x = np.indices((rows, cols), dtype=float)
+            x = x * self._binning[0] + x_pos - self._ccd_width / 2
+            y = y * self._binning[1] + y_pos - self._ccd_height / 2
+            r2 = x**2 + y**2
+            cladding = min(self._ccd_width, self._ccd_height) / 3
+            static += 20 * self._signal * scale * binning * (r2 < cladding**2)
+            static += 60 * self._signal * scale * binning * np.exp(-r2 / (2 * (cladding / 8)**2))
+        noise = self._rng.normal(0, 8 * scale * np.sqrt(binning), (self.NOISE_FRAMES, rows, cols))
+        self._background = np.clip(static + noise, 0, max_value).astype(self.current_dtype)
+
+    def _next_frame(self) -> np.ndarray:
+        if self._background is None:
+            self._generate_background()
+        max_value = PIXEL_FORMATS[self._pixel_format][1]
+        scale = max_value / 4095
+        frame = self._background[self.frame_id % self.NOISE_FRAMES].copy()
+        (x_pos, _), (y_pos, _) = self._roi
+        bx, by = self._binning
+
+        if self._scene == 'particles':
+            steps = self._rng.normal(0, np.sqrt(2 * self._diffusion), self._positions.shape)
+            self._positions += steps
+            # Reflective borders, so that the density of particles is constant
+            limits = np.array((self._ccd_width, self._ccd_height))
+            self._positions = np.abs(self._positions)
+            self._positions = limits - np.abs(limits - self._positions)
+            patch = gaussian_patch(1.5) * 200 * self._signal * scale * bx * by
+            rows = (self._positions[:, 1] - y_pos) / by
+            columns = (self._positions[:, 0] - x_pos) / bx
+            add_patches(frame, patch, rows, columns, max_value)
+        else:
+            x, y = self._laser_position
+            row, col = (y - y_pos) / by, (x - x_pos) / bx
+            patch = gaussian_patch(8 / max(bx, by), offset=(row - round(row), col - round(col)))
+            add_patch(frame, patch * 2000 * self._signal * scale * bx * by, row, col, max_value)
+
+        # Basler frames are the transposed of the array given by the driver, therefore in Fortran order
+        return frame.T
+
+    def trigger_camera(self):
+        self.logger.info(f'Triggering {self} with mode: {self.acquisition_mode}')
+        self.grabbing = True
+        self._start_time = time.perf_counter()
+        self._frames_due = 0
+
+    def _read_frames(self) -> list:
+        """ Frames acquired since the last read, as a list of (frame_id, timestamp, frame) """
+        with self._lock:
+            mode = self.acquisition_mode
+            if mode == self.MODE_SINGLE_SHOT or mode == self.MODE_LAST:
+                frames = [(self.frame_id, time.time(), self._next_frame())]
+                self.frame_id += 1
+                if mode == self.MODE_SINGLE_SHOT:
+                    self.grabbing = False
+            else:
+                if not self.grabbing:
+                    raise WrongCameraState('You need to trigger the camera before reading')
+                elapsed = time.perf_counter() - self._start_time
+                num_frames = int(elapsed * self.frame_rate) - self._frames_due
+                self._frames_due += num_frames
+                frame_bytes = self.width * self.height * np.dtype(self.current_dtype).itemsize
+                buffer_frames = max(1, int(self._buffer_size.m_as('byte') / frame_bytes))
+                if num_frames > buffer_frames:
+                    lost = num_frames - buffer_frames
+                    self.logger.warning(f'{self} - Buffer full, {lost} frames lost')
+                    self.lost_frames += lost
+                    self.frame_id += lost
+                    num_frames = buffer_frames
+                frames = []
+                for _ in range(num_frames):
+                    frames.append((self.frame_id, time.time(), self._next_frame()))
+                    self.frame_id += 1
+            if frames:
+                self.temp_image = frames[-1][2]
+            return frames
+
+    def read_camera(self) -> list:
+        return [frame for _, _, frame in self._read_frames()]
+
+    @make_async_thread
+    def continuous_reads(self):
+        self.continuous_reads_running = True
+        self.keep_reading = True
+        try:
+            while self.keep_reading:
+                for frame_id, timestamp, img in self._read_frames():
+                    self.new_image.emit(img, meta={'frame_id': frame_id, 'timestamp': timestamp})
+                time.sleep(.001)
+        finally:
+            self.continuous_reads_running = False
+
+    def stop_continuous_reads(self):
+        self.keep_reading = False
+        while self.continuous_reads_running:
+            time.sleep(.001)
+        self.logger.info(f'{self} - Stopped continuous reads')
+
+    def start_free_run(self):
+        if self.free_run_running:
+            self.logger.info(f'Trying to start again the free acquisition of camera {self}')
+            return
+        self.logger.info(f'Starting a free run acquisition of camera {self}')
+        self.free_run_running = True
+        self.acquisition_mode = self.MODE_CONTINUOUS
+        self.trigger_camera()
+
+    def stop_free_run(self):
+        # Not an Action as in the Basler model: running it in a thread races with start_free_run called right after
+        self.grabbing = False
+        self.free_run_running = False
+
+    def stop_camera(self):
+        self.grabbing = False
+
+    def finalize(self):
+        self.logger.info(f'Finalizing camera {self}')
+        if self.finalized:
+            return
+        self.stop_continuous_reads()
+        self.stop_free_run()
+        self.stop_camera()
+        self.close_frame_ring()
+        super().finalize()
+        self.finalized = True
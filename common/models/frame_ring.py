@@ -0,0 +1,188 @@
+"""
+Frame Ring
+==========
+The latest frames of a camera in shared memory, so that the saver (in its own process), the viewers and the analysis
+can read them without a copy each. The camera publishes every frame in the next of ``slots`` slots, overwriting the
+oldest one, and readers attach to the ring by its name.
+
+Every slot is protected by a sequence lock: before writing, the camera sets the sequence of the slot to an odd number,
+and to ``2 * (sequence + 1)`` once the frame and its metadata are written, where ``sequence`` counts the frames
+published since the ring was created. A reader gets a :class:`Frame` backed by the shared memory with
+:meth:`FrameRing.get` or :meth:`FrameRing.latest`, uses it, and checks with :meth:`FrameRing.valid` that the slot was
+not overwritten meanwhile; if it was, whatever it calculated must be discarded. A reader has ``slots - 1`` frames of
+time before a frame is overwritten.
+
+Slots have the size of the largest frame given when creating the ring (normally the full sensor at 16 bits) and keep
+the shape, data type and order of each frame, so that the ring does not change with the ROI or pixel format.
+
+:class:`FrameRingCamera` adds publishing to a ring to the cameras, when ``frame_ring_slots`` is more than 0, and counts
+the frames they emit, so that viewers know when there is a new one.
+"""
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from experimentor.lib.log import get_logger
+
+logger = get_logger(__name__)
+
+Frame = namedtuple('Frame', ['sequence', 'frame_id', 'timestamp', 'image', 'buffer'])
+
+_MAGIC = 0x46524d52  # FRMR
+_HEADER = 4  # magic, slots, slot_bytes, published
+_SLOT_FIELDS = 8  # sequence, frame_id, ndim, shape (3), dtype, fortran
+_SEQ, _FRAME_ID, _NDIM, _SHAPE, _DTYPE, _FORTRAN = 0, 1, 2, 3, 6, 7
+
+
+class FrameRing:
+    """ Use :meth:`create` in the process that publishes the frames and :meth:`attach` in the readers. """
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self._header = np.ndarray(_HEADER, dtype=np.int64, buffer=shm.buf)
+        if self._header[0] != _MAGIC:
+            raise ValueError(f'Shared memory {shm.name} is not a frame ring')
+        self.slots = int(self._header[1])
+        self.slot_bytes = int(self._header[2])
+        offset = self._header.nbytes
+        self._meta = np.ndarray((self.slots, _SLOT_FIELDS), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self._meta.nbytes
+        self._timestamps = np.ndarray(self.slots, dtype=np.float64, buffer=shm.buf, offset=offset)
+        self._data_offset = offset + self._timestamps.nbytes
+
+    @classmethod
+    def create(cls, slots: int, max_shape, max_dtype=np.uint16) -> 'FrameRing':
+        """ Ring of ``slots`` frames of up to ``max_shape`` pixels of ``max_dtype``. """
+        slot_bytes = int(np.prod(max_shape)) * np.dtype(max_dtype).itemsize
+        size = 8 * (_HEADER + slots * (_SLOT_FIELDS + 1)) + slots * slot_bytes
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        header = np.ndarray(_HEADER, dtype=np.int64, buffer=shm.buf)
+        header[:] = (_MAGIC, slots, slot_bytes, 0)
+        del header
+        ring = cls(shm, owner=True)
+        ring._meta[:] = 0
+        logger.info(f'Created frame ring {ring.name} of {slots} frames, {size / 1024 / 1024:.1f}MB')
+        return ring
+
+    @classmethod
+    def attach(cls, name: str) -> 'FrameRing':
+        """ Readers must run in the process that created the ring or in processes started by it: on Linux and macOS
+        they share the resource tracker, which would otherwise delete the memory when the reader exits. """
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def published(self) -> int:
+        """ Frames published since the ring was created, the sequence of the next frame. """
+        return int(self._header[3])
+
+    def publish(self, frame: np.ndarray, frame_id: int = -1, timestamp: float = None) -> int:
+        """ Copies the frame to the next slot. Only one thread or process can publish to a ring.
+
+        Returns
+        -------
+        int :
+            The sequence of the frame
+        """
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f'Frame of {frame.nbytes} bytes does not fit in slots of {self.slot_bytes} bytes')
+        if frame.ndim > 3:
+            raise ValueError('Only frames of up to 3 dimensions can be published')
+        sequence = self.published
+        slot = sequence % self.slots
+        meta = self._meta[slot]
+        meta[_SEQ] = 2 * sequence + 1  # Readers of this slot know it is being written
+        fortran = frame.flags.f_contiguous and not frame.flags.c_contiguous
+        destination = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf,
+                                 offset=self._data_offset + slot * self.slot_bytes, order='F' if fortran else 'C')
+        np.copyto(destination, frame)
+        meta[_FRAME_ID] = frame_id
+        meta[_NDIM] = frame.ndim
+        meta[_SHAPE:_SHAPE + 3] = (*frame.shape, *(0 for _ in range(3 - frame.ndim)))
+        meta[_DTYPE] = ord(frame.dtype.char)
+        meta[_FORTRAN] = fortran
+        self._timestamps[slot] = time.time() if timestamp is None else timestamp
+        meta[_SEQ] = 2 * sequence + 2
+        self._header[3] = sequence + 1
+        return sequence
+
+    def get(self, sequence: int):
+        """ The frame with the given sequence, backed by the shared memory, or None if it was not published yet or it
+        was already overwritten. Check it with :meth:`valid` after using it. """
+        slot = sequence % self.slots
+        meta = self._meta[slot]
+        if meta[_SEQ] != 2 * sequence + 2:
+            return None
+        ndim = int(meta[_NDIM])
+        shape = tuple(int(n) for n in meta[_SHAPE:_SHAPE + ndim])
+        dtype = np.dtype(chr(meta[_DTYPE]))
+        frame_id = int(meta[_FRAME_ID])
+        timestamp = float(self._timestamps[slot])
+        offset = self._data_offset + slot * self.slot_bytes
+        buffer = self.shm.buf[offset:offset + int(np.prod(shape)) * dtype.itemsize]
+        image = np.ndarray(shape, dtype=dtype, buffer=buffer, order='F' if meta[_FORTRAN] else 'C')
+        if meta[_SEQ] != 2 * sequence + 2:
+            return None  # Overwritten while reading the metadata
+        return Frame(sequence, frame_id, timestamp, image, buffer)
+
+    def latest(self):
+        """ The last frame published, or None if there is none yet. """
+        while True:
+            published = self.published
+            if not published:
+                return None
+            frame = self.get(published - 1)
+            if frame is not None:
+                return frame
+            # The camera went around the whole ring meanwhile, only possible if this thread was paused
+
+    def valid(self, frame: Frame) -> bool:
+        """ Whether the frame was not overwritten since it was returned by :meth:`get`. """
+        return self._meta[frame.sequence % self.slots, _SEQ] == 2 * frame.sequence + 2
+
+    def copy(self, frame: Frame):
+        """ Copy of the image of the frame, or None if it was overwritten before finishing the copy. """
+        image = np.copy(frame.image, order='K')
+        return image if self.valid(frame) else None
+
+    def close(self) -> None:
+        """ Releases the shared memory; the one that created it also deletes it. Frames still in use keep it open. """
+        self._header = self._meta = self._timestamps = None
+        try:
+            self.shm.close()
+        except BufferError:
+            logger.warning(f'Frames of the ring {self.name} are still in use, it will be released with them')
+        if self.owner:
+            self.shm.unlink()
+
+
+class FrameRingCamera:
+    """ Mixin for the cameras: every frame emitted with the ``new_image`` signal is also published in a
+    :class:`FrameRing` of ``frame_ring_slots`` slots, created with the first frame and large enough for the whole
+    sensor. Call :meth:`close_frame_ring` when finalizing the camera.
+
+    ``frame_sequence`` counts the frames emitted, with or without a ring.
+    """
+    frame_ring_slots = 0
+    frame_ring = None
+    frame_sequence = 0
+
+    def emit(self, signal_name, payload, **kwargs):
+        if signal_name == 'new_image' and isinstance(payload, np.ndarray):
+            if self.frame_ring_slots:
+                if self.frame_ring is None:
+                    self.frame_ring = FrameRing.create(self.frame_ring_slots, (self.ccd_width, self.ccd_height))
+                meta = kwargs.get('meta') or {}
+                self.frame_ring.publish(payload, meta.get('frame_id', -1), meta.get('timestamp'))
+            self.frame_sequence += 1
+        super().emit(signal_name, payload, **kwargs)
+
+    def close_frame_ring(self):
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+            self.frame_ring = None
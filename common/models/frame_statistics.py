@@ -0,0 +1,67 @@
+"""
+Frame Statistics
+================
+Intensity statistics of camera frames, for the live readouts of the viewers. They take two passes over the frame,
+numpy can't fuse them: the histogram is counted in one, and the minimum, maximum, mean and the fraction of saturated
+pixels are taken from it instead of going through the frame once for each of them; the other sums the frame along
+its first axis, the profile shown in the cross cut.
+
+Saturated pixels do not have a meaningful intensity, therefore the maximum and the mean are of the pixels below
+saturation, and the saturated ones are only counted.
+
+The profile and the histogram are kept in buffers that are re-used while the shape of the frames does not change;
+the results given are copies, which can be handed to another thread.
+"""
+import numpy as np
+
+
+class FrameStatistics:
+    """
+    Parameters
+    ----------
+    max_value : int, optional
+        Saturation value of the camera, 4095 for Mono12. Frames of 8 bits saturate at 255
+    """
+    def __init__(self, max_value=4095):
+        self.max_value = max_value
+        self._projection = None
+        self._values = None
+
+    def _buffers(self, image):
+        if self._projection is None or self._projection.shape[0] != image.shape[1]:
+            self._projection = np.empty(image.shape[1], dtype=np.float64)
+        saturation = 255 if image.dtype.itemsize == 1 else self.max_value
+        if self._values is None or self._values.shape[0] != saturation + 1:
+            self._values = np.arange(saturation + 1, dtype=np.float64)
+        return saturation
+
+    def calculate(self, image: np.ndarray) -> dict:
+        """ Statistics of a frame of unsigned integers.
+
+        Returns
+        -------
+        dict :
+            ``projection``, the sum of the frame along its first axis, ``histogram``, the count of every value
+            up to saturation (values above it are counted as saturated), ``min``, ``max`` and ``mean`` of the pixels
+            below saturation (saturation if all are saturated), and ``saturated``, the fraction of pixels at
+            saturation or above
+        """
+        saturation = self._buffers(image)
+        np.sum(image, axis=0, out=self._projection)
+        # Fortran-ordered frames, as the Basler ones, are flattened without a copy in memory order
+        histogram = np.bincount(image.ravel(order='K'), minlength=saturation + 1)
+        if histogram.shape[0] > saturation + 1:
+            histogram[saturation] += histogram[saturation + 1:].sum()
+            histogram = histogram[:saturation + 1]
+        pixels = image.size
+        unsaturated = histogram[:saturation]
+        values = np.flatnonzero(unsaturated)
+        counted = pixels - histogram[saturation]
+        return {
+            'projection': self._projection.copy(),
+            'histogram': histogram,
+            'min': int(values[0]) if values.size else saturation,
+            'max': int(values[-1]) if values.size else saturation,
+            'mean': float(unsaturated @ self._values[:saturation]) / counted if counted else float(saturation),
+            'saturated': histogram[saturation] / pixels if pixels else 0.,
+        }
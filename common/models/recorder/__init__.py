@@ -0,0 +1,16 @@
+# ##############################################################################
+#  Copyright (c) 2021 Aquiles Carattino, Dispertech B.V.                       #
+#  __init__.py is part of disperscripts                                        #
+#  This file is released under an MIT license.                                 #
+#  See LICENSE.md.MD for more information.                                        #
+# ##############################################################################
+"""
+Recorder
+========
+Saving of the movies published by a camera, shared by all the experiments. A :class:`MovieSaver` runs in its own
+process, subscribes to the ``new_image`` signal of the camera and writes the frames to an HDF5 file; a
+:class:`MovieReader` reads them back. The options of the saver are taken from the ``saving`` section of the config
+file with :func:`saver_options`.
+"""
+from common.models.recorder.movie_reader import MovieReader
+from common.models.recorder.movie_saver import MovieSaver, saver_options
@@ -0,0 +1,114 @@
+"""
+Compression Codecs
+==================
+Compression used for the movies saved by :class:`~common.models.recorder.movie_saver.MovieSaver`, selected from the
+``saving`` section of the config file::
+
+    saving:
+      codec: blosc-lz4
+      codec_level: 5
+      shuffle: bit
+
+Available codecs:
+
+* ``none``: no compression, the fastest to write but the largest files.
+* ``gzip``: shipped with HDF5, readable everywhere. Level 1 was the only option before codecs were configurable.
+* ``lzf``: shipped with h5py, fast but only readable with h5py.
+* ``blosc-lz4``, ``blosc-zstd``: Blosc with LZ4 or Zstd, much faster than gzip for similar ratios. They require
+  `hdf5plugin <https://github.com/silx-kit/hdf5plugin>`_, also to read the files back (``import hdf5plugin`` before
+  opening them).
+
+The shuffle pre-filter reorders the bytes (``byte``) or the bits (``bit``) of each pixel before compressing. Mono12
+frames are stored in ``uint16``, their upper 4 bits are always 0; shuffling groups those zeros together and the
+compression ratio improves noticeably, at a small cost in speed. ``bit`` is only available with the Blosc codecs.
+"""
+import zlib
+
+import numpy as np
+
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+
+SHUFFLES = ('none', 'byte', 'bit')
+
+
+def _builtin(name):
+    def options(level, shuffle):
+        if shuffle == 'bit':
+            raise ValueError(f'Bit shuffle is not available with {name}, use byte shuffle or a Blosc codec')
+        kwargs = {'compression': name, 'shuffle': shuffle == 'byte'}
+        if name == 'gzip':
+            kwargs['compression_opts'] = 1 if level is None else level
+        return kwargs
+    return options
+
+
+def _no_compression(level, shuffle):
+    if shuffle != 'none':
+        raise ValueError('Shuffling without compression has no effect, set shuffle to none')
+    return {}
+
+
+def _blosc(cname, default_level):
+    def options(level, shuffle):
+        if hdf5plugin is None:
+            raise ValueError(f'Codec blosc-{cname} requires hdf5plugin, install it or use gzip or lzf')
+        shuffles = {
+            'none': hdf5plugin.Blosc.NOSHUFFLE,
+            'byte': hdf5plugin.Blosc.SHUFFLE,
+            'bit': hdf5plugin.Blosc.BITSHUFFLE,
+        }
+        level = default_level if level is None else level
+        return dict(hdf5plugin.Blosc(cname=cname, clevel=level, shuffle=shuffles[shuffle]))
+    return options
+
+
+CODECS = {
+    'none': _no_compression,
+    'gzip': _builtin('gzip'),
+    'lzf': _builtin('lzf'),
+    'blosc-lz4': _blosc('lz4', 5),
+    'blosc-zstd': _blosc('zstd', 3),
+}
+
+
+def compression_options(codec='gzip', level=None, shuffle='none') -> dict:
+    """ Keyword arguments for ``h5py.Group.create_dataset`` to use the given codec.
+
+    :param str codec: one of the keys of ``CODECS``
+    :param int level: compression level, ``None`` uses the default of the codec. Ignored by ``lzf``
+    :param str shuffle: one of ``SHUFFLES``
+    """
+    if codec not in CODECS:
+        raise ValueError(f'Codec {codec} unknown, use one of {", ".join(CODECS)}')
+    if shuffle not in SHUFFLES:
+        raise ValueError(f'Shuffle {shuffle} unknown, use one of {", ".join(SHUFFLES)}')
+    return CODECS[codec](level, shuffle)
+
+
+def byte_shuffle(block: np.ndarray) -> bytes:
+    """ Same transformation as the HDF5 shuffle filter: first byte of every element, then the second byte, etc. """
+    data = np.ascontiguousarray(block).view(np.uint8).reshape(-1, block.dtype.itemsize)
+    return data.T.tobytes()
+
+
+def chunk_compressor(codec='gzip', level=None, shuffle='none'):
+    """ Function that compresses a chunk exactly as the HDF5 filters of the codec would, to write chunks directly with
+    ``h5py.h5d.DatasetID.write_direct_chunk``. Compressing outside of HDF5 allows compressing several chunks in
+    parallel, zlib releases the GIL.
+
+    Returns ``None`` if the codec can only be applied by HDF5 (``lzf`` and the Blosc codecs), in that case chunks must
+    be written through the dataset.
+    """
+    compression_options(codec, level, shuffle)  # Validates the arguments
+    if codec == 'none':
+        return lambda block: np.ascontiguousarray(block).tobytes()
+    if codec == 'gzip':
+        level = 1 if level is None else level
+        if shuffle == 'byte':
+            return lambda block: zlib.compress(byte_shuffle(block), level)
+        return lambda block: zlib.compress(np.ascontiguousarray(block), level)
+    return None
@@ -0,0 +1,95 @@
+"""
+Movie Reader
+============
+Reads the movies saved by :class:`~common.models.recorder.movie_saver.MovieSaver`. Frames are always returned as
+(frames, x, y) regardless of the layout in which they were stored, and only the frames actually acquired are exposed
+(older files in the legacy layout were allocated in blocks, and the end of the dataset is empty)::
+
+    with MovieReader('movie_2001001_0.h5') as movie:
+        print(len(movie), movie.metadata['fps'])
+        frame = movie[10]
+        first_frames = movie[:100]
+
+Newer movies also have, for every frame, the frame ID and timestamp sent by the camera and a hash of the frame (see
+:class:`~common.models.recorder.movie_saver.FrameLog`), available as :attr:`MovieReader.frame_ids`,
+:attr:`MovieReader.timestamps` and :attr:`MovieReader.frame_hashes`. They are ``None`` for older movies.
+"""
+import json
+
+import h5py
+import numpy as np
+
+
+class MovieReader:
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = h5py.File(filename, 'r')
+        self.dataset = self.file['data']['timelapse']
+        self.metadata = json.loads(self.file['data']['metadata'][()].decode())
+        # Files saved before the layout was configurable do not have the attribute
+        self.layout = self.dataset.attrs.get('layout', 'legacy')
+        frame_axis = 0 if self.layout == 'frame_major' else 2
+        self.frames = self.metadata.get('frames', self.dataset.shape[frame_axis])
+
+    @property
+    def frame_shape(self) -> tuple:
+        if self.layout == 'frame_major':
+            return self.dataset.shape[1:]
+        return self.dataset.shape[:2]
+
+    @property
+    def shape(self) -> tuple:
+        return (self.frames, *self.frame_shape)
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    def _frame_log(self, name):
+        if name not in self.file['data']:
+            return None
+        return self.file['data'][name][:self.frames]
+
+    @property
+    def frame_ids(self) -> np.ndarray:
+        """ Frame IDs given by the camera, -1 if the camera did not give them. """
+        return self._frame_log('frame_id')
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """ Timestamps given by the camera, NaN if the camera did not give them. """
+        return self._frame_log('timestamp')
+
+    @property
+    def frame_hashes(self) -> np.ndarray:
+        """ CRC32 of each frame, consecutive frames with the same hash are duplicates. """
+        return self._frame_log('frame_hash')
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, item) -> np.ndarray:
+        """ Supports an integer, for a single frame, or a slice, for a stack of frames. """
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.frames)
+            if self.layout == 'frame_major':
+                return self.dataset[start:stop:step]
+            return np.moveaxis(self.dataset[:, :, start:stop:step], 2, 0)
+
+        index = range(self.frames)[item]  # Raises IndexError and handles negative indices
+        if self.layout == 'frame_major':
+            return self.dataset[index]
+        return self.dataset[:, :, index]
+
+    def __iter__(self):
+        for i in range(self.frames):
+            yield self[i]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,659 @@
+import json
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pipe
+from queue import Empty, Queue
+from threading import Thread
+
+import h5py
+import numpy as np
+import zmq
+
+from common.models.frame_ring import FrameRing
+from common.models.recorder.codecs import chunk_compressor, compression_options
+from experimentor import Q_
+from experimentor.core.meta import ExperimentorProcess
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+SAVER_OPTIONS = ('layout', 'frames_per_chunk', 'codec', 'codec_level', 'shuffle', 'compression_threads', 'queue_size',
+                 'batch_frames')
+
+
+def saver_options(config: dict) -> dict:
+    """ Keyword arguments for :class:`MovieSaver` from the ``saving`` section of a config file. Options not in the
+    config keep the defaults of the saver, therefore older config files still work. """
+    return {key: config[key] for key in SAVER_OPTIONS if key in config}
+
+
+def peak_memory():
+    """ Peak resident memory of the current process, in MB, or ``None`` if it can't be known (on Windows it requires
+    psutil). """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux gives kilobytes, macOS bytes
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+    return None
+
+
+def frame_view(msg, metadata: dict) -> np.ndarray:
+    """ Array backed by the buffer of a message received with ``copy=False``. Nothing is copied, therefore the array is
+    valid only as long as the message is alive and must be copied to wherever it is going to be stored.
+
+    Using byte order F gives the proper shape, but it is camera-dependent. This works fine for Basler, but need to keep
+    an eye for the future.
+
+    .. TODO:: standardize the byte-order for camera frames, are they always Fortran?
+    """
+    img = np.frombuffer(msg.buffer, dtype=metadata['dtype'])
+    return img.reshape(metadata['shape'], order="F")
+
+
+LAYOUTS = ('legacy', 'frame_major')
+
+
+def frame_axis(layout: str) -> int:
+    """ Axis along which frames are stacked. ``legacy`` stacks them along the last axis, (x, y, frames), while
+    ``frame_major`` stacks them along the first, (frames, x, y), so that each frame is contiguous on disk. """
+    return 0 if layout == 'frame_major' else 2
+
+
+def frame_index(layout: str, index) -> tuple:
+    """ Index to select a frame (or a slice of frames) from a stack with the given layout. """
+    if layout == 'frame_major':
+        return (index, )
+    return slice(None), slice(None), index
+
+
+def stack_shape(layout: str, frame_shape, frames: int) -> tuple:
+    """ Shape of a stack of frames with the given layout. """
+    if layout == 'frame_major':
+        return (frames, *frame_shape)
+    return (*frame_shape, frames)
+
+
+def create_timelapse(group, frame_shape, dtype, frames, layout='legacy', frames_per_chunk=1, compression=None):
+    """ Creates the dataset in which the frames are saved.
+
+    Parameters
+    ----------
+    group : h5py.Group
+        Where to create the dataset, it will be called ``timelapse``
+    frame_shape : tuple
+        Shape of a single frame
+    dtype : np.dtype
+        Data type of the frames
+    frames : int
+        Initial number of frames, the dataset can be resized along the frame axis
+    layout : str
+        ``frame_major`` stores frames as (frames, x, y) and with ``frames_per_chunk`` frames in each chunk, therefore
+        writing or reading a frame touches as few chunks as possible. ``legacy`` stores them as (x, y, frames) and lets
+        h5py choose the chunks.
+    frames_per_chunk : int
+        Only used with the ``frame_major`` layout
+    compression : dict, optional
+        Keyword arguments returned by :func:`~common.models.recorder.codecs.compression_options`. ``None`` uses gzip
+        with level 1.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f'Layout {layout} unknown, use one of {", ".join(LAYOUTS)}')
+    shape = stack_shape(layout, frame_shape, frames)
+    maxshape = stack_shape(layout, frame_shape, None)
+    chunks = stack_shape(layout, frame_shape, frames_per_chunk) if layout == 'frame_major' else None
+    if compression is None:
+        compression = compression_options('gzip', 1)
+    dset = group.create_dataset('timelapse', shape, maxshape=maxshape, chunks=chunks, dtype=dtype, **compression)
+    dset.attrs['layout'] = layout
+    return dset
+
+
+class LatencyStats:
+    """ Keeps track of how frames arrive to the saver. If the publisher adds a ``timestamp`` (as given by
+    ``time.time()``) to the metadata of each frame, the latency between publishing and receiving is accumulated too.
+    Frames per wakeup shows how many frames were queued each time the saver woke up; a growing number means the saver
+    is falling behind.
+    """
+    def __init__(self):
+        self.frames = 0
+        self.wakeups = 0
+        self.max_frames_per_wakeup = 0
+        self._frames_this_wakeup = 0
+        self.timed_frames = 0
+        self.total_latency = 0
+        self.max_latency = 0
+
+    def wakeup(self):
+        self.wakeups += 1
+        self._frames_this_wakeup = 0
+
+    def frame(self, metadata: dict):
+        self.frames += 1
+        self._frames_this_wakeup += 1
+        self.max_frames_per_wakeup = max(self.max_frames_per_wakeup, self._frames_this_wakeup)
+        timestamp = metadata.get('timestamp')
+        if timestamp is not None:
+            latency = time.time() - timestamp
+            self.timed_frames += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def summary(self) -> dict:
+        summary = {
+            'frames_per_wakeup': self.frames / self.wakeups if self.wakeups else 0,
+            'max_frames_per_wakeup': self.max_frames_per_wakeup,
+        }
+        if self.timed_frames:
+            summary.update({
+                'latency_mean': self.total_latency / self.timed_frames,
+                'latency_max': self.max_latency,
+            })
+        return summary
+
+    def __str__(self):
+        return ', '.join(f'{key}: {value:.4g}' for key, value in self.summary().items())
+
+
+class FrameLog:
+    """ Records, for every frame saved, the frame ID and timestamp given by the publisher in the metadata (``frame_id``
+    and ``timestamp``, -1 and NaN if not given) and a CRC32 of the frame, in the datasets ``frame_id``,
+    ``timestamp`` and ``frame_hash`` next to the movie. Values are buffered and written every ``chunk`` frames.
+
+    It also flags problems while recording, instead of having to scan the movie afterwards:
+
+    * Gaps: the frame ID jumps by more than 1; the number of frames missing is counted as dropped.
+    * Overwritten frames: when reading from a :class:`~common.models.frame_ring.FrameRing`, the frames overwritten
+      before the saver could copy them, given as ``overwritten`` in the metadata of the next frame saved. They are
+      counted as dropped in a gap of their own, and not again in the jump of the frame ID.
+    * Duplicates: a frame identical to the previous one (same hash), or a frame ID that does not increase.
+
+    Hashing a full frame of the Dart (4.4MB) takes about 2ms.
+    """
+    def __init__(self, group, logger, chunk=1024):
+        self.logger = logger
+        self.chunk = chunk
+        self.datasets = {
+            'frame_id': group.create_dataset('frame_id', (0, ), maxshape=(None, ), chunks=(chunk, ), dtype=np.int64),
+            'timestamp': group.create_dataset('timestamp', (0, ), maxshape=(None, ), chunks=(chunk, ),
+                                              dtype=np.float64),
+            'frame_hash': group.create_dataset('frame_hash', (0, ), maxshape=(None, ), chunks=(chunk, ),
+                                               dtype=np.uint32),
+        }
+        self.buffers = {name: np.zeros(chunk, dtype=dset.dtype) for name, dset in self.datasets.items()}
+        self.frames = 0
+        self._buffered = 0
+        self.dropped_frames = 0
+        self.overwritten_frames = 0
+        self.gaps = 0
+        self.duplicated_frames = 0
+        self._last_id = None
+        self._last_hash = None
+
+    def frame(self, metadata: dict, buffer, frame_hash=None) -> None:
+        """ Records a frame. ``buffer`` is the raw data of the frame, as received, used if the hash is not given. """
+        frame_id = metadata.get('frame_id', -1)
+        timestamp = metadata.get('timestamp', np.nan)
+        overwritten = metadata.get('overwritten', 0)
+        if frame_hash is None:
+            frame_hash = zlib.crc32(buffer)
+
+        if overwritten:
+            self.gaps += 1
+            self.dropped_frames += overwritten
+            self.overwritten_frames += overwritten
+            self.logger.warning(f'{overwritten} frames before frame {frame_id} were overwritten in the ring before '
+                                f'being saved')
+        if frame_id >= 0 and self._last_id is not None:
+            if frame_id > self._last_id + overwritten + 1:
+                self.gaps += 1
+                self.dropped_frames += frame_id - self._last_id - overwritten - 1
+                self.logger.warning(f'Frames {self._last_id + overwritten + 1} to {frame_id - 1} were dropped')
+            elif frame_id <= self._last_id:
+                self.duplicated_frames += 1
+                self.logger.warning(f'Frame ID {frame_id} received after {self._last_id}')
+        if frame_hash == self._last_hash:
+            self.duplicated_frames += 1
+            self.logger.warning(f'Frame {self.frames} is identical to the previous one')
+        self._last_id = frame_id if frame_id >= 0 else None
+        self._last_hash = frame_hash
+
+        self.buffers['frame_id'][self._buffered] = frame_id
+        self.buffers['timestamp'][self._buffered] = timestamp
+        self.buffers['frame_hash'][self._buffered] = frame_hash
+        self._buffered += 1
+        self.frames += 1
+        if self._buffered == self.chunk:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffered:
+            return
+        start = self.frames - self._buffered
+        for name, dset in self.datasets.items():
+            dset.resize(self.frames, axis=0)
+            dset[start:self.frames] = self.buffers[name][:self._buffered]
+        self._buffered = 0
+
+    def summary(self) -> dict:
+        return {
+            'dropped_frames': self.dropped_frames,
+            'overwritten_frames': self.overwritten_frames,
+            'gaps': self.gaps,
+            'duplicated_frames': self.duplicated_frames,
+        }
+
+
+class MovieWriter:
+    """ Writes blocks of frames to the dataset without blocking the receiver of the frames. Blocks submitted are
+    compressed by a pool of threads, several at the same time, and written in order by a single writer thread:
+
+    * With a ``compressor`` (see :func:`~common.models.recorder.codecs.chunk_compressor`), every block is exactly one
+      chunk of a ``frame_major`` dataset and is written with ``write_direct_chunk``, skipping the filters of HDF5.
+    * Without one (``lzf``, Blosc, or the ``legacy`` layout, in which chunks are not aligned with frames), blocks are
+      written through the dataset and HDF5 compresses them in the writer thread.
+
+    Blocks waiting to be written are kept in a bounded queue. When it is full, :meth:`submit` blocks until there is
+    room, and frames accumulate in the ZMQ socket instead of in memory.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        Created with :func:`create_timelapse`
+    frames_per_block : int
+        Frames in each block, must be the frames per chunk of the dataset if a compressor is given
+    compressor : callable, optional
+        Takes a block, returns the bytes of the compressed chunk
+    threads : int, optional
+        Compression threads, the number of cores by default
+    queue_size : int
+        Maximum number of blocks waiting to be compressed or written
+    """
+    def __init__(self, dset, frames_per_block, compressor=None, threads=None, queue_size=16):
+        self.dset = dset
+        self.layout = dset.attrs['layout']
+        self.frame_shape = dset.shape[1:] if self.layout == 'frame_major' else dset.shape[:2]
+        self.frames_per_block = frames_per_block
+        self.compressor = compressor
+        self.queue_size = queue_size
+        self.frames = 0  # Submitted so far
+        self.written_bytes = 0
+        self.write_time = 0
+        self.max_queue_depth = 0
+        self.total_queue_depth = 0
+        self.blocks = 0
+        self.queue_full = 0
+        self._blocks = Queue()  # Blocks already written, ready to be reused
+        self._queue = Queue(maxsize=queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=threads) if compressor is not None else None
+        self._error = None
+        self._thread = Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def new_block(self) -> np.ndarray:
+        """ Array in which to store the next frames, it must be submitted afterwards. """
+        try:
+            return self._blocks.get_nowait()
+        except Empty:
+            return np.zeros(stack_shape(self.layout, self.frame_shape, self.frames_per_block), dtype=self.dset.dtype)
+
+    def submit(self, block: np.ndarray, frames: int) -> None:
+        """ Queues the first ``frames`` frames of the block to be written after the ones already submitted. The block
+        can't be modified afterwards, use :meth:`new_block` to get the next one. """
+        if self._error is not None:
+            raise self._error
+        if frames < self.frames_per_block:
+            # Edge chunks are written whole, the dataset is trimmed when closing
+            block[frame_index(self.layout, slice(frames, None))] = 0
+        future = self._executor.submit(self.compressor, block) if self._executor is not None else None
+
+        depth = self._queue.qsize()
+        self.blocks += 1
+        self.total_queue_depth += depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        if self._queue.full():
+            self.queue_full += 1
+        self._queue.put((self.frames, frames, block, future))
+        self.frames += frames
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue  # Keep draining, so submit does not block forever
+            start, frames, block, future = item
+            t0 = time.perf_counter()
+            try:
+                self._grow(start + self.frames_per_block)
+                if future is not None:
+                    offset = (start, *(0 for _ in self.frame_shape))
+                    self.dset.id.write_direct_chunk(offset, future.result())
+                else:
+                    self.dset[frame_index(self.layout, slice(start, start + frames))] = \
+                        block[frame_index(self.layout, slice(None, frames))]
+                self.written_bytes += frames * block.nbytes // self.frames_per_block
+            except Exception as e:
+                self._error = e
+            # Includes waiting for the block to be compressed, but not waiting for blocks to arrive
+            self.write_time += time.perf_counter() - t0
+            self._blocks.put(block)
+
+    def _grow(self, frames):
+        axis = frame_axis(self.layout)
+        if self.dset.shape[axis] < frames:
+            self.dset.resize(max(frames, 2 * self.dset.shape[axis]), axis=axis)
+
+    def close(self) -> dict:
+        """ Waits until all the blocks are written, trims the dataset to the frames submitted, and returns statistics
+        of the writing. """
+        self._queue.put(None)
+        self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self._error is not None:
+            raise self._error
+        self.dset.resize(self.frames, axis=frame_axis(self.layout))
+        return {
+            'write_speed': self.written_bytes / self.write_time / 1024 / 1024 if self.write_time else 0,  # MB/s
+            'max_queue_depth': self.max_queue_depth,
+            'mean_queue_depth': self.total_queue_depth / self.blocks if self.blocks else 0,
+            'queue_full': self.queue_full,
+            'direct_chunk_write': self.compressor is not None,
+        }
+
+
+class MovieSaver(ExperimentorProcess):
+    """ Saves the frames published by a camera, in its own process. Frames are received from the ``url`` of the
+    ``new_image`` signal, until the stop keyword arrives or the saving event is set; or, if the name of a
+    :class:`~common.models.frame_ring.FrameRing` is given, read from the ring starting at ``first_frame`` (the frames
+    published when the saver is created, if not given) until the saving event is set. Frames overwritten in the ring
+    before being saved are counted as dropped.
+
+    Once the file is closed, the saver sends a summary of the recording to the process that created it, which gets it
+    with :meth:`wait`.
+    """
+    def __init__(self, file, max_memory, frame_rate, saving_event, url, topic='', metadata=None, poll_timeout=100,
+                 layout='legacy', frames_per_chunk=1, codec='gzip', codec_level=None, shuffle='none',
+                 compression_threads=None, queue_size=16, batch_frames=4, frame_ring=None, first_frame=None):
+        super().__init__()
+        self.frame_ring = frame_ring
+        self.first_frame = first_frame
+        self.file = file
+        self.max_memory = max_memory
+        self.saving_event = saving_event
+        self.frame_rate = frame_rate
+        self.topic = topic
+        self.url = url
+        self.stop_keyword = "MovieSaverStop"
+        self.poll_timeout = poll_timeout  # ms
+        if layout not in LAYOUTS:
+            raise ValueError(f'Layout {layout} unknown, use one of {", ".join(LAYOUTS)}')
+        self.layout = layout
+        self.frames_per_chunk = frames_per_chunk
+        # Raises before starting the process if the codec is unknown or not available
+        self.compression = compression_options(codec, codec_level, shuffle)
+        self.codec = codec
+        self.codec_level = codec_level
+        self.shuffle = shuffle
+        self.compression_threads = compression_threads
+        self.queue_size = queue_size
+        self.batch_frames = batch_frames
+        self.latency = None
+        if metadata is None:
+            metadata = {}
+        for key, value in metadata.items():
+            if isinstance(value, Q_):
+                metadata[key] = str(value)
+        self.metadata = metadata
+        self.summary = None
+        self._summary_receiver, self._summary_sender = Pipe(duplex=False)
+        self.start()
+        self._summary_sender.close()  # Only the saver sends, so that the receiver notices if it dies
+
+    def wait(self, timeout=None):
+        """ Waits until the saver closes the file, at most ``timeout`` seconds, or forever if it is None. Call it after
+        sending the stop keyword or setting the saving event.
+
+        Returns
+        -------
+        dict or None :
+            The ``file``, the ``frames`` saved, the ``raw_bytes`` of the frames and the ``stored_bytes`` in the file,
+            the ``duration`` of the recording in seconds, the ``dropped_frames`` and the ``error`` of the saver, if
+            it failed. None if the saver did not finish in time.
+        """
+        if self.summary is not None:
+            return self.summary
+        if not self._summary_receiver.poll(timeout):
+            return None
+        try:
+            self.summary = self._summary_receiver.recv()
+        except EOFError:  # The saver died before sending it
+            self.join()
+            self.summary = {'file': self.file, 'error': f'Saver exited with code {self.exitcode}'}
+        self.join()
+        return self.summary
+
+    def receive(self, socket):
+        """ Yields the metadata and the message of every frame published, until the stop keyword arrives or the saving
+        event is set. It blocks on the socket instead of polling it, and every time it wakes up it drains all the
+        frames already queued.
+        """
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        while not self.saving_event.is_set():
+            # The timeout only sets how often the saving event is checked
+            if not poller.poll(self.poll_timeout):
+                continue
+            self.latency.wakeup()
+            while True:
+                try:
+                    topic = socket.recv_string(flags=zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                metadata = socket.recv_json(flags=0)
+                msg = socket.recv(flags=0, copy=False, track=False)
+                if not metadata.get('numpy', False):
+                    self.logger.info('Got stop keyword')
+                    return
+                self.latency.frame(metadata)
+                yield metadata, msg
+
+    def receive_ring(self, ring: FrameRing):
+        """ Yields the metadata and the :class:`~common.models.frame_ring.Frame` of every frame published in the
+        ring, until the saving event is set and the frames published until then are read. Frames are backed by the
+        ring, whoever uses them must check afterwards that they were not overwritten.
+
+        Frames overwritten before they could be read are skipped, and their number is given as ``overwritten`` in the
+        metadata of the next frame, so that :class:`FrameLog` reports them.
+        """
+        sequence = ring.published if self.first_frame is None else self.first_frame
+        overwritten = 0
+        while True:
+            stopping = self.saving_event.is_set()
+            published = ring.published
+            if sequence == published:
+                if stopping:
+                    return
+                time.sleep(.001)
+                continue
+            self.latency.wakeup()
+            # Frames already overwritten are skipped
+            oldest = published - ring.slots + 1
+            if sequence < oldest:
+                overwritten += oldest - sequence
+                sequence = oldest
+            for sequence in range(sequence, published):
+                frame = ring.get(sequence)
+                if frame is None:
+                    overwritten += 1
+                    continue
+                metadata = {
+                    'frame_id': frame.frame_id if frame.frame_id >= 0 else frame.sequence,
+                    'timestamp': frame.timestamp,
+                    'overwritten': overwritten,
+                }
+                overwritten = 0
+                self.latency.frame(metadata)
+                yield metadata, frame
+            sequence = published
+
+    def create_writer(self, dset, frame_bytes) -> MovieWriter:
+        """ Frames are compressed in parallel and written chunk by chunk when the codec can be applied outside of HDF5
+        and chunks are aligned with frames. Otherwise, blocks of about ``batch_frames`` frames (rounded up to whole
+        chunks) are written through the dataset, double-buffered: one block is filled while the previous one is
+        written.
+
+        Blocks are re-used, the queue is shortened if needed so that they never take more than ``max_memory``.
+        """
+        compressor = chunk_compressor(self.codec, self.codec_level, self.shuffle)
+        if self.layout == 'frame_major' and compressor is not None:
+            frames_per_block = self.frames_per_chunk
+            queue_size = self.queue_size
+        else:
+            compressor = None
+            chunk_frames = dset.chunks[frame_axis(self.layout)]
+            frames_per_block = -(-self.batch_frames // chunk_frames) * chunk_frames
+            queue_size = 1
+        # One block is being filled and one is being written besides the ones in the queue
+        max_blocks = int(self.max_memory * 1024 * 1024 // (frames_per_block * frame_bytes))
+        queue_size = max(1, min(queue_size, max_blocks - 2))
+        return MovieWriter(dset, frames_per_block, compressor, self.compression_threads, queue_size)
+
+    def run(self) -> None:
+        self.logger.info('Starting logger')
+        self.latency = LatencyStats()
+        ring = None
+        if self.frame_ring is not None:
+            ring = FrameRing.attach(self.frame_ring)
+            frames = self.receive_ring(ring)
+        else:
+            context = zmq.Context()
+            socket = context.socket(zmq.SUB)
+            socket.connect(self.url)
+            socket.setsockopt(zmq.SUBSCRIBE, self.topic.encode('utf-8'))
+            frames = self.receive(socket)
+        summary = {'file': self.file, 'error': None}
+        try:
+            summary.update(self.save(frames, ring))
+        except Exception as e:
+            summary['error'] = repr(e)
+            raise
+        finally:
+            if ring is not None:
+                frames.close()  # Releases the last frame, so that the memory can be closed
+                ring.close()
+            self._summary_sender.send(summary)
+
+    def save(self, frames, ring=None) -> dict:
+        """ Writes the frames yielded by :meth:`receive` or :meth:`receive_ring`, and returns the summary sent to
+        :meth:`wait`. """
+        cpu_start = time.process_time()
+
+        with h5py.File(self.file, "a") as f:
+            g = f.create_group('data')
+            i = 0
+            writer = None
+            overwritten = 0  # Frames overwritten in the ring while copying them, reported with the next one
+            for metadata, msg in frames:
+                img = msg.image if ring is not None else frame_view(msg, metadata)
+
+                if writer is None:  # First time it runs, creates the dataset
+                    # The dataset grows as needed, the initial size only limits the chunks h5py chooses for legacy
+                    dset = create_timelapse(g, img.shape, img.dtype, max(self.batch_frames, self.frames_per_chunk),
+                                            self.layout, self.frames_per_chunk, self.compression)
+                    writer = self.create_writer(dset, img.nbytes)
+                    self.logger.info(f'Writing blocks of {writer.frames_per_block} frames, '
+                                     f'up to {writer.queue_size} blocks queued')
+                    frame_log = FrameLog(g, self.logger)
+                    block = writer.new_block()
+                    meta = {
+                        'fps': self.frame_rate,
+                        'start': time.time(),
+                        'frames_per_block': writer.frames_per_block,
+                        'layout': self.layout,
+                        'codec': self.codec,
+                        'codec_level': self.codec_level,
+                        'shuffle': self.shuffle,
+                    }
+                    meta.update(self.metadata)
+                    mdset = g.create_dataset('metadata', data=json.dumps(meta).encode("utf-8", "ignore"))
+
+                frame_hash = zlib.crc32(msg.buffer)
+                # The only copy of the frame, including the transpose from Fortran order
+                block[frame_index(self.layout, i)] = img
+                if ring is not None:
+                    if not ring.valid(msg):
+                        # Overwritten while copying, the next frame takes its place in the block
+                        overwritten += metadata['overwritten'] + 1
+                        continue
+                    metadata['overwritten'] += overwritten
+                    overwritten = 0
+                frame_log.frame(metadata, msg.buffer, frame_hash)
+                i += 1
+
+                if i == writer.frames_per_block:
+                    writer.submit(block, i)
+                    block = writer.new_block()
+                    i = 0
+
+            if writer is None:
+                self.logger.warning('Saver finished without receiving any frame')
+                meta = {'fps': self.frame_rate, 'end': time.time(), 'frames': 0}
+                meta.update(self.metadata)
+                g.create_dataset('metadata', data=json.dumps(meta).encode("utf-8", "ignore"))
+                return {'frames': 0, 'raw_bytes': 0, 'stored_bytes': 0, 'duration': 0, 'dropped_frames': 0}
+
+            if i != 0:
+                self.logger.info(f'Saving last {i} frames')
+                writer.submit(block, i)
+            stats = writer.close()
+            frame_log.flush()
+            f.flush()
+
+            raw_bytes = writer.frames * img.nbytes
+            stored_bytes = dset.id.get_storage_size()
+
+            meta.update({
+                'end': time.time(),
+                'frames': writer.frames,
+                'compression_ratio': raw_bytes / stored_bytes if stored_bytes else 0,
+            })
+            meta.update(stats)
+            meta.update(frame_log.summary())
+            meta.update(self.latency.summary())
+            meta.update({
+                'cpu_time': time.process_time() - cpu_start,  # All the threads of the saver, in seconds
+                'peak_memory': peak_memory(),
+            })
+            metadata = json.dumps(meta)
+            mdset[()] = metadata.encode("utf-8", "ignore")
+            self.logger.info(f'Saver finished, total acquired frames: {writer.frames}')
+            self.logger.info(f'Receive latency: {self.latency}')
+            if frame_log.dropped_frames or frame_log.duplicated_frames:
+                self.logger.warning(f'{frame_log.dropped_frames} frames dropped in {frame_log.gaps} gaps, '
+                                    f'{frame_log.duplicated_frames} duplicated frames')
+            self.logger.info(f'Wrote {meta["write_speed"]:.1f}MB/s with {self.codec}, '
+                             f'compression ratio {meta["compression_ratio"]:.2f}, '
+                             f'queue depth {meta["mean_queue_depth"]:.1f} (max {meta["max_queue_depth"]})')
+
+        # Only once the file is closed
+        return {
+            'frames': writer.frames,
+            'raw_bytes': raw_bytes,
+            'stored_bytes': stored_bytes,
+            'duration': meta['end'] - meta['start'],
+            'dropped_frames': meta['dropped_frames'],
+        }
@@ -0,0 +1,103 @@
+"""
+Camera Viewer
+=============
+The camera viewer of experimentor, showing the frames through a :class:`~common.view.display.DisplayPipeline`: they
+are downsampled to the pixels of the screen at the current zoom and converted to 8 bits before reaching pyqtgraph.
+Images are scaled back when drawn, therefore the coordinates of ROI lines and marks are still in pixels of the camera;
+clicks and the cross hair are mapped through the view instead of the image for the same reason. The histogram is
+refreshed every ``histogram_interval`` seconds instead of with every frame.
+
+Levels are kept by the pipeline, in the values of the camera. With auto levels they follow every frame; otherwise the
+right-click auto range sets them from the last frame, and moving the levels of the histogram narrows them.
+"""
+import time
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication
+
+from common.view.display import DisplayPipeline
+from experimentor.views.camera.camera_viewer_widget import CameraViewerWidget
+
+
+class CameraViewer(CameraViewerWidget):
+    def __init__(self, parent=None, max_value=4095, binning=False, histogram_interval=.5):
+        super().__init__(parent=parent)
+        self.display = DisplayPipeline(max_value, binning)
+        self.histogram_interval = histogram_interval
+        self._converted = False  # Whether the image shown was converted to 8 bits
+        self._last_histogram = 0
+        self.histogram = self.imv.getHistogramWidget().item
+        self.img.sigImageChanged.disconnect(self.histogram.imageChanged)
+        self.histogram.sigLevelChangeFinished.connect(self._levels_changed)
+
+    def display_factor(self) -> int:
+        """ Pixels of the camera per pixel of the screen, at least 1. """
+        width, height = self.view.viewPixelSize()
+        return max(1, int(min(width, height)))
+
+    def update_image(self, image, auto_range=False, auto_histogram_range=False):
+        if image is None:
+            self.logger.debug(f'No new image to update')
+            return
+        auto_levels = self.auto_levels_action.isChecked()
+        factor = self.display_factor()
+        display = self.display.prepare(image, factor, auto_levels)
+        self._converted = image.dtype.kind == 'u'
+        self.imv.setImage(display, autoLevels=False, levels=(0, 255) if self._converted else None,
+                          autoRange=auto_range, autoHistogramRange=auto_histogram_range, scale=(factor, factor))
+        if self.first_image and not self._converted:
+            self.imv.setLevels(*self.display.levels)
+        if time.monotonic() - self._last_histogram > self.histogram_interval:
+            self.histogram.imageChanged()
+            self._last_histogram = time.monotonic()
+        self.first_image = False
+        self.last_image = image
+
+    def camera_pixel(self, scene_pos):
+        """ Position in pixels of the camera of a point of the scene. The image shown may be downsampled, but it is
+        scaled to the coordinates of the view, which are the ones of the camera. """
+        return self.view.mapSceneToView(scene_pos)
+
+    def mouse_clicked(self, evnt):
+        if evnt.modifiers() == Qt.ControlModifier:
+            pos = self.camera_pixel(evnt.scenePos())
+            self.clicked_on_image.emit(pos.x(), pos.y())
+
+    def mouseMoved(self, arg):
+        """ Updates the cross hair while pressing Ctrl, or the cross cut while pressing Alt. """
+        modifiers = QApplication.keyboardModifiers()
+        pos = self.camera_pixel(arg)
+        if modifiers == Qt.ControlModifier:
+            if self.cross_hair_setup:
+                if not self.show_cross_hair:
+                    for c in self.crosshair:
+                        self.view.addItem(c)
+                    self.show_cross_hair = True
+                self.crosshair[1].setValue(int(pos.x()))
+                self.crosshair[0].setValue(int(pos.y()))
+        elif modifiers == Qt.AltModifier:
+            if self.cross_cut_setup:
+                if not self.show_cross_cut:
+                    self.view.addItem(self.crossCut)
+                self.show_cross_cut = True
+                self.crossCut.setValue(int(pos.y()))
+
+    def do_auto_range(self):
+        """ Sets the levels to the minimum and maximum of the last frame. """
+        if self.last_image is None:
+            return
+        self.display.auto_levels(self.last_image)
+        if not self._converted:
+            self.imv.setLevels(*self.display.levels)
+
+    def _levels_changed(self):
+        """ Levels moved on the histogram of an 8-bit image are relative to the levels of the pipeline. """
+        if not self._converted:
+            return
+        low, high = self.histogram.getLevels()
+        if (low, high) == (0, 255) or self.display.levels is None:
+            return
+        start, end = self.display.levels
+        span = (end - start) / 255
+        self.display.levels = (start + low * span, start + high * span)
+        self.imv.setLevels(0, 255)
@@ -0,0 +1,81 @@
+"""
+Display
+=======
+Prepares camera frames to be shown on screen. Frames are reduced to about the number of pixels the viewer has on the
+screen, by keeping one pixel every ``factor`` (or averaging blocks of ``factor`` x ``factor`` pixels), and converted
+to 8 bits with a lookup table built for the levels of the display. The result is ready to be drawn by pyqtgraph with
+levels (0, 255), which then does not need to scale anything.
+
+The lookup table has an entry for every value the camera gives (4096 for Mono12) and is rebuilt only when the levels
+change, therefore converting a frame costs one table lookup per displayed pixel.
+"""
+import numpy as np
+
+
+def make_lut(low: float, high: float, size: int = 4096) -> np.ndarray:
+    """ Table to convert values between 0 and ``size - 1`` to 8 bits: ``low`` and below give 0, ``high`` and above give
+    255, linearly in between. """
+    values = np.arange(size, dtype=np.float32)
+    scale = 255 / max(high - low, 1)
+    return np.clip((values - low) * scale, 0, 255).astype(np.uint8)
+
+
+def downsample(image: np.ndarray, factor: int, binning: bool = False) -> np.ndarray:
+    """ One pixel every ``factor`` in both directions, a view of the image, or the average of each block of ``factor``
+    x ``factor`` pixels if ``binning`` is True. """
+    if factor <= 1:
+        return image
+    if not binning:
+        return image[::factor, ::factor]
+    if image.strides[0] < image.strides[1]:
+        return downsample(image.T, factor, binning).T  # Fortran order, adding rows in memory order is faster
+    width, height = image.shape[0] // factor * factor, image.shape[1] // factor * factor
+    binned = np.zeros((width // factor, height // factor), dtype=np.uint32 if image.dtype.kind == 'u' else np.float64)
+    for i in range(factor):
+        for j in range(factor):
+            binned += image[i:width:factor, j:height:factor]
+    return (binned / factor**2).astype(image.dtype)
+
+
+class DisplayPipeline:
+    """ Downsamples the frames and converts them to 8 bits for the display.
+
+    Parameters
+    ----------
+    max_value : int, optional
+        Largest value of the frames with more than 8 bits, 4095 for Mono12
+    binning : bool, optional
+        Average blocks of pixels instead of keeping one every ``factor``. Shows faint features better, but it is slower
+    """
+    def __init__(self, max_value=4095, binning=False):
+        self.max_value = max_value
+        self.binning = binning
+        self.levels = None  # (low, high), in the values of the camera
+        self._lut = None
+        self._lut_key = None
+
+    def auto_levels(self, image: np.ndarray) -> None:
+        """ Sets the levels to the minimum and maximum of the image. """
+        self.levels = (float(image.min()), float(image.max()))
+
+    def lut(self, dtype) -> np.ndarray:
+        size = 256 if np.dtype(dtype).itemsize == 1 else self.max_value + 1
+        key = (size, self.levels)
+        if key != self._lut_key:
+            self._lut = make_lut(*self.levels, size)
+            self._lut_key = key
+        return self._lut
+
+    def prepare(self, image: np.ndarray, factor: int = 1, auto_levels: bool = False) -> np.ndarray:
+        """ The image downsampled by ``factor`` and, if it is of unsigned integers, converted to 8 bits with the
+        levels, which are taken from this image if ``auto_levels`` is True or if they were never set. """
+        image = downsample(image, factor, self.binning)
+        if auto_levels or self.levels is None:
+            self.auto_levels(image)
+        if image.dtype.kind != 'u':
+            return image  # Floats, for example after processing, pyqtgraph scales them with the levels
+        lut = self.lut(image.dtype)
+        if image.strides[0] < image.strides[1]:
+            # Fortran order, as the frames of the Basler cameras, it is faster to go through the memory in order
+            return np.take(lut, image.T, mode='clip').T
+        return np.take(lut, image, mode='clip')
@@ -0,0 +1,70 @@
+"""
+Viewer Refresh
+==============
+Redraws a viewer only when the camera has delivered a new frame. A timer checks the frame sequence of the camera (see
+:class:`~common.models.frame_ring.FrameRingCamera`) and calls the update of the window only when it changed.
+
+The timer adapts to the camera: it ticks at half the frame period measured, so that a frame waits at most half a
+period to be shown, but not faster than ``min_interval`` nor slower than ``max_interval``, so that a camera that
+speeds up is noticed soon. The frame rates of the display and of the camera are measured every second.
+"""
+import time
+
+from PyQt5.QtCore import QTimer
+
+
+class ViewerRefresh:
+    """
+    Parameters
+    ----------
+    sequence : callable
+        Returns the frame sequence of the camera, which changes with every new frame
+    update : callable
+        Redraws the viewer
+    min_interval, max_interval : int, optional
+        Limits of the interval of the timer, in milliseconds
+    """
+    def __init__(self, sequence, update, min_interval=30, max_interval=200):
+        self.sequence = sequence
+        self.update = update
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.display_fps = 0.
+        self.camera_fps = 0.
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.refresh)
+        self._last_sequence = None
+        self._window_start = None
+        self._window_sequence = None
+        self._window_frames = 0
+
+    def start(self):
+        self._last_sequence = None
+        self._window_start = None
+        self.timer.start(self.min_interval)
+
+    def stop(self):
+        self.timer.stop()
+
+    def refresh(self):
+        now = time.monotonic()
+        sequence = self.sequence()
+        if self._window_start is None:
+            self._window_start, self._window_sequence, self._window_frames = now, sequence, 0
+        if sequence != self._last_sequence:
+            self._last_sequence = sequence
+            self.update()
+            self._window_frames += 1
+
+        elapsed = now - self._window_start
+        if elapsed >= 1:
+            self.display_fps = self._window_frames / elapsed
+            self.camera_fps = max(sequence - self._window_sequence, 0) / elapsed
+            self._window_start, self._window_sequence, self._window_frames = now, sequence, 0
+            interval = 500 / self.camera_fps if self.camera_fps else self.max_interval
+            interval = int(min(max(interval, self.min_interval), self.max_interval))
+            if interval != self.timer.interval():
+                self.timer.setInterval(interval)
+
+    def __str__(self):
+        return f'display {self.display_fps:.1f}fps, camera {self.camera_fps:.1f}fps'
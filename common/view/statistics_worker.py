@@ -0,0 +1,72 @@
+"""
+Statistics Worker
+=================
+Calculates the :class:`~common.models.frame_statistics.FrameStatistics` of the frames shown by a viewer on its own
+thread, and posts them to the GUI thread with the ``new_results`` signal. The viewer gives every frame it shows to
+:meth:`StatisticsWorker.submit`, after the background is removed if it is, and the worker takes the newest one, not
+more often than every ``interval`` seconds; frames submitted meanwhile are skipped.
+"""
+import time
+from threading import Event, Lock, Thread
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from common.models.frame_statistics import FrameStatistics
+from experimentor.lib.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class StatisticsWorker(QObject):
+    new_results = pyqtSignal(dict)
+
+    def __init__(self, interval=0.1, max_value=4095):
+        super().__init__()
+        self.interval = interval
+        self.statistics = FrameStatistics(max_value)
+        self._image = None
+        self._lock = Lock()
+        self._new_image = Event()
+        self._running = False
+        self._thread = None
+
+    def submit(self, image):
+        """ Frame to calculate the statistics of, replacing the one submitted before if it was not used yet. Frames
+        must not be modified after submitting them. """
+        if image is None:
+            return
+        with self._lock:
+            self._image = image
+        self._new_image.set()
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._new_image.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while self._running:
+            self._new_image.wait()
+            self._new_image.clear()
+            with self._lock:
+                image, self._image = self._image, None
+            if image is None:
+                continue
+            t0 = time.perf_counter()
+            try:
+                results = self.statistics.calculate(image)
+            except Exception:
+                logger.exception('Exception calculating the statistics of the frame')
+                continue
+            results['time'] = time.perf_counter() - t0
+            self.new_results.emit(results)
+            time.sleep(max(self.interval - results['time'], 0))